@@ -19,6 +19,10 @@
 __all__ = []
 __author__ = "Peter Williams <pwil3058@gmail.com>"
 
-import gi
-gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk
+try:
+    import gi
+except ImportError:
+    # the colour and paint model (rgbh, pchar, vpaint, psample) doesn't need GI
+    pass
+else:
+    gi.require_version("Gtk", "3.0")
@@ -20,10 +20,12 @@ import collections
 import math
 import fractions
 import sys
+import threading
 import cairo
 
 from gi.repository import Gtk
 from gi.repository import Gdk
+from gi.repository import GLib
 from gi.repository import GObject
 
 from ..bab import mathx
@@ -39,7 +41,10 @@ from ..gtx import tlview
 from ..gtx import recollect
 
 from . import vpaint
-from . import pchar
+from . import gpchar
+from . import grgbh
+from . import psample
+from . import ptiming
 from . import rgbh
 
 options.define("colour_wheel", "red_to_yellow_clockwise", options.Defn(bool, False, _("Direction around colour wheel from red to yellow.")))
@@ -48,6 +53,110 @@ if __name__ == "__main__":
     _ = lambda x: x
     import doctest
 
+class CoalescedUpdate(object):
+    """
+    Run a costly update with only the most recent of the arguments that
+    it has been scheduled with. The update is run when the main loop is
+    next idle (ahead of redrawing) but never more than max_delay
+    milliseconds after the first of the requests that it coalesces.
+    """
+    def __init__(self, update_func, max_delay=50):
+        self.__update_func = update_func
+        self.__max_delay = max_delay
+        self.__args = None
+        self.__idle_id = None
+        self.__timeout_id = None
+    @property
+    def is_pending(self):
+        return self.__idle_id is not None
+    def schedule(self, *args):
+        self.__args = args
+        if self.__idle_id is None:
+            self.__idle_id = GLib.idle_add(self._run_cb, priority=GLib.PRIORITY_HIGH_IDLE)
+            self.__timeout_id = GLib.timeout_add(self.__max_delay, self._run_cb)
+    def flush(self):
+        """
+        Run any pending update now
+        """
+        if self.__idle_id is not None:
+            self._run_cb()
+    def cancel(self):
+        if self.__idle_id is not None:
+            GLib.source_remove(self.__idle_id)
+            GLib.source_remove(self.__timeout_id)
+            self.__idle_id = self.__timeout_id = None
+        self.__args = None
+    def _run_cb(self):
+        args = self.__args
+        self.cancel()
+        self.__update_func(*args)
+        return False
+
+class BackgroundJob(object):
+    """
+    Run func(*args, progress=...) on a worker thread and pass its result
+    to done_cb in the main loop. The progress argument reports the
+    fraction of the work done to progress_cb (in the main loop) and
+    aborts the work if the job has been cancelled in the meantime.
+    If func raises an exception it is passed to error_cb (in the main
+    loop) or, if there is no error_cb, raised in the main loop.
+    """
+    class Cancelled(Exception):
+        pass
+    def __init__(self, func, args, done_cb, progress_cb=None, error_cb=None):
+        self.__func = func
+        self.__args = args
+        self.__done_cb = done_cb
+        self.__progress_cb = progress_cb
+        self.__error_cb = error_cb
+        self.__cancelled = False
+        self.__fraction = None
+        self.__lock = threading.Lock()
+    @property
+    def is_cancelled(self):
+        return self.__cancelled
+    def start(self):
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+        return self
+    def cancel(self):
+        self.__cancelled = True
+    def report_progress(self, fraction):
+        if self.__cancelled:
+            raise self.Cancelled()
+        if self.__progress_cb is not None:
+            # only one progress report is queued at any time
+            with self.__lock:
+                if self.__fraction is None:
+                    GLib.idle_add(self._progress_cb)
+                self.__fraction = fraction
+    def _progress_cb(self):
+        with self.__lock:
+            fraction, self.__fraction = self.__fraction, None
+        if not self.__cancelled:
+            self.__progress_cb(fraction)
+        return False
+    def _run(self):
+        try:
+            result = self.__func(*self.__args, progress=self.report_progress)
+        except self.Cancelled:
+            return
+        except Exception as edata:
+            GLib.idle_add(self._error_cb, edata)
+            return
+        GLib.idle_add(self._done_cb, result)
+    def _done_cb(self, result):
+        if not self.__cancelled:
+            self.__done_cb(result)
+        return False
+    def _error_cb(self, edata):
+        if not self.__cancelled:
+            if self.__error_cb is None:
+                raise edata
+            self.__error_cb(edata)
+        return False
+
 class ColouredRectangle(Gtk.DrawingArea):
     DEFAULT_COLOUR = rgbh.RGBPN.WHITE
     def __init__(self, colour, size_request=None):
@@ -82,6 +191,10 @@ class ColourSampleArea(Gtk.Frame, actions.CAGandUIManager):
         self.set_size_request(100, 100)
         self._ptr_x = self._ptr_y = 100
         self._sample_images = []
+        self._sample_stats = []
+        self._sample_surfaces = []
+        self.__statistics = None
+        self.__jobs = {}
         self._single_sample = single_sample
         self.default_bg_colour = self.bg_colour = rgbh.RGBPN.WHITE if default_bg is None else default_bg
 
@@ -135,23 +248,96 @@ class ColourSampleArea(Gtk.Frame, actions.CAGandUIManager):
             dlg.destroy()
         else:
             if self._single_sample and len(self._sample_images) == 1:
+                self._cancel_statistics_jobs()
                 self._sample_images[0] = (int(posn[0]), int(posn[1]), img)
+                self._sample_stats[0] = None
+                self._sample_surfaces[0] = None
+                self.__statistics = None
+                index = 0
             else:
                 self._sample_images.append((int(posn[0]), int(posn[1]), img))
+                self._sample_stats.append(None)
+                self._sample_surfaces.append(None)
+                index = len(self._sample_stats) - 1
+            # summarise the sample now (off the main loop) so that
+            # matching never has to rescan it
+            pixels = psample.PixelBuffer.fm_pixbuf(img)
+            done_cb = lambda stats: self._statistics_ready_cb(index, stats)
+            progress_cb = lambda fraction: self._statistics_progress_cb(index, fraction)
+            error_cb = lambda edata: self._statistics_failed_cb(index, edata)
+            self.__jobs[index] = [BackgroundJob(psample.SampleStatistics.fm_pixels, (pixels,), done_cb, progress_cb, error_cb), 0.0]
+            self.__jobs[index][0].start()
             self.queue_draw()
             self.action_groups.update_condns(actions.MaskedCondns(self.AC_SAMPLES_PASTED, self.AC_MASK))
             self.emit("samples-changed", len(self._sample_images))
+            self.emit("statistics-progress", self.statistics_progress)
+    def _cancel_statistics_jobs(self):
+        for job, _fraction in self.__jobs.values():
+            job.cancel()
+        self.__jobs = {}
+    def _statistics_progress_cb(self, index, fraction):
+        if index not in self.__jobs:
+            return
+        self.__jobs[index][1] = fraction
+        self.emit("statistics-progress", self.statistics_progress)
+    def _statistics_ready_cb(self, index, stats):
+        del self.__jobs[index]
+        self._sample_stats[index] = stats
+        if self.__statistics is not None:
+            # a new object as clients may be holding on to the old one
+            self.__statistics = self.__statistics + stats
+        self.emit("statistics-progress", self.statistics_progress)
+        if not self.__jobs:
+            self.emit("statistics-changed")
+    def _statistics_failed_cb(self, index, edata):
+        # the sample is left out of the statistics
+        del self.__jobs[index]
+        self.emit("statistics-progress", self.statistics_progress)
+        if not self.__jobs:
+            self.emit("statistics-changed")
+        dlg = dialogue.MessageDialog(
+            parent=self.get_toplevel(),
+            flags=Gtk.DialogFlags.MODAL|Gtk.DialogFlags.DESTROY_WITH_PARENT,
+            buttons=Gtk.ButtonsType.OK,
+            text=_("Problem analysing sample: {}").format(edata)
+        )
+        dlg.run()
+        dlg.destroy()
+    @property
+    def statistics_pending(self):
+        return len(self.__jobs) > 0
+    @property
+    def statistics_progress(self):
+        """The fraction of the outstanding sample statistics that has
+        been calculated (1.0 when none are pending)
+        """
+        if not self.__jobs:
+            return 1.0
+        return sum(fraction for _job, fraction in self.__jobs.values()) / len(self.__jobs)
     def erase_samples(self):
         """Erase all samples from the drawing area
         """
+        self._cancel_statistics_jobs()
         self._sample_images = []
+        self._sample_stats = []
+        self._sample_surfaces = []
+        self.__statistics = None
         self.queue_draw()
         self.action_groups.update_condns(actions.MaskedCondns(0, self.AC_MASK))
         self.emit("samples-changed", len(self._sample_images))
+        self.emit("statistics-progress", self.statistics_progress)
     def get_samples(self):
         """Return a list containing all samples from the drawing area
         """
         return [sample[2] for sample in self._sample_images]
+    def get_statistics(self):
+        """Return the combined colour statistics of the samples in the
+        drawing area whose statistics have been calculated (maintained
+        incrementally as samples are pasted)
+        """
+        if self.__statistics is None:
+            self.__statistics = psample.SampleStatistics.combined(stats for stats in self._sample_stats if stats is not None)
+        return self.__statistics
     def set_bg_colour(self, colour):
         """Set the drawing area to the specified colour
         """
@@ -162,12 +348,34 @@ class ColourSampleArea(Gtk.Frame, actions.CAGandUIManager):
         """
         cairo_ctxt.set_source_rgb(*self.bg_colour.cairo_rgb)
         cairo_ctxt.paint()
-        for sample in self._sample_images:
-            sfc = Gdk.cairo_surface_create_from_pixbuf(sample[2], 0, None)
-            cairo_ctxt.set_source_surface(sfc, sample[0], sample[1])
-            cairo_ctxt.paint()
+        width = _widget.get_allocated_width()
+        height = _widget.get_allocated_height()
+        for index, (x, y, _pixbuf) in enumerate(self._sample_images):
+            sfc = self._get_sample_surface(index, width - x, height - y)
+            if sfc is not None:
+                cairo_ctxt.set_source_surface(sfc, x, y)
+                cairo_ctxt.paint()
         return True
+    def _get_sample_surface(self, index, max_width, max_height):
+        """Return a (cached) surface holding the visible part of the
+        indexed sample (or None if none of it is visible)
+        """
+        pixbuf = self._sample_images[index][2]
+        size = (min(pixbuf.get_width(), max_width), min(pixbuf.get_height(), max_height))
+        if size[0] <= 0 or size[1] <= 0:
+            return None
+        cached = self._sample_surfaces[index]
+        if cached is not None and cached[0] == size:
+            return cached[1]
+        if size != (pixbuf.get_width(), pixbuf.get_height()):
+            # shares the sample's pixels so only the visible part is converted
+            pixbuf = pixbuf.new_subpixbuf(0, 0, size[0], size[1])
+        sfc = Gdk.cairo_surface_create_from_pixbuf(pixbuf, 0, None)
+        self._sample_surfaces[index] = (size, sfc)
+        return sfc
 GObject.signal_new("samples-changed", ColourSampleArea, GObject.SignalFlags.RUN_LAST, None, (GObject.TYPE_INT,))
+GObject.signal_new("statistics-changed", ColourSampleArea, GObject.SignalFlags.RUN_LAST, None, ())
+GObject.signal_new("statistics-progress", ColourSampleArea, GObject.SignalFlags.RUN_LAST, None, (GObject.TYPE_DOUBLE,))
 
 class ColourMatchArea(Gtk.DrawingArea):
     """A coloured drawing area for comparing two colours.
@@ -208,6 +416,12 @@ class ColourMatchArea(Gtk.DrawingArea):
         self.target_colour = None
         self.queue_draw()
 
+def rect_contains(outer, inner):
+    """Return whether the (x0, y0, x1, y1) rectangle inner lies within
+    the rectangle outer
+    """
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
+
 def draw_line(cairo_ctxt, x0, y0, x1, y1):
     cairo_ctxt.move_to(x0, y0)
     cairo_ctxt.line_to(x1, y1)
@@ -308,6 +522,7 @@ class GenericAttrDisplay(Gtk.DrawingArea):
 class HueDisplay(GenericAttrDisplay):
     LABEL = _("Hue")
 
+    @ptiming.timed()
     def expose_cb(self, widget, cairo_ctxt):
         if self.colour is None and self.target_val is None:
             cairo_ctxt.set_source_rgb(*vpaint.WHITE.rgb16)
@@ -510,12 +725,12 @@ class PaintColourInformationDialogue(dialogue.SimpleDialog):
     def __init__(self, colour, parent=None):
         dialogue.SimpleDialog.__init__(self, title=self.TITLE_FMT_STR.format(colour.name), parent=parent)
         vbox = self.get_content_area()
-        vbox.pack_start(coloured.ColouredLabel(colour.name, colour.rgb.gdk_color), expand=False, fill=True, padding=0)
+        vbox.pack_start(coloured.ColouredLabel(colour.name, grgbh.gdk_color(colour.rgb)), expand=False, fill=True, padding=0)
         for extra in colour.EXTRAS:
-            vbox.pack_start(coloured.ColouredLabel(getattr(colour, extra.name), colour.rgb.gdk_color), expand=False, fill=True, padding=0)
+            vbox.pack_start(coloured.ColouredLabel(getattr(colour, extra.name), grgbh.gdk_color(colour.rgb)), expand=False, fill=True, padding=0)
         if hasattr(colour, "series"):
-            vbox.pack_start(coloured.ColouredLabel(colour.series.series_id.name, colour.rgb.gdk_color), expand=False, fill=True, padding=0)
-            vbox.pack_start(coloured.ColouredLabel(colour.series.series_id.maker, colour.rgb.gdk_color), expand=False, fill=True, padding=0)
+            vbox.pack_start(coloured.ColouredLabel(colour.series.series_id.name, grgbh.gdk_color(colour.rgb)), expand=False, fill=True, padding=0)
+            vbox.pack_start(coloured.ColouredLabel(colour.series.series_id.maker, grgbh.gdk_color(colour.rgb)), expand=False, fill=True, padding=0)
         if hasattr(colour, "warmth"):
             vbox.pack_start(HCVWDisplay(colour=colour), expand=False, fill=True, padding=0)
         else:
@@ -525,19 +740,77 @@ class PaintColourInformationDialogue(dialogue.SimpleDialog):
                 vbox.pack_start(Gtk.Label(characteristic.description()), expand=False, fill=True, padding=0)
         vbox.show_all()
 
+class ColourWheelModel(GObject.GObject):
+    """
+    The colours on show in a set of colour wheels along with the colour
+    derived data that is the same whatever the type of wheel
+    """
+    class ColourData(object):
+        def __init__(self, colour):
+            self.colour = colour
+            angle = colour.hue.angle if not colour.hue.is_grey else mathx.Angle(math.pi / 2)
+            self.cos = math.cos(angle)
+            self.sin = math.sin(angle)
+            self.chroma_colour = colour.chroma_side()
+    def __init__(self):
+        GObject.GObject.__init__(self)
+        self.paint_colours = {}
+        self.mixed_colours = {}
+        self.target_colours = {}
+        self.crosshair = None
+        # bumped whenever the paints, mixes or targets change
+        self.generation = 0
+    def _contents_changed(self):
+        self.generation += 1
+        self.emit("changed")
+    def add_paint(self, new_colour):
+        if hasattr(new_colour, "blobs"):
+            self.mixed_colours[new_colour.name] = self.ColourData(new_colour)
+        elif hasattr(new_colour, "id"):
+            self.paint_colours[new_colour.id] = self.ColourData(new_colour)
+        else:
+            self.paint_colours[new_colour.name] = self.ColourData(new_colour)
+        self._contents_changed()
+    def update_paint(self, colour):
+        # replacing the data recalculates the colour derived values
+        self.add_paint(colour)
+    def del_paint(self, colour):
+        if hasattr(colour, "blobs"):
+            self.mixed_colours.pop(colour.name)
+        elif hasattr(colour, "id"):
+            self.paint_colours.pop(colour.id)
+        else:
+            self.paint_colours.pop(colour.name)
+        self._contents_changed()
+    def add_target_colour(self, name, target_colour):
+        self.target_colours[name] = self.ColourData(target_colour)
+        self._contents_changed()
+    def del_target_colour(self, name):
+        self.target_colours.pop(name)
+        self._contents_changed()
+    def set_crosshair(self, colour):
+        self.crosshair = self.ColourData(colour)
+        self.emit("changed")
+    def unset_crosshair(self):
+        self.crosshair = None
+        self.emit("changed")
+GObject.signal_new("changed", ColourWheelModel, GObject.SignalFlags.RUN_LAST, None, ())
+
 class HueWheelNotebook(Gtk.Notebook):
     PAINT_INFO_DIALOGUE = PaintColourInformationDialogue
     def __init__(self, popup="/colour_wheel_I_popup"):
         Gtk.Notebook.__init__(self)
+        # the wheels share a single model so each change is only made once
+        self.model = ColourWheelModel()
         class MyHueChromaWheel(HueChromaWheel):
             PAINT_INFO_DIALOGUE = self.PAINT_INFO_DIALOGUE
-        self.hue_chroma_wheel = MyHueChromaWheel(nrings=5, popup=popup)
+        self.hue_chroma_wheel = MyHueChromaWheel(nrings=5, popup=popup, model=self.model)
         class MyHueValueWheel(HueValueWheel):
             PAINT_INFO_DIALOGUE = self.PAINT_INFO_DIALOGUE
-        self.hue_value_wheel = MyHueValueWheel(popup=popup)
+        self.hue_value_wheel = MyHueValueWheel(popup=popup, model=self.model)
         class MyHueGreynessWheel(HueGreynessWheel):
             PAINT_INFO_DIALOGUE = self.PAINT_INFO_DIALOGUE
-        self.hue_greyness_wheel = MyHueGreynessWheel(popup=popup)
+        self.hue_greyness_wheel = MyHueGreynessWheel(popup=popup, model=self.model)
         self.append_page(self.hue_value_wheel, Gtk.Label(label=_("Hue/Value Wheel")))
         self.append_page(self.hue_chroma_wheel, Gtk.Label(label=_("Hue/Chroma Wheel")))
         self.append_page(self.hue_greyness_wheel, Gtk.Label(label=_("Hue/Greyness Wheel")))
@@ -554,29 +827,19 @@ class HueWheelNotebook(Gtk.Notebook):
         self.hue_value_wheel.set_edit_paint_acb(callback)
         self.hue_greyness_wheel.set_edit_paint_acb(callback)
     def add_paint(self, new_colour):
-        self.hue_chroma_wheel.add_paint(new_colour)
-        self.hue_value_wheel.add_paint(new_colour)
-        self.hue_greyness_wheel.add_paint(new_colour)
+        self.model.add_paint(new_colour)
+    def update_paint(self, colour):
+        self.model.update_paint(colour)
     def del_paint(self, colour):
-        self.hue_chroma_wheel.del_paint(colour)
-        self.hue_value_wheel.del_paint(colour)
-        self.hue_greyness_wheel.del_paint(colour)
+        self.model.del_paint(colour)
     def add_target_colour(self, name, target_colour):
-        self.hue_chroma_wheel.add_target_colour(name, target_colour)
-        self.hue_value_wheel.add_target_colour(name, target_colour)
-        self.hue_greyness_wheel.add_target_colour(name, target_colour)
+        self.model.add_target_colour(name, target_colour)
     def del_target_colour(self, name):
-        self.hue_chroma_wheel.del_target_colour(name)
-        self.hue_value_wheel.del_target_colour(name)
-        self.hue_greyness_wheel.del_target_colour(name)
+        self.model.del_target_colour(name)
     def set_crosshair(self, target_colour):
-        self.hue_chroma_wheel.set_crosshair(target_colour)
-        self.hue_value_wheel.set_crosshair(target_colour)
-        self.hue_greyness_wheel.set_crosshair(target_colour)
+        self.model.set_crosshair(target_colour)
     def unset_crosshair(self):
-        self.hue_chroma_wheel.unset_crosshair()
-        self.hue_value_wheel.unset_crosshair()
-        self.hue_greyness_wheel.unset_crosshair()
+        self.model.unset_crosshair()
 
 class ColourWheel(Gtk.DrawingArea, actions.CAGandUIManager):
     PAINT_INFO_DIALOGUE = PaintColourInformationDialogue
@@ -596,7 +859,16 @@ class ColourWheel(Gtk.DrawingArea, actions.CAGandUIManager):
         </ui>
         """
     AC_HAVE_POPUP_COLOUR, _DUMMY = actions.ActionCondns.new_flags_and_mask(1)
-    def __init__(self, nrings=9, popup="/colour_wheel_I_popup"):
+    # largest width or height of off screen image that will be used to
+    # cache a layer and the margin cached around the visible part of the
+    # layer so that panning doesn't render it afresh at every step
+    MAX_LAYER_SIZE = 2048
+    LAYER_MARGIN = 128
+    # number of paints at which nearby paints start being drawn as clusters
+    LOD_THRESHOLD = 200
+    # width (in shape sizes) of the screen cells used to group nearby paints
+    LOD_CELL_SIZE = 4
+    def __init__(self, nrings=9, popup="/colour_wheel_I_popup", model=None):
         Gtk.DrawingArea.__init__(self)
         actions.CAGandUIManager.__init__(self, popup=popup)
         self.__popup_colour = None
@@ -614,7 +886,15 @@ class ColourWheel(Gtk.DrawingArea, actions.CAGandUIManager):
         self.target_colours = {}
         self.crosshair = None
         self.nrings = nrings
+        self.__geometry = None
+        self.__layers = {}
+        self.__lod = None
+        self.model = ColourWheelModel() if model is None else model
+        self.__model_generation = None
+        self.model.connect("changed", self._model_changed_cb)
         self.connect("draw", self.expose_cb)
+        # hidden wheels (e.g. on other notebook pages) don't hog memory
+        self.connect("unmap", lambda _widget: self._invalidate_layers())
         self.set_has_tooltip(True)
         self.connect("query-tooltip", self.query_tooltip_cb)
         self.add_events(Gdk.EventMask.SCROLL_MASK|Gdk.EventMask.BUTTON_PRESS_MASK|Gdk.EventMask.BUTTON_RELEASE_MASK)
@@ -673,22 +953,118 @@ class ColourWheel(Gtk.DrawingArea, actions.CAGandUIManager):
             x = radius * math.cos(angle)
         y = radius * math.sin(angle)
         return (int(self.centre.x + x), int(self.centre.y - y))
-    def get_colour_nearest_to_xy(self, x, y):
+    def _iter_shapes(self):
+        for shape in self.target_colours.values():
+            yield shape
+        for shape in self.paint_colours.values():
+            yield shape
+        for shape in self.mixed_colours.values():
+            yield shape
+        if self.crosshair is not None:
+            yield self.crosshair
+    def _locate_shapes(self, shapes):
+        """
+        Calculate the screen positions of the given shapes from their
+        (cached) polar data and the current geometry of the wheel
+        """
+        one = self.one * self.zoom
+        x_one = -one if options.get("colour_wheel", "red_to_yellow_clockwise") else one
+        cx, cy = self.centre
+        for shape in shapes:
+            shape.x = int(cx + x_one * shape.unit_x)
+            shape.y = int(cy - one * shape.unit_y)
+    def _update_geometry(self):
+        """
+        Relocate all shapes if the scale, zoom, offset or direction
+        of the wheel has changed since they were last located
+        """
+        geometry = (self.centre, self.one * self.zoom, options.get("colour_wheel", "red_to_yellow_clockwise"))
+        if geometry != self.__geometry:
+            self.__geometry = geometry
+            self._locate_shapes(self._iter_shapes())
+            if self.__lod is not None:
+                self._locate_shapes(self.__lod[2])
+    def _get_lod(self):
+        """
+        Return the level of detail grouping of the paints for the
+        current zoom as a (cell size, grid, clusters) tuple where grid
+        maps cells to the cluster or (lone) paint shape to be drawn for
+        that cell. Return None if there are too few paints to need it.
+        NB: the cells are relative to the centre so panning is free
+        """
+        if len(self.paint_colours) < self.LOD_THRESHOLD:
+            self.__lod = None
+            return None
+        cell_size = self.LOD_CELL_SIZE * self.scaled_size / (self.one * self.zoom)
+        if self.__lod is None or self.__lod[0] != cell_size:
+            cells = {}
+            for shape in self.paint_colours.values():
+                cell = (math.floor(shape.unit_x / cell_size), math.floor(shape.unit_y / cell_size))
+                cells.setdefault(cell, []).append(shape)
+            grid = {}
+            clusters = []
+            for cell, members in cells.items():
+                if len(members) == 1:
+                    grid[cell] = members[0]
+                else:
+                    grid[cell] = self.PaintCluster(self, members)
+                    clusters.append(grid[cell])
+            self._locate_shapes(clusters)
+            self.__lod = (cell_size, grid, clusters)
+        return self.__lod
+    def _iter_paint_shapes_near_xy(self, x, y):
+        """
+        Iterate over the paint shapes (or clusters) that could be
+        under the point (x, y) at the current level of detail
+        """
+        lod = self._get_lod()
+        if lod is None:
+            for shape in self.paint_colours.values():
+                yield shape
+            return
+        cell_size, grid, _clusters = lod
+        one = self.one * self.zoom
+        x_one = -one if options.get("colour_wheel", "red_to_yellow_clockwise") else one
+        col = math.floor((x - self.centre.x) / x_one / cell_size)
+        row = math.floor((self.centre.y - y) / one / cell_size)
+        for cell in ((col + i, row + j) for i in (-1, 0, 1) for j in (-1, 0, 1)):
+            shape = grid.get(cell, None)
+            if shape is not None:
+                yield shape
+    def get_shape_nearest_to_xy(self, x, y):
+        self._sync_with_model()
         smallest = 0xFF
         nearest = None
-        for colour_set in [self.paint_colours.values(), self.mixed_colours.values(), self.target_colours.values()]:
-            for colour in colour_set:
-                rng = colour.range_from(x, y)
+        for shape_set in [self._iter_paint_shapes_near_xy(x, y), self.mixed_colours.values(), self.target_colours.values()]:
+            for shape in shape_set:
+                rng = shape.range_from(x, y)
                 if rng < smallest:
                     smallest = rng
-                    nearest = colour.colour
+                    nearest = shape
         return (nearest, smallest)
+    def get_colour_nearest_to_xy(self, x, y):
+        shape, rng = self.get_shape_nearest_to_xy(x, y)
+        if shape is None:
+            return (None, rng)
+        elif isinstance(shape, self.PaintCluster):
+            return (shape.get_member_nearest_to_xy(x, y).colour, rng)
+        return (shape.colour, rng)
     def get_colour_at_xy(self, x, y):
         colour, rng = self.get_colour_nearest_to_xy(x, y)
         return colour if rng < self.scaled_size else None
     def query_tooltip_cb(self, widget, x, y, keyboard_mode, tooltip):
-        colour, rng = self.get_colour_nearest_to_xy(x, y)
-        if colour is not None and rng <= self.scaled_size:
+        shape, rng = self.get_shape_nearest_to_xy(x, y)
+        if shape is not None and rng <= self.scaled_size and isinstance(shape, self.PaintCluster):
+            names = sorted(member.colour.name for member in shape.members)
+            text = _("{0} paints:").format(len(names))
+            for name in names[:self.PaintCluster.TOOLTIP_MAX_NAMES]:
+                text += "\n" + name
+            if len(names) > self.PaintCluster.TOOLTIP_MAX_NAMES:
+                text += "\n" + _("... zoom in to see more")
+            tooltip.set_text(text)
+            return True
+        elif shape is not None and rng <= self.scaled_size:
+            colour = shape.colour
             text = colour.name
             if hasattr(colour, "EXTRAS"):
                 for extra in colour.EXTRAS:
@@ -712,40 +1088,56 @@ class ColourWheel(Gtk.DrawingArea, actions.CAGandUIManager):
             return True
         return False
     def add_paint(self, new_colour):
-        if hasattr(new_colour, "blobs"):
-            self.mixed_colours[new_colour.name] = self.ColourCircle(self, new_colour)
-        elif hasattr(new_colour, "id"):
-            self.paint_colours[new_colour.id] = self.ColourSquare(self, new_colour)
-        else:
-            self.paint_colours[new_colour.name] = self.ColourSquare(self, new_colour)
-        # The data has changed so do a redraw
-        self.queue_draw()
+        self.model.add_paint(new_colour)
+    def update_paint(self, colour):
+        """
+        Update the wheel to reflect changes made to the colour of a paint
+        """
+        self.model.update_paint(colour)
     def del_paint(self, colour):
-        if hasattr(colour, "blobs"):
-            self.mixed_colours.pop(colour.name)
-        elif hasattr(colour, "id"):
-            self.paint_colours.pop(colour.id)
-        else:
-            self.paint_colours.pop(colour.name)
-        # The data has changed so do a redraw
-        self.queue_draw()
+        self.model.del_paint(colour)
     def add_target_colour(self, name, target_colour):
-        dname = _("{0}: Target").format(name)
-        self.target_colours[name] = self.ColourDiamond(self, target_colour)
-        # The data has changed so do a redraw
-        self.queue_draw()
+        self.model.add_target_colour(name, target_colour)
     def del_target_colour(self, name):
-        self.target_colours.pop(name)
-        # The data has changed so do a redraw
-        self.queue_draw()
+        self.model.del_target_colour(name)
     def set_crosshair(self, colour):
-        self.crosshair = self.ColourCrossHair(self, colour)
-        # The data has changed so do a redraw
-        self.queue_draw()
+        self.model.set_crosshair(colour)
     def unset_crosshair(self):
-        self.crosshair = None
-        # The data has changed so do a redraw
+        self.model.unset_crosshair()
+    def _model_changed_cb(self, _model):
+        # Any catching up is left until the wheel is next drawn
         self.queue_draw()
+    def _sync_with_model(self):
+        """
+        Bring the wheel's shapes up to date with the model. This is done
+        lazily (when drawing or hit testing) so that wheels that are not
+        on show do no work.
+        """
+        model = self.model
+        if self.__model_generation != model.generation:
+            self.__model_generation = model.generation
+            new_shapes = []
+            for shapes, model_data, shape_type in [(self.paint_colours, model.paint_colours, self.ColourSquare),
+                                                   (self.mixed_colours, model.mixed_colours, self.ColourCircle),
+                                                   (self.target_colours, model.target_colours, self.ColourDiamond)]:
+                for key in [key for key in shapes if key not in model_data]:
+                    del shapes[key]
+                for key, data in model_data.items():
+                    shape = shapes.get(key, None)
+                    if shape is None or shape.data is not data:
+                        shape = shapes[key] = shape_type(self, data)
+                        new_shapes.append(shape)
+            self._locate_shapes(new_shapes)
+            # The data has changed so the shapes layer must be redrawn
+            self.__lod = None
+            self._invalidate_layers("shapes")
+        # The cross hair is in the (uncached) top layer
+        if model.crosshair is None:
+            self.crosshair = None
+        elif self.crosshair is None or self.crosshair.data is not model.crosshair:
+            self.crosshair = self.ColourCrossHair(self, model.crosshair)
+            self._locate_shapes([self.crosshair])
+    @ptiming.timed()
     def expose_cb(self, widget, cairo_ctxt):
         #
         spacer = 10
@@ -765,8 +1157,16 @@ class ColourWheel(Gtk.DrawingArea, actions.CAGandUIManager):
         self.scale = mindim / scaledmax
         self.one = self.scale * 100
         self.scaled_size = self.size * self.scale
+        self._update_geometry()
+        self._sync_with_model()
         #
-        # Draw the graticule
+        self._draw_layer(cairo_ctxt, "graticule", self._draw_graticule)
+        self._draw_layer(cairo_ctxt, "shapes", self._draw_shapes)
+        # the cross hair is the (uncached) top layer
+        if self.crosshair is not None:
+            self.crosshair.draw(cairo_ctxt)
+        return True
+    def _draw_graticule(self, cairo_ctxt):
         ring_colour = rgbh.RGBPN.WHITE * 3 / 4
         cairo_ctxt.set_source_rgb(*ring_colour)
         for radius in [100 * (i + 1) * self.scale / self.nrings for i in range(self.nrings)]:
@@ -779,15 +1179,70 @@ class ColourWheel(Gtk.DrawingArea, actions.CAGandUIManager):
             cairo_ctxt.move_to(self.centre.x, self.centre.y)
             cairo_ctxt.line_to(*self.polar_to_cartesian(self.one * self.zoom, angle))
             cairo_ctxt.stroke()
+    def _draw_shapes(self, cairo_ctxt):
+        cairo_ctxt.set_line_width(2)
         for target_colour in self.target_colours.values():
             target_colour.draw(cairo_ctxt)
-        for paint_colour in self.paint_colours.values():
+        lod = self._get_lod()
+        for paint_colour in self.paint_colours.values() if lod is None else lod[1].values():
             paint_colour.draw(cairo_ctxt)
         for mix in self.mixed_colours.values():
             mix.draw(cairo_ctxt)
-        if self.crosshair is not None:
-            self.crosshair.draw(cairo_ctxt)
-        return True
+    def _invalidate_layers(self, *names):
+        """
+        Discard the cached images of the named layers (or all layers
+        if no names are given) so that they are rendered afresh
+        """
+        if names:
+            for name in names:
+                self.__layers.pop(name, None)
+        else:
+            self.__layers.clear()
+    def _draw_layer(self, cairo_ctxt, name, draw_func):
+        """
+        Draw the named static layer from its cached image (rendering
+        it first if it is missing or out of date with the geometry).
+        Only the visible part of the wheel (plus a margin) is cached and
+        as the image is positioned relative to the centre of the wheel
+        panning within the margin only changes where it is painted.
+        """
+        half = int(math.ceil(self.one * self.zoom + 3 * self.scaled_size + 4))
+        centre_x = math.floor(self.centre.x)
+        centre_y = math.floor(self.centre.y)
+        # the visible part of the wheel's bounding square relative to its centre
+        visible = (
+            max(-half, -centre_x),
+            max(-half, -centre_y),
+            min(half, self.get_allocated_width() - centre_x),
+            min(half, self.get_allocated_height() - centre_y)
+        )
+        if visible[0] >= visible[2] or visible[1] >= visible[3]:
+            self.__layers.pop(name, None)
+            return
+        clockwise = options.get("colour_wheel", "red_to_yellow_clockwise")
+        key = (half, self.one * self.zoom, self.scaled_size, clockwise, self.centre.x % 1, self.centre.y % 1)
+        layer = self.__layers.get(name, None)
+        if layer is None or layer[0] != key or not rect_contains(layer[1], visible):
+            margin = self.LAYER_MARGIN
+            rect = (
+                max(-half, visible[0] - margin),
+                max(-half, visible[1] - margin),
+                min(half, visible[2] + margin),
+                min(half, visible[3] + margin)
+            )
+            width, height = rect[2] - rect[0], rect[3] - rect[1]
+            if max(width, height) > self.MAX_LAYER_SIZE:
+                # Too big to be worth caching so draw it directly
+                self.__layers.pop(name, None)
+                draw_func(cairo_ctxt)
+                return
+            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+            layer_ctxt = cairo.Context(surface)
+            layer_ctxt.translate(-(centre_x + rect[0]), -(centre_y + rect[1]))
+            draw_func(layer_ctxt)
+            layer = self.__layers[name] = (key, rect, surface)
+        cairo_ctxt.set_source_surface(layer[2], centre_x + layer[1][0], centre_y + layer[1][1])
+        cairo_ctxt.paint()
     # Allow graticule to be moved using mouse (left button depressed)
     # Careful not to override CAGandUIManager method
     def _button_press_cb(self, widget, event):
@@ -818,22 +1273,26 @@ class ColourWheel(Gtk.DrawingArea, actions.CAGandUIManager):
             widget.handler_block(cb_id)
         return False
     class ColourShape(object):
-        def __init__(self, parent, colour):
+        def __init__(self, parent, data):
             self.parent = parent
-            self.colour = colour
+            self.data = data
+            self.colour = data.colour
             self.x = 0
             self.y = 0
             self.pen_width = 2
-            self.predraw_setup()
-        def predraw_setup(self):
+            self.colour_setup()
+        def colour_setup(self):
             """
-            Set up colour values ready for drawing
+            Set up the colour derived values needed for drawing.
+            NB: only the radius depends on the type of wheel the rest
+            is shared (via the model) with the other wheels
             """
-            self.colour_angle = self.colour.hue.angle if not self.colour.hue.is_grey else mathx.Angle(math.pi / 2)
             self.fg_colour = self.colour
-            self.value_colour = vpaint.BLACK
-            self.chroma_colour = self.colour.chroma_side()
+            self.chroma_colour = self.data.chroma_colour
             self.choose_radius_attribute()
+            # position (in units of the wheel's radius) relative to the centre
+            self.unit_x = self.radius_attribute * self.data.cos
+            self.unit_y = self.radius_attribute * self.data.sin
         def range_from(self, x, y):
             dx = x - self.x
             dy = y - self.y
@@ -841,8 +1300,6 @@ class ColourWheel(Gtk.DrawingArea, actions.CAGandUIManager):
     class ColourSquare(ColourShape):
         polypoints = ((-1, 1), (-1, -1), (1, -1), (1, 1))
         def draw(self, cairo_ctxt):
-            self.predraw_setup()
-            self.x, self.y = self.parent.polar_to_cartesian(self.radius * self.parent.zoom, self.colour_angle)
             square = tuple(tuple(pp[i] * self.parent.scaled_size for i in range(2)) for pp in self.polypoints)
             square_pts = [tuple((int(self.x + pt[0]), int(self.y +  pt[1]))) for pt in square]
             # draw the middle
@@ -854,16 +1311,12 @@ class ColourWheel(Gtk.DrawingArea, actions.CAGandUIManager):
         polypoints = ((1.5, 0), (0, -1.5), (-1.5, 0), (0, 1.5))
     class ColourCircle(ColourShape):
         def draw(self, cairo_ctxt):
-            self.predraw_setup()
-            self.x, self.y = self.parent.polar_to_cartesian(self.radius * self.parent.zoom, self.colour_angle)
             cairo_ctxt.set_source_rgb(*self.fg_colour.cairo_rgb)
             draw_circle(cairo_ctxt, self.x, self.y, radius=self.parent.scaled_size, filled=True)
             cairo_ctxt.set_source_rgb(*self.chroma_colour.cairo_rgb)
             draw_circle(cairo_ctxt, self.x, self.y, radius=self.parent.scaled_size, filled=False)
     class ColourCrossHair(ColourShape):
         def draw(self, cairo_ctxt):
-            self.predraw_setup()
-            self.x, self.y = self.parent.polar_to_cartesian(self.radius * self.parent.zoom, self.colour_angle)
             radius = self.parent.scaled_size
             halflen = radius * 2
             cairo_ctxt.set_source_rgb(*self.fg_colour.cairo_rgb)
@@ -872,56 +1325,239 @@ class ColourWheel(Gtk.DrawingArea, actions.CAGandUIManager):
             draw_circle(cairo_ctxt, self.x, self.y, radius=radius, filled=False)
             draw_line(cairo_ctxt, int(self.x - halflen), int(self.y), int(self.x + halflen), int(self.y))
             draw_line(cairo_ctxt, int(self.x), int(self.y - halflen), int(self.x), int(self.y + halflen))
+    class PaintCluster(object):
+        """A glyph standing in for paints too close together to be told apart
+        """
+        TOOLTIP_MAX_NAMES = 8
+        def __init__(self, parent, members):
+            self.parent = parent
+            self.members = members
+            self.x = 0
+            self.y = 0
+            self.unit_x = sum(member.unit_x for member in members) / len(members)
+            self.unit_y = sum(member.unit_y for member in members) / len(members)
+            total_rgb = members[0].colour.rgb
+            for member in members[1:]:
+                total_rgb = total_rgb + member.colour.rgb
+            self.fg_colour = total_rgb / len(members)
+            self.text_colour = self.fg_colour.best_foreground()
+            self.label = str(len(members))
+        @property
+        def radius(self):
+            # grow with the count but stay within half a grid cell
+            return self.parent.scaled_size * min(2.0, 1.0 + math.log10(len(self.members)) / 2)
+        def range_from(self, x, y):
+            dx = x - self.x
+            dy = y - self.y
+            # anywhere on the glyph is as good as a direct hit
+            return max(0.0, math.sqrt(dx * dx + dy * dy) - self.radius + self.parent.scaled_size)
+        def get_member_nearest_to_xy(self, x, y):
+            return min(self.members, key=lambda member: member.range_from(x, y))
+        def draw(self, cairo_ctxt):
+            radius = self.radius
+            cairo_ctxt.set_source_rgb(*self.fg_colour.cairo_rgb)
+            draw_circle(cairo_ctxt, self.x, self.y, radius=radius, filled=True)
+            cairo_ctxt.set_source_rgb(0.0, 0.0, 0.0)
+            draw_circle(cairo_ctxt, self.x, self.y, radius=radius, filled=False)
+            cairo_ctxt.set_source_rgb(*self.text_colour.cairo_rgb)
+            cairo_ctxt.set_font_size(radius)
+            extents = cairo_ctxt.text_extents(self.label)
+            cairo_ctxt.move_to(self.x - extents[2] / 2 - extents[0], self.y - extents[3] / 2 - extents[1])
+            cairo_ctxt.show_text(self.label)
 
 class HueChromaWheel(ColourWheel):
     class ColourSquare(ColourWheel.ColourSquare):
         def choose_radius_attribute(self):
-            self.radius = self.parent.one * self.colour.chroma
+            self.radius_attribute = self.colour.chroma
     class ColourCircle(ColourWheel.ColourCircle):
         def choose_radius_attribute(self):
-            self.radius = self.parent.one * self.colour.chroma
+            self.radius_attribute = self.colour.chroma
     class ColourDiamond(ColourWheel.ColourDiamond):
         def choose_radius_attribute(self):
-            self.radius = self.parent.one * self.colour.chroma
+            self.radius_attribute = self.colour.chroma
     class ColourCrossHair(ColourWheel.ColourCrossHair):
         def choose_radius_attribute(self):
-            self.radius = self.parent.one * self.colour.chroma
+            self.radius_attribute = self.colour.chroma
 
 class HueValueWheel(ColourWheel):
     class ColourSquare(ColourWheel.ColourSquare):
         def choose_radius_attribute(self):
-            self.radius = self.parent.one * self.colour.value
+            self.radius_attribute = self.colour.value
     class ColourCircle(ColourWheel.ColourCircle):
         def choose_radius_attribute(self):
-            self.radius = self.parent.one * self.colour.value
+            self.radius_attribute = self.colour.value
     class ColourDiamond(ColourWheel.ColourDiamond):
         def choose_radius_attribute(self):
-            self.radius = self.parent.one * self.colour.value
+            self.radius_attribute = self.colour.value
     class ColourCrossHair(ColourWheel.ColourCrossHair):
         def choose_radius_attribute(self):
-            self.radius = self.parent.one * self.colour.value
+            self.radius_attribute = self.colour.value
 
 class HueGreynessWheel(ColourWheel):
     class ColourSquare(ColourWheel.ColourSquare):
         def choose_radius_attribute(self):
-            self.radius = self.parent.one * self.colour.greyness
+            self.radius_attribute = self.colour.greyness
     class ColourCircle(ColourWheel.ColourCircle):
         def choose_radius_attribute(self):
-            self.radius = self.parent.one * self.colour.greyness
+            self.radius_attribute = self.colour.greyness
     class ColourDiamond(ColourWheel.ColourDiamond):
         def choose_radius_attribute(self):
-            self.radius = self.parent.one * self.colour.greyness
+            self.radius_attribute = self.colour.greyness
     class ColourCrossHair(ColourWheel.ColourCrossHair):
         def choose_radius_attribute(self):
-            self.radius = self.parent.one * self.colour.greyness
+            self.radius_attribute = self.colour.greyness
+
+# GTK_TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID
+UNSORTED_SORT_COLUMN_ID = -2
+
+class PaintRenderCache(dict):
+    """
+    The cell renderer properties for displaying paints' attributes
+    """
+    def get_render(self, paint, attribute):
+        """
+        Return the cell renderer properties for displaying the given
+        attribute of the paint (calculating them on first use)
+        """
+        renders = self.get(paint, None)
+        if renders is None:
+            renders = self[paint] = {}
+        render = renders.get(attribute, None)
+        if render is None:
+            render = renders[attribute] = paint_cell_render(paint, attribute)
+        return render
 
 class PaintListStore(Gtk.ListStore):
     COLUMN_DEFS = list()
     def __init__(self, *args):
         Gtk.ListStore.__init__(self, GObject.TYPE_PYOBJECT, *args)
+        # Index the rows by paint (and the paints by name) so that they
+        # can be found without searching. Appends extend the index and
+        # anything else that moves rows has it rebuilt on next use.
+        self.__indices = {}
+        self.__names = {}
+        self.__renders = PaintRenderCache()
+        # the sort key of each paint for each column attribute
+        self.__sort_keys = {}
+        # the (column, order) of the last sort_by_column() which is
+        # reapplied when paints are added or updated
+        self.__sort = None
+        self.__resort = CoalescedUpdate(self._resort)
+        self.connect("row-inserted", self._row_inserted_cb)
+        self.connect("row-changed", self._row_changed_cb)
+        self.connect("row-deleted", lambda _model, _path: self._invalidate_index())
+        self.connect("rows-reordered", lambda _model, _path, _iter, _order: self._invalidate_index())
+        self.connect("sort-column-changed", self._sort_column_changed_cb)
+    def _invalidate_index(self):
+        self.__indices = None
+        self.__names = None
+    def _get_indices(self):
+        if self.__indices is None:
+            self.__indices = {}
+            self.__names = {}
+            for index, row in enumerate(self):
+                paint = row[0]
+                self.__indices.setdefault(paint, index)
+                self.__names.setdefault(paint.name, []).append(paint)
+        return self.__indices
+    def _row_inserted_cb(self, _model, path, model_iter):
+        if self.__sort is not None:
+            self.__resort.schedule()
+        if self.__indices is None:
+            return
+        index = path.get_indices()[0]
+        paint = self.get_value(model_iter, 0)
+        if paint is None or index != len(self) - 1:
+            self._invalidate_index()
+            return
+        self.__indices.setdefault(paint, index)
+        self.__names.setdefault(paint.name, []).append(paint)
+    def _row_changed_cb(self, _model, path, model_iter):
+        if self.__indices is None:
+            return
+        # a row whose paint has been replaced makes the index stale
+        if self.__indices.get(self.get_value(model_iter, 0), None) != path.get_indices()[0]:
+            self._invalidate_index()
+    def _forget_paint(self, paint):
+        self.__renders.pop(paint, None)
+        for keys in self.__sort_keys.values():
+            keys.pop(paint, None)
+    def remove(self, model_iter):
+        self._forget_paint(self.get_value(model_iter, 0))
+        return Gtk.ListStore.remove(self, model_iter)
+    def clear(self):
+        self.__indices = {}
+        self.__names = {}
+        self.__renders.clear()
+        self.__sort_keys.clear()
+        Gtk.ListStore.clear(self)
     def append_paint(self, paint):
         self.append([paint])
-    def get_paint_iter(self, paint, func=lambda x: x):
+    def set_paints(self, paints):
+        """
+        Replace the model's contents with the given paints
+        """
+        self.clear()
+        for paint in paints:
+            self.append([paint])
+    def update_paint(self, paint):
+        """
+        Update the display of a paint whose data has been changed in place
+        """
+        self.__renders.pop(paint, None)
+        for keys in self.__sort_keys.values():
+            keys.pop(paint, None)
+        model_iter = self.get_paint_iter(paint)
+        if model_iter is not None:
+            self.row_changed(self.get_path(model_iter), model_iter)
+            if self.__sort is not None:
+                self.__resort.schedule()
+    def get_paint_render(self, paint, attribute):
+        return self.__renders.get_render(paint, attribute)
+    def _resort(self):
+        if self.__sort is not None:
+            self.sort_by_column(*self.__sort)
+    def _sort_column_changed_cb(self, _model):
+        # Gtk has taken over the sorting
+        if self.get_sort_column_id()[0] is not None:
+            self.__sort = None
+            self.__resort.cancel()
+    def sort_by_column(self, column, order=Gtk.SortType.ASCENDING):
+        """
+        Sort the rows using the sort keys of the given column (the
+        keys are calculated once per paint and kept) with a single
+        reorder of the store. The sort is reapplied whenever paints
+        are added or updated until Gtk is asked to sort the store.
+        """
+        self.__resort.cancel()
+        tns = self.COLUMN_DEFS[column]
+        keys = self.__sort_keys.get(tns.attr, None)
+        if keys is None:
+            keys = self.__sort_keys[tns.attr] = {}
+        row_keys = []
+        for paint in self.get_paints():
+            key = keys.get(paint, None)
+            if key is None:
+                key = keys[paint] = paint_sort_key(paint, tns)
+            row_keys.append(key)
+        new_order = sorted(range(len(row_keys)), key=row_keys.__getitem__, reverse=order == Gtk.SortType.DESCENDING)
+        # the store can only be reordered when Gtk isn't sorting it
+        self.set_sort_column_id(UNSORTED_SORT_COLUMN_ID, Gtk.SortType.ASCENDING)
+        self.__sort = (column, order)
+        if new_order:
+            self.reorder(new_order)
+    def get_paint_iter(self, paint, func=None):
+        if func is None:
+            index = self._get_indices().get(paint, None)
+            if index is None:
+                return None
+            model_iter = self.get_iter((index,))
+            if self.get_value(model_iter, 0) == paint:
+                return model_iter
+            # the paint has been changed in place so start afresh
+            self._invalidate_index()
+            index = self._get_indices().get(paint, None)
+            return None if index is None else self.get_iter((index,))
         model_iter = self.get_iter_first()
         while model_iter:
             if func(self[model_iter][0]) == paint:
@@ -937,45 +1573,277 @@ class PaintListStore(Gtk.ListStore):
         self.emit("paint_removed", paint)
         return self.remove(model_iter)
     def remove_paints(self, paints):
+        """Remove the paints (which must be present) rebuilding the
+        index only once
+        """
+        indices = self._get_indices()
+        doomed = {}
         for paint in paints:
-            self.remove_paint(paint)
+            index = indices.get(paint, None)
+            if index is None:
+                raise LookupError()
+            doomed[index] = paint
+        for index, paint in sorted(doomed.items(), reverse=True):
+            self.emit("paint_removed", paint)
+            self.remove(self.get_iter((index,)))
     def get_paints(self):
         return [row[0] for row in self]
     def get_paint_with_name(self, paint_name):
         """Return the paint with the specified name or None if not present
         """
-        for row in self:
-            if row[0].name == paint_name:
-                return row[0]
-        return None
+        self._get_indices()
+        paints = self.__names.get(paint_name, None)
+        return paints[0] if paints else None
 GObject.signal_new("paint_removed", PaintListStore, GObject.SignalFlags.RUN_LAST, None, (GObject.TYPE_PYOBJECT,))
 
-def paint_cell_data_func(column, cell, model, model_iter, attribute):
-    paint = model[model_iter][0]
+class PaintListModel(GObject.GObject, Gtk.TreeModel):
+    """
+    A list model (with the same interface as PaintListStore) that serves
+    its rows straight from a list of paints rather than copying them into
+    Gtk.ListStore rows and that sorts by argsorting precomputed keys.
+    Intended for the very large read mostly lists of paint standards.
+    """
+    COLUMN_DEFS = list()
+    def __init__(self):
+        GObject.GObject.__init__(self)
+        self.__paints = []
+        # the storage index of the paint shown in each row and vice versa
+        self.__order = []
+        self.__rows = []
+        self.__index = {}
+        self.__names = {}
+        self.__renders = PaintRenderCache()
+        # the sort key of each paint (by storage index) for each column
+        self.__sort_keys = {}
+        self.__sort = None
+        self.__resort = CoalescedUpdate(self._resort)
+        self.__stamp = 0
+    def _rebuild_index(self):
+        self.__stamp += 1
+        self.__index = {}
+        self.__names = {}
+        for index, paint in enumerate(self.__paints):
+            self.__index.setdefault(paint, index)
+            self.__names.setdefault(paint.name, []).append(paint)
+        self.__rows = [0] * len(self.__order)
+        for row, index in enumerate(self.__order):
+            self.__rows[index] = row
+    def _new_iter(self, row):
+        model_iter = Gtk.TreeIter()
+        model_iter.stamp = self.__stamp
+        model_iter.user_data = row
+        return model_iter
+    # Gtk.TreeModel interface
+    def do_get_flags(self):
+        return Gtk.TreeModelFlags.LIST_ONLY
+    def do_get_n_columns(self):
+        return 1
+    def do_get_column_type(self, index):
+        return GObject.TYPE_PYOBJECT
+    def do_get_iter(self, path):
+        indices = path.get_indices()
+        if len(indices) == 1 and indices[0] < len(self.__order):
+            return (True, self._new_iter(indices[0]))
+        return (False, None)
+    def do_get_path(self, model_iter):
+        return Gtk.TreePath((model_iter.user_data,))
+    def do_get_value(self, model_iter, column):
+        return self.__paints[self.__order[model_iter.user_data]]
+    def do_iter_next(self, model_iter):
+        row = model_iter.user_data + 1
+        if row < len(self.__order):
+            model_iter.user_data = row
+            return (True, model_iter)
+        return (False, None)
+    def do_iter_previous(self, model_iter):
+        row = model_iter.user_data - 1
+        if row >= 0:
+            model_iter.user_data = row
+            return (True, model_iter)
+        return (False, None)
+    def do_iter_children(self, parent):
+        if parent is None and self.__order:
+            return (True, self._new_iter(0))
+        return (False, None)
+    def do_iter_has_child(self, model_iter):
+        return False
+    def do_iter_n_children(self, model_iter):
+        return len(self.__order) if model_iter is None else 0
+    def do_iter_nth_child(self, parent, n):
+        if parent is None and n < len(self.__order):
+            return (True, self._new_iter(n))
+        return (False, None)
+    def do_iter_parent(self, child):
+        return (False, None)
+    # PaintListStore interface
+    def set_paints(self, paints):
+        """
+        Replace the model's contents with the given paints. No row
+        signals are emitted so views must be detached (with
+        set_model(None)) while this is done and reattached afterwards.
+        """
+        self.__paints = list(paints)
+        self.__renders.clear()
+        self.__sort_keys.clear()
+        if self.__sort is None:
+            self.__order = list(range(len(self.__paints)))
+        else:
+            self.__order = self._sorted_order(*self.__sort)
+        self._rebuild_index()
+    def append_paint(self, paint):
+        row = len(self.__order)
+        self.__index.setdefault(paint, len(self.__paints))
+        self.__names.setdefault(paint.name, []).append(paint)
+        self.__rows.append(row)
+        self.__order.append(len(self.__paints))
+        self.__paints.append(paint)
+        for keys in self.__sort_keys.values():
+            keys.append(None)
+        self.row_inserted(Gtk.TreePath((row,)), self._new_iter(row))
+        if self.__sort is not None:
+            self.__resort.schedule()
+    def update_paint(self, paint):
+        """
+        Update the display of a paint whose data has been changed in place
+        """
+        self.__renders.pop(paint, None)
+        index = self.__index.get(paint, None)
+        if index is not None:
+            for keys in self.__sort_keys.values():
+                keys[index] = None
+        model_iter = self.get_paint_iter(paint)
+        if model_iter is not None:
+            self.row_changed(self.get_path(model_iter), model_iter)
+            if self.__sort is not None:
+                self.__resort.schedule()
+    def get_paint_render(self, paint, attribute):
+        return self.__renders.get_render(paint, attribute)
+    def get_paint_iter(self, paint, func=None):
+        if func is None:
+            index = self.__index.get(paint, None)
+            return None if index is None else self._new_iter(self.__rows[index])
+        for row, index in enumerate(self.__order):
+            if func(self.__paints[index]) == paint:
+                return self._new_iter(row)
+        return None
+    def remove(self, model_iter):
+        self.remove_paint(self.get_value(model_iter, 0))
+        return False
+    def remove_paint(self, paint):
+        if paint not in self.__index:
+            raise LookupError()
+        self.remove_paints([paint])
+    def remove_paints(self, paints):
+        rows = sorted((self.__rows[self.__index[paint]] for paint in paints), reverse=True)
+        for paint in paints:
+            self.emit("paint_removed", paint)
+            self.__renders.pop(paint, None)
+        # delete from the bottom up so that the paths stay valid
+        for row in rows:
+            del self.__order[row]
+            self.row_deleted(Gtk.TreePath((row,)))
+        # then compact the storage
+        doomed = set(self.__index[paint] for paint in paints)
+        new_index = {}
+        paints = []
+        for index, paint in enumerate(self.__paints):
+            if index not in doomed:
+                new_index[index] = len(paints)
+                paints.append(paint)
+        self.__paints = paints
+        self.__order = [new_index[index] for index in self.__order]
+        for column, keys in self.__sort_keys.items():
+            self.__sort_keys[column] = [key for index, key in enumerate(keys) if index not in doomed]
+        self._rebuild_index()
+    def clear(self):
+        for row in reversed(range(len(self.__order))):
+            self.row_deleted(Gtk.TreePath((row,)))
+        self.__paints = []
+        self.__order = []
+        self.__renders.clear()
+        self.__sort_keys.clear()
+        self._rebuild_index()
+    def get_paints(self):
+        return [self.__paints[index] for index in self.__order]
+    def get_paint_with_name(self, paint_name):
+        """Return the paint with the specified name or None if not present
+        """
+        paints = self.__names.get(paint_name, None)
+        return paints[0] if paints else None
+    def _sorted_order(self, column, order):
+        tns = self.COLUMN_DEFS[column]
+        keys = self.__sort_keys.get(column, None)
+        if keys is None:
+            keys = self.__sort_keys[column] = [paint_sort_key(paint, tns) for paint in self.__paints]
+        else:
+            # only paints appended or updated since the last sort need new keys
+            for index, key in enumerate(keys):
+                if key is None:
+                    keys[index] = paint_sort_key(self.__paints[index], tns)
+        return sorted(range(len(self.__paints)), key=keys.__getitem__, reverse=order == Gtk.SortType.DESCENDING)
+    def _resort(self):
+        if self.__sort is not None:
+            self.sort_by_column(*self.__sort)
+    def sort_by_column(self, column, order=Gtk.SortType.ASCENDING):
+        """
+        Sort the rows using the sort keys of the given column (the
+        keys for all paints are calculated once and kept). The sort
+        is reapplied whenever paints are added or updated.
+        """
+        self.__resort.cancel()
+        self.__sort = (column, order)
+        new_order = self._sorted_order(column, order)
+        old_rows = self.__rows
+        self.__order = new_order
+        self._rebuild_index()
+        if new_order:
+            self.rows_reordered(Gtk.TreePath(), None, [old_rows[index] for index in new_order])
+GObject.signal_new("paint_removed", PaintListModel, GObject.SignalFlags.RUN_LAST, None, (GObject.TYPE_PYOBJECT,))
+
+def paint_sort_key(paint, tns):
+    """
+    Return the key for sorting the paint by the given column. The keys
+    for the colour attributes are plain numbers (or strings) so that
+    comparing them doesn't go through the paint's attribute lookups.
+    """
+    attribute = tns.attr
+    if attribute == "name":
+        return paint.name.casefold()
+    elif attribute == "hue":
+        # greys have no hue so put them before all the colours
+        return -4.0 if paint.hue.is_grey else float(paint.hue.angle)
+    elif attribute in ("chroma", "value", "warmth"):
+        return float(getattr(paint, attribute))
+    elif hasattr(paint, "CHARACTERISTICS") and attribute in paint.CHARACTERISTICS.NAMES:
+        return (getattr(paint, attribute).val, paint.name)
+    elif hasattr(paint, "EXTRAS") and attribute in [extra.name for extra in paint.EXTRAS]:
+        return getattr(paint, attribute)
+    return tns.sort_key_function((paint,))
+
+def paint_cell_render(paint, attribute):
+    """
+    Return the (property, value) pairs that a cell renderer needs to
+    display the given attribute of the paint
+    """
     if attribute == "name":
-        cell.set_property("text", paint.name)
-        cell.set_property("background-gdk", paint.gdk_color)
-        cell.set_property("foreground-gdk", paint.best_foreground_gdk_color())
+        return (("text", paint.name), ("background-gdk", grgbh.gdk_color(paint)), ("foreground-gdk", grgbh.best_foreground_gdk_color(paint)))
     elif attribute == "hue":
-        cell.set_property("background-gdk", paint.hue_rgb.gdk_color)
+        return (("background-gdk", grgbh.gdk_color(paint.hue_rgb)),)
     elif attribute == "chroma":
-        cell.set_property("text", str(float(round(paint.chroma, 2))))
-        cell.set_property("background-gdk", paint.rgb.gdk_color)
-        cell.set_property("foreground-gdk", paint.rgb.best_foreground_gdk_color())
+        return (("text", str(float(round(paint.chroma, 2)))), ("background-gdk", grgbh.gdk_color(paint.rgb)), ("foreground-gdk", grgbh.best_foreground_gdk_color(paint.rgb)))
     elif attribute == "value":
-        cell.set_property("text", str(float(round(paint.value, 2))))
-        cell.set_property("background-gdk", paint.value_rgb.gdk_color)
-        cell.set_property("foreground-gdk", paint.value_rgb.best_foreground_gdk_color())
+        return (("text", str(float(round(paint.value, 2)))), ("background-gdk", grgbh.gdk_color(paint.value_rgb)), ("foreground-gdk", grgbh.best_foreground_gdk_color(paint.value_rgb)))
     elif attribute == "warmth":
-        cell.set_property("text", str(float(round(paint.warmth, 2))))
-        cell.set_property("background-gdk", paint.warmth_rgb.gdk_color)
-        cell.set_property("foreground-gdk", paint.warmth_rgb.best_foreground_gdk_color())
+        return (("text", str(float(round(paint.warmth, 2)))), ("background-gdk", grgbh.gdk_color(paint.warmth_rgb)), ("foreground-gdk", grgbh.best_foreground_gdk_color(paint.warmth_rgb)))
     elif hasattr(paint, "EXTRAS") and attribute in [extra.name for extra in paint.EXTRAS]:
-        cell.set_property("text", str(getattr(paint, attribute)))
-        cell.set_property("background-gdk", paint.gdk_color)
-        cell.set_property("foreground-gdk", paint.best_foreground_gdk_color())
+        return (("text", str(getattr(paint, attribute))), ("background-gdk", grgbh.gdk_color(paint)), ("foreground-gdk", grgbh.best_foreground_gdk_color(paint)))
     else: # handle characteristics generically
-        cell.set_property("text", str(getattr(paint, attribute)))
+        return (("text", str(getattr(paint, attribute))),)
+
+@ptiming.timed()
+def paint_cell_data_func(column, cell, model, model_iter, attribute):
+    for name, value in model.get_paint_render(model.get_value(model_iter, 0), attribute):
+        cell.set_property(name, value)
 
 TNS = collections.namedtuple("TNS", ["title", "attr", "properties", "sort_key_function"])
 
@@ -1033,6 +1901,39 @@ class PaintListView(tlview.View, actions.CAGandUIManager, dialogue.AskerMixin):
         self.connect("button-press-event", self._row_clicked_cb)
         actions.CAGandUIManager.__init__(self, selection=self.get_selection(), popup="/paint_list_popup")
         self.action_groups.update_condns(actions.MaskedCondns(0, self.AC_CLICKED_ON_ROW))
+        self._setup_column_sorting()
+    def _setup_column_sorting(self):
+        """
+        Sort the paint attribute columns (which always come last) when
+        their header is clicked using the model's precomputed sort keys
+        rather than Gtk.TreeSortable's comparison function calls
+        """
+        self.__sort_column = None
+        model = self.get_model()
+        columns = self.get_columns()
+        columns = columns[len(columns) - len(model.COLUMN_DEFS):]
+        for index, column in enumerate(columns):
+            column.set_sort_column_id(-1)
+            column.set_clickable(True)
+            column.connect("clicked", self._column_clicked_cb, index)
+        if isinstance(model, Gtk.TreeSortable):
+            # any other columns are still sorted by Gtk
+            model.connect("sort-column-changed", self._sort_column_changed_cb)
+    def _sort_column_changed_cb(self, model):
+        if self.__sort_column is not None and model.get_sort_column_id()[0] is not None:
+            self.__sort_column.set_sort_indicator(False)
+            self.__sort_column = None
+    def _column_clicked_cb(self, column, index):
+        if self.__sort_column is column and column.get_sort_order() == Gtk.SortType.ASCENDING:
+            order = Gtk.SortType.DESCENDING
+        else:
+            order = Gtk.SortType.ASCENDING
+        if self.__sort_column is not None and self.__sort_column is not column:
+            self.__sort_column.set_sort_indicator(False)
+        self.__sort_column = column
+        column.set_sort_indicator(True)
+        column.set_sort_order(order)
+        self.get_model().sort_by_column(index, order)
     def populate_action_groups(self):
         """Populate action groups ready for UI initialization.
         """
@@ -1095,7 +1996,7 @@ def paint_characteristics_tns_list(paint, index=0):
         def get_row_attr(self, row):
             paint = row[index]
             return (getattr(paint, self.name), paint.name)
-    return [TNS(pchar.cell_column_header(name), name, {}, Dummy(name).get_row_attr) for name in names]
+    return [TNS(gpchar.cell_column_header(name), name, {}, Dummy(name).get_row_attr) for name in names]
 
 def paint_extras_tns_list(paint, index=0):
     return [TNS(extra.prompt_text[:-1], extra.name, {"resizable" : True, "expand" : True}, lambda row: getattr(row[index], extra.name)) for extra in paint.EXTRAS]
@@ -1121,6 +2022,12 @@ class PaintListNotebook(HueWheelNotebook):
     def add_paint(self, new_paint):
         HueWheelNotebook.add_paint(self, new_paint)
         self.paint_list.get_model().append_paint(new_paint)
+    def update_paint(self, paint):
+        """
+        Update the display of a paint whose data has been changed in place
+        """
+        HueWheelNotebook.update_paint(self, paint)
+        self.paint_list.get_model().update_paint(paint)
     def remove_paint(self, paint):
         # "paint_removed" callback will get the wheels
         self.paint_list.get_model().remove_paint(paint)
@@ -1148,13 +2055,13 @@ class RGBEntryBox(Gtk.HBox):
     RGB = rgbh.RGB16
     def __init__(self, initial_colour=vpaint.BLACK):
         Gtk.HBox.__init__(self)
-        self.red = buttons.HexSpinButton(self.RGB.ONE, coloured.ColouredLabel(_("Red"), self.RGB.RED.gdk_color))
+        self.red = buttons.HexSpinButton(self.RGB.ONE, coloured.ColouredLabel(_("Red"), grgbh.gdk_color(self.RGB.RED)))
         self.red.connect("value-changed", self._spinners_changed_cb)
         self.pack_start(self.red, expand=True, fill=True, padding=0)
-        self.green = buttons.HexSpinButton(self.RGB.ONE, coloured.ColouredLabel(_("Green"), self.RGB.GREEN.gdk_color))
+        self.green = buttons.HexSpinButton(self.RGB.ONE, coloured.ColouredLabel(_("Green"), grgbh.gdk_color(self.RGB.GREEN)))
         self.green.connect("value-changed", self._spinners_changed_cb)
         self.pack_start(self.green, expand=True, fill=True, padding=0)
-        self.blue = buttons.HexSpinButton(self.RGB.ONE, coloured.ColouredLabel(_("Blue"), self.RGB.BLUE.gdk_color))
+        self.blue = buttons.HexSpinButton(self.RGB.ONE, coloured.ColouredLabel(_("Blue"), grgbh.gdk_color(self.RGB.BLUE)))
         self.blue.connect("value-changed", self._spinners_changed_cb)
         self.pack_start(self.blue, expand=True, fill=True, padding=0)
         self.set_colour(initial_colour)
@@ -1176,5 +2083,76 @@ class RGBEntryBox(Gtk.HBox):
                 self.red.entry.grab_focus()
 GObject.signal_new("colour-changed", RGBEntryBox, GObject.SignalFlags.RUN_LAST, None, ())
 
+class TimingStatisticsWindow(Gtk.Window):
+    """
+    A top level window showing the live timing statistics of the
+    instrumented code paths (see ptiming)
+    """
+    REFRESH_INTERVAL = 1000
+    COLUMNS = [
+        (_("Code Path"), "name", 1.0),
+        (_("Calls"), "count", 1),
+        (_("Total (ms)"), "total", 1000.0),
+        (_("Mean (ms)"), "mean", 1000.0),
+        (_("Median (ms)"), "p50", 1000.0),
+        (_("95% (ms)"), "p95", 1000.0),
+        (_("Max (ms)"), "max", 1000.0),
+    ]
+    def __init__(self, parent=None):
+        Gtk.Window.__init__(self, Gtk.WindowType.TOPLEVEL)
+        self.set_title(_("Timing Statistics"))
+        self.set_default_size(640, 320)
+        self.set_transient_for(parent)
+        self.store = Gtk.ListStore(str, int, float, float, float, float, float)
+        view = Gtk.TreeView(self.store)
+        for index, (title, _key, _scale) in enumerate(self.COLUMNS):
+            renderer = Gtk.CellRendererText()
+            column = Gtk.TreeViewColumn(title, renderer, text=index)
+            if index > 1:
+                column.set_cell_data_func(renderer, self._ms_cell_data_func, index)
+            column.set_sort_column_id(index)
+            view.append_column(column)
+        scrolled_window = Gtk.ScrolledWindow()
+        scrolled_window.add(view)
+        vbox = Gtk.VBox()
+        if not ptiming.ENABLED:
+            vbox.pack_start(Gtk.Label(_("Timing is disabled: set {} to the file for the statistics at exit (\"-\" for standard error).").format(ptiming.ENV_VAR)), expand=False, fill=True, padding=0)
+        vbox.pack_start(scrolled_window, expand=True, fill=True, padding=0)
+        hbox = Gtk.HBox()
+        reset_button = Gtk.Button.new_with_label(_("Reset"))
+        reset_button.connect("clicked", lambda _button: self._reset())
+        hbox.pack_end(reset_button, expand=False, fill=True, padding=0)
+        vbox.pack_start(hbox, expand=False, fill=True, padding=0)
+        self.add(vbox)
+        self._refresh()
+        self.__timeout_id = GLib.timeout_add(self.REFRESH_INTERVAL, self._refresh)
+        self.connect("destroy", lambda _widget: GLib.source_remove(self.__timeout_id))
+        self.show_all()
+    @staticmethod
+    def _ms_cell_data_func(column, cell, model, model_iter, index):
+        cell.set_property("text", "{:.3f}".format(model.get_value(model_iter, index)))
+    def _refresh(self):
+        # update rows in place so that the view's sort and scroll position are kept
+        rows = {row[0]: row.iter for row in self.store}
+        for statistics in ptiming.snapshot():
+            values = [(statistics[key] or 0) * scale for _title, key, scale in self.COLUMNS[1:]]
+            values[0] = int(values[0])
+            model_iter = rows.get(statistics["name"], None)
+            if model_iter is None:
+                self.store.append([statistics["name"]] + values)
+            else:
+                self.store.set(model_iter, list(range(1, len(self.COLUMNS))), values)
+        return True
+    def _reset(self):
+        ptiming.reset()
+        self._refresh()
+
+actions.CLASS_INDEP_AGS[actions.AC_DONT_CARE].add_actions([
+    ("open_timing_statistics_window", None, _("Timing Statistics"), None,
+     _("Open a window showing the timing statistics of the instrumented code."),
+     lambda _action: TimingStatisticsWindow().show()
+    ),
+])
+
 if __name__ == "__main__":
     doctest.testmod()
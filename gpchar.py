@@ -0,0 +1,96 @@
+# Copyright: Peter Williams (2012) - All rights reserved
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Widgets for choosing paint characteristics not related to colour
+"""
+
+import collections
+
+from gi.repository import Gtk
+
+from . import pchar
+
+__all__ = []
+__author__ = "Peter Williams <pwil3058@gmail.com>"
+
+
+class MappedFloatChoice(Gtk.ComboBoxText):
+    MFDC = None
+    def __init__(self):
+        Gtk.ComboBoxText.__init__(self)
+        for choice in ("{0}\t- {1}".format(item[0], item[1]) for item in self.MFDC.MAP):
+            self.append_text(choice)
+    def get_selection(self):
+        index = self.get_active()
+        characteristic = self.MFDC.MAP[index if index >= 0 else None]
+        return self.MFDC(characteristic.abbrev)
+    def set_selection(self, mapped_float):
+        abbrev = str(mapped_float)
+        for index, characteristic in enumerate(self.MFDC.MAP):
+            if abbrev == characteristic.abbrev:
+                self.set_active(index if index is not None else -1)
+                return
+        raise pchar.BadMappedFloatValue(_("Invalid characteristic: {0}").format(mapped_float))
+
+
+class PermanenceChoice(MappedFloatChoice):
+    PROMPT_TEXT = _("Permanence:")
+    MFDC = pchar.Permanence
+
+
+class FinishChoice(MappedFloatChoice):
+    PROMPT_TEXT = _("Finish:")
+    MFDC = pchar.Finish
+
+
+class TransparencyChoice(MappedFloatChoice):
+    PROMPT_TEXT = _("Transparency:")
+    MFDC = pchar.Transparency
+
+
+class FluorescenceChoice(MappedFloatChoice):
+    PROMPT_TEXT = _("Fluorescence:")
+    MFDC = pchar.Fluorescence
+
+class MetallicChoice(MappedFloatChoice):
+    PROMPT_TEXT = _("Metallic:")
+    MFDC = pchar.Metallic
+
+CHARACTERISTIC_CHOOSERS = {
+    "permanence" : PermanenceChoice,
+    "finish" : FinishChoice,
+    "transparency" : TransparencyChoice,
+    "fluorescence" : FluorescenceChoice,
+    "metallic" : MetallicChoice
+}
+
+def cell_column_header(characteristic, length=2):
+    return "{}.".format(CHARACTERISTIC_CHOOSERS[characteristic].PROMPT_TEXT[0:length])
+
+class Choosers(collections.OrderedDict):
+    def __init__(self, names):
+        items = ((name, CHARACTERISTIC_CHOOSERS[name]()) for name in names)
+        collections.OrderedDict.__init__(self, items)
+    def set_selections(self, **kwargs):
+        for key, value in kwargs.items():
+            self[key].set_selection(value)
+    def get_kwargs(self):
+        return { key : str(value.get_selection()) for key, value in self.items()}
+    @property
+    def all_active(self):
+        for chooser in self.values():
+            if chooser.get_active() == -1:
+                return False
+        return True
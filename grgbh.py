@@ -0,0 +1,52 @@
+#  Copyright 2017 Peter Williams <pwil3058@gmail.com>
+#
+# This software is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License only.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software; if not, write to:
+#  The Free Software Foundation, Inc., 51 Franklin Street,
+#  Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Conversions of the (GTK free) colours of rgbh, and of anything with
+an rgb attribute such as hues, colours and paints, to Gdk types
+"""
+
+from gi.repository import Gdk
+
+from . import rgbh
+
+__all__ = []
+__author__ = "Peter Williams <pwil3058@gmail.com>"
+
+def _rgb(colour):
+    return colour if isinstance(colour, rgbh.RGBNG) else colour.rgb
+
+def gdk_color(colour):
+    rgb = _rgb(colour)
+    if rgb.BITS_PER_CHANNEL is None:
+        return Gdk.Color.from_floats(*rgb)
+    elif rgb.BITS_PER_CHANNEL == 16:
+        return Gdk.Color(*rgb)
+    else:
+        return Gdk.Color(*rgb.converted_to(rgbh.RGB16))
+
+def gdk_rgba(colour, alpha=1.0):
+    rgbpn = _rgb(colour).converted_to(rgbh.RGBPN)
+    return Gdk.RGBA(red=rgbpn.red, green=rgbpn.green, blue=rgbpn.blue, alpha=alpha)
+
+def best_foreground_gdk_color(colour, threshold=0.5):
+    if _rgb(colour).best_foreground_is_black(threshold):
+        return Gdk.Color(0, 0, 0)
+    return Gdk.Color(rgbh.BPC16.ONE, rgbh.BPC16.ONE, rgbh.BPC16.ONE)
+
+def best_foreground_gdk_rgba(colour, threshold=0.5):
+    if _rgb(colour).best_foreground_is_black(threshold):
+        return Gdk.RGBA(0.0, 0.0, 0.0, 1.0)
+    return Gdk.RGBA(1.0, 1.0, 1.0)
@@ -0,0 +1,208 @@
+#  Copyright 2017 Peter Williams <pwil3058@gmail.com>
+#
+# This software is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License only.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software; if not, write to:
+#  The Free Software Foundation, Inc., 51 Franklin Street,
+#  Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Headless batch matching of a directory of paint sample photographs
+into a paint series definition
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import csv
+import importlib
+import os
+import sys
+
+import gi
+gi.require_version("GdkPixbuf", "2.0")
+from gi.repository import GdkPixbuf
+from gi.repository import GLib
+
+from . import psample
+
+__all__ = []
+__author__ = "Peter Williams <pwil3058@gmail.com>"
+
+IMAGE_EXTENSIONS = {".bmp", ".gif", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp"}
+
+MappedName = collections.namedtuple("MappedName", ["name", "kwargs"])
+
+def read_name_mapping(filepath):
+    """Read a CSV file, with a header row, mapping image file names
+    (column "file") to paint names (column "name"). Any other columns
+    give the paint's characteristics and extras.
+    """
+    mapping = collections.OrderedDict()
+    with open(filepath, newline="") as fobj:
+        reader = csv.DictReader(fobj)
+        if reader.fieldnames is None or "file" not in reader.fieldnames or "name" not in reader.fieldnames:
+            raise ValueError(_("{}: mapping must have \"file\" and \"name\" columns.").format(filepath))
+        for row in reader:
+            kwargs = {key: value for key, value in row.items() if key not in ("file", "name") and value}
+            mapping[row["file"].strip()] = MappedName(row["name"].strip(), kwargs)
+    return mapping
+
+def iter_image_files(dirpath):
+    for entry in sorted(os.listdir(dirpath)):
+        if os.path.splitext(entry)[1].lower() in IMAGE_EXTENSIONS:
+            yield entry
+
+def white_balance_arg(text):
+    try:
+        return psample.WhiteBalance.fm_string(text)
+    except ValueError as edata:
+        raise argparse.ArgumentTypeError(str(edata))
+
+def match_image_file(filepath, estimator_id, max_size=1024):
+    """Return the colour (channels as fractions of full scale) of the
+    sample in the named image file. Only a reduced size copy of the
+    image is decoded so memory use is bounded whatever the file size.
+    """
+    _format, width, height = GdkPixbuf.Pixbuf.get_file_info(filepath)
+    size = min(max_size, max(width, height, 1))
+    pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(filepath, size, size, True)
+    stats = psample.SampleStatistics.fm_pixels(psample.PixelBuffer.fm_pixbuf(pixbuf))
+    return psample.ESTIMATORS[estimator_id][1](stats)
+
+def iter_matches(files, estimator_id, max_workers=None):
+    """Match the (key, filepath) image files on a process pool yielding
+    (key, colour, error) triples as they complete. No more than a few jobs
+    per worker are in flight at any time. A failure to match a file
+    (whatever the exception) is reported as that file's error.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        max_pending = 4 * max_workers
+        files = iter(files)
+        pending = {}
+        while True:
+            for key, filepath in files:
+                pending[executor.submit(match_image_file, filepath, estimator_id)] = key
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+            done, _not_done = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                key = pending.pop(future)
+                try:
+                    yield (key, future.result(), None)
+                except Exception as edata:
+                    yield (key, None, edata)
+
+def paint_names(file_names, mapping):
+    """Return the paint name and keyword arguments for each of the
+    file names and the errors for the files whose paint name has
+    already been used by an earlier file
+    """
+    names = collections.OrderedDict()
+    errors = collections.OrderedDict()
+    first_users = {}
+    for file_name in file_names:
+        if mapping is None:
+            name, kwargs = os.path.splitext(file_name)[0], {}
+        else:
+            name, kwargs = mapping[file_name]
+        if name in first_users:
+            errors[file_name] = _("paint name \"{}\" is already used for {}").format(name, first_users[name])
+        else:
+            first_users[name] = file_name
+            names[file_name] = MappedName(name, kwargs)
+    return names, errors
+
+def import_class(spec):
+    """Return the class named by a "module:ClassName" specification
+    """
+    module_name, _sep, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+def main(series_class=None, paint_class=None, argv=None):
+    """Match a directory of sample images and write the resulting
+    paint series definition. Applications pass their own series and
+    paint classes (otherwise they must be named on the command line).
+    """
+    parser = argparse.ArgumentParser(description=_("Auto match a directory of paint sample images into a paint series definition."))
+    parser.add_argument("directory", help=_("directory containing the sample images"))
+    parser.add_argument("--mapping", help=_("CSV file mapping image files to paint names (and characteristics)"))
+    parser.add_argument("--maker", required=True, help=_("manufacturer of the series"))
+    parser.add_argument("--series", required=True, help=_("name of the series"))
+    parser.add_argument("--output", "-o", help=_("file to write the series definition to (default: standard output)"))
+    parser.add_argument("--estimator", choices=list(psample.ESTIMATORS), default="mean", help=_("statistic used to derive each sample's colour"))
+    parser.add_argument("--max-chroma", action="store_true", help=_("adjust the matched colours to minimise greyness"))
+    white_balance = parser.add_mutually_exclusive_group()
+    white_balance.add_argument("--white-balance", type=white_balance_arg, metavar="R,G,B", help=_("per channel gains correcting the colour of the lighting (as shown by the editor)"))
+    white_balance.add_argument("--grey-card", metavar="IMAGE", help=_("image of a neutral grey (or white) card photographed under the same lighting"))
+    parser.add_argument("--jobs", "-j", type=int, default=None, help=_("number of worker processes"))
+    parser.add_argument("--quiet", "-q", action="store_true", help=_("don't report progress"))
+    if series_class is None:
+        parser.add_argument("--series-class", required=True, help=_("paint series class as module:ClassName"))
+    if paint_class is None:
+        parser.add_argument("--paint-class", required=True, help=_("paint class as module:ClassName"))
+    args = parser.parse_args(argv)
+    if series_class is None:
+        series_class = import_class(args.series_class)
+    if paint_class is None:
+        paint_class = import_class(args.paint_class)
+    mapping = read_name_mapping(args.mapping) if args.mapping else None
+    if mapping is None:
+        file_names = list(iter_image_files(args.directory))
+    else:
+        file_names = [file_name for file_name in mapping if os.path.isfile(os.path.join(args.directory, file_name))]
+        for file_name in mapping:
+            if file_name not in file_names:
+                sys.stderr.write(_("{}: mapped file not found.\n").format(file_name))
+    if args.grey_card:
+        args.white_balance = psample.WhiteBalance()
+        try:
+            args.white_balance.set_fm_neutral(match_image_file(args.grey_card, "median"))
+        except (GLib.GError, ValueError) as edata:
+            parser.error("{}: {}".format(args.grey_card, edata))
+    elif args.white_balance is None:
+        args.white_balance = psample.WhiteBalance()
+    RGB = paint_class.COLOUR.RGB
+    names, duplicates = paint_names(file_names, mapping)
+    paints = []
+    nfailed = len(duplicates)
+    for file_name, error in duplicates.items():
+        sys.stderr.write(_("{}: {}\n").format(file_name, error))
+    # the mapping's file names may be paths relative to the directory
+    files = ((file_name, os.path.join(args.directory, file_name)) for file_name in names)
+    for count, (file_name, colour, error) in enumerate(iter_matches(files, args.estimator, args.jobs), 1):
+        name, kwargs = names[file_name]
+        if error is None:
+            try:
+                rgb = RGB(*(RGB.ROUND(value * RGB.ONE) for value in args.white_balance.apply(colour)))
+                if args.max_chroma:
+                    rgb = paint_class.COLOUR(rgb).hue_rgb_for_value()
+                paints.append(paint_class(name=name, rgb=rgb, **kwargs))
+            except Exception as edata:
+                error = edata
+        if error is not None:
+            nfailed += 1
+            sys.stderr.write(_("[{}/{}] {}: failed: {}\n").format(count, len(names), file_name, error))
+        elif not args.quiet:
+            sys.stderr.write("[{}/{}] {}: {}\n".format(count, len(names), file_name, name))
+    series = series_class(maker=args.maker, name=args.series, paints=paints)
+    if args.output:
+        with open(args.output, "w") as fobj:
+            fobj.write(series.definition_text())
+    else:
+        sys.stdout.write(series.definition_text())
+    return 1 if nfailed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
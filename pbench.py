@@ -0,0 +1,281 @@
+#  Copyright 2017 Peter Williams <pwil3058@gmail.com>
+#
+# This software is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License only.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software; if not, write to:
+#  The Free Software Foundation, Inc., 51 Franklin Street,
+#  Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Benchmarks of the package's hot paths using reproducible synthetic
+fixtures. Results are written as JSON so that runs can be compared.
+Benchmarks of widgets are skipped if GTK can't be initialised.
+"""
+
+import argparse
+import collections
+import functools
+import json
+import platform
+import random
+import re
+import statistics
+import sys
+import time
+
+from . import pchar
+from . import psample
+from . import rgbh
+from . import vpaint
+
+__all__ = []
+__author__ = "Peter Williams <pwil3058@gmail.com>"
+
+PAINT_COUNTS = (1000, 10000, 100000)
+IMAGE_SIZES = (256, 1024, 2048)
+SEED = 20170101
+
+class BenchCharacteristics(pchar.Characteristics):
+    NAMES = ("transparency", "permanence")
+
+class BenchPaint(vpaint.Paint):
+    COLOUR = vpaint.HCVW
+    CHARACTERISTICS = BenchCharacteristics
+
+class BenchMixture(vpaint.Mixture):
+    PAINT = BenchPaint
+
+class BenchSeries(vpaint.PaintSeries):
+    PAINT_SPEC_RE = re.compile(r"^PaintSpec(\(.*\))\s*$")
+    @classmethod
+    def paints_fm_definition(cls, lines):
+        paints = []
+        for line in lines:
+            match = cls.PAINT_SPEC_RE.match(line)
+            if not match:
+                raise cls.ParseError(_("Badly formed paint specification: {}").format(line))
+            paints.append(eval("BenchPaint" + match.group(1), {"BenchPaint": BenchPaint, "RGB16": rgbh.RGB16}))
+        return paints
+
+@functools.lru_cache(maxsize=None)
+def make_rgbs(count):
+    rng = random.Random(SEED)
+    return [rgbh.RGB16(*(rng.randrange(rgbh.RGB16.ONE + 1) for _i in range(3))) for _n in range(count)]
+
+@functools.lru_cache(maxsize=None)
+def make_paints(count):
+    rng = random.Random(SEED)
+    transparencies = [c.abbrev for c in pchar.Transparency.MAP]
+    permanences = [c.abbrev for c in pchar.Permanence.MAP]
+    return [BenchPaint("Paint {:06d}".format(index), rgb, transparency=rng.choice(transparencies), permanence=rng.choice(permanences)) for index, rgb in enumerate(make_rgbs(count))]
+
+@functools.lru_cache(maxsize=None)
+def make_definition(count):
+    return BenchSeries(maker="Bench", name="Synthetic {}".format(count), paints=make_paints(count)).definition_text()
+
+@functools.lru_cache(maxsize=None)
+def make_pixels(size):
+    rng = random.Random(SEED)
+    # a noisy colour so that every estimator has some work to do
+    base = bytes(rng.randrange(64, 192) for _i in range(3)) * (size * size)
+    noise = bytes(rng.randrange(64) for _i in range(size * 3))
+    data = bytes(a ^ b for a, b in zip(base, noise * size))
+    return psample.PixelBuffer(data=data, width=size, height=size, rowstride=size * 3, n_channels=3, bits_per_sample=8)
+
+# Each benchmark's setup(param) does the untimed preparation for one
+# run and returns the function whose execution is timed.
+Benchmark = collections.namedtuple("Benchmark", ["name", "params", "needs_gui", "setup"])
+
+def hcvw_construction(count):
+    rgbs = make_rgbs(count)
+    return lambda: [vpaint.HCVW(rgb) for rgb in rgbs]
+
+def series_fm_definition(count):
+    text = make_definition(count)
+    return lambda: BenchSeries.fm_definition(text)
+
+def series_definition_text(count):
+    series = BenchSeries.fm_definition(make_definition(count))
+    return series.definition_text
+
+def mixture_creation(count):
+    paints = make_paints(count)
+    rng = random.Random(SEED)
+    blob_lists = [[vpaint.BLOB(paint, rng.randrange(1, 10)) for paint in rng.sample(paints, 3)] for _n in range(count // 10)]
+    return lambda: [BenchMixture(blobs) for blobs in blob_lists]
+
+def _paint_list_store(count):
+    from . import gpaint
+    store = gpaint.PaintListStore()
+    store.set_paints(make_paints(count))
+    return store
+
+def paint_list_store_lookup(count):
+    store = _paint_list_store(count)
+    names = [paint.name for paint in make_paints(count)[::max(1, count // 10000)]]
+    return lambda: [store.get_paint_with_name(name) for name in names]
+
+def paint_list_store_removal(count):
+    store = _paint_list_store(count)
+    paints = make_paints(count)[::10]
+    return lambda: store.remove_paints(paints)
+
+@functools.lru_cache(maxsize=None)
+def _colour_wheel_model(count):
+    from . import gpaint
+    model = gpaint.ColourWheelModel()
+    for paint in make_paints(count):
+        model.add_paint(paint)
+    return model
+
+def _colour_wheel(count, size=600):
+    # a new wheel (sharing the model) has none of its caches populated
+    import cairo
+    from gi.repository import Gdk
+    from . import gpaint
+    wheel = gpaint.HueChromaWheel(model=_colour_wheel_model(count))
+    rectangle = Gdk.Rectangle()
+    rectangle.x, rectangle.y, rectangle.width, rectangle.height = 0, 0, size, size
+    wheel.size_allocate(rectangle)
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, size, size)
+    return (wheel, cairo.Context(surface))
+
+def colour_wheel_expose_cold(count):
+    wheel, cairo_ctxt = _colour_wheel(count)
+    return lambda: wheel.expose_cb(wheel, cairo_ctxt)
+
+def colour_wheel_expose_warm(count):
+    wheel, cairo_ctxt = _colour_wheel(count)
+    wheel.expose_cb(wheel, cairo_ctxt)
+    return lambda: wheel.expose_cb(wheel, cairo_ctxt)
+
+def colour_wheel_nearest_to_xy(count, npoints=1000):
+    wheel, cairo_ctxt = _colour_wheel(count)
+    wheel.expose_cb(wheel, cairo_ctxt)
+    rng = random.Random(SEED)
+    xys = [(rng.uniform(0, 600), rng.uniform(0, 600)) for _n in range(npoints)]
+    return lambda: [wheel.get_colour_nearest_to_xy(x, y) for x, y in xys]
+
+def auto_match_sample(size):
+    from . import pedit
+    class BenchMatcher(pedit.ColourSampleMatcher):
+        COLOUR = vpaint.HCVW
+    matcher = BenchMatcher()
+    pixels = make_pixels(size)
+    return lambda: matcher._auto_match_sample(psample.SampleStatistics.fm_pixels(pixels), raw=False)
+
+BENCHMARKS = [
+    Benchmark("hcvw_construction", PAINT_COUNTS, False, hcvw_construction),
+    Benchmark("series_fm_definition", PAINT_COUNTS, False, series_fm_definition),
+    Benchmark("series_definition_text", PAINT_COUNTS, False, series_definition_text),
+    Benchmark("mixture_creation", PAINT_COUNTS, False, mixture_creation),
+    Benchmark("paint_list_store_lookup", PAINT_COUNTS, True, paint_list_store_lookup),
+    Benchmark("paint_list_store_removal", PAINT_COUNTS, True, paint_list_store_removal),
+    Benchmark("colour_wheel_expose_cold", PAINT_COUNTS, True, colour_wheel_expose_cold),
+    Benchmark("colour_wheel_expose_warm", PAINT_COUNTS, True, colour_wheel_expose_warm),
+    Benchmark("colour_wheel_nearest_to_xy", PAINT_COUNTS, True, colour_wheel_nearest_to_xy),
+    Benchmark("auto_match_sample", IMAGE_SIZES, True, auto_match_sample),
+]
+
+def gui_available():
+    """Return whether GTK can be initialised (i.e. there's a display)
+    """
+    try:
+        from gi.repository import Gtk
+    except (ImportError, ValueError):
+        return False
+    return Gtk.init_check(sys.argv[:1])[0]
+
+def time_benchmark(benchmark, param, repeat):
+    """Return the times (in seconds) of repeat runs of benchmark with
+    param (each run after its own untimed setup)
+    """
+    times = []
+    for _n in range(repeat):
+        func = benchmark.setup(param)
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+def run_benchmarks(benchmarks, params_filter=None, repeat=5, report=None):
+    results = collections.OrderedDict()
+    have_gui = any(benchmark.needs_gui for benchmark in benchmarks) and gui_available()
+    for benchmark in benchmarks:
+        results[benchmark.name] = collections.OrderedDict()
+        for param in benchmark.params:
+            if params_filter is not None and param not in params_filter:
+                continue
+            if benchmark.needs_gui and not have_gui:
+                result = {"skipped": "GTK unavailable"}
+            else:
+                times = time_benchmark(benchmark, param, repeat)
+                result = {"min": min(times), "median": statistics.median(times), "mean": statistics.mean(times), "times": times}
+            results[benchmark.name][str(param)] = result
+            if report is not None:
+                report(benchmark.name, param, result)
+    return results
+
+def compare_results(baseline, current, threshold=0.1):
+    """Return lines comparing the (minimum) times of current results
+    with those of a baseline flagging changes bigger than threshold
+    """
+    lines = []
+    for name, by_param in current["results"].items():
+        for param, result in by_param.items():
+            base = baseline["results"].get(name, {}).get(param, None)
+            if base is None or "min" not in base or "min" not in result:
+                continue
+            ratio = result["min"] / base["min"] if base["min"] else float("inf")
+            flag = "SLOWER" if ratio > 1.0 + threshold else "faster" if ratio < 1.0 - threshold else ""
+            lines.append("{:<28} {:>8} {:>10.4f} {:>10.4f} {:>7.2f}x {}".format(name, param, base["min"], result["min"], ratio, flag))
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=_("Benchmark the paint model and widgets with synthetic fixtures."))
+    parser.add_argument("--output", "-o", help=_("file to write the results (JSON) to"))
+    parser.add_argument("--compare", metavar="BASELINE", help=_("earlier results (JSON) to compare these with"))
+    parser.add_argument("--only", metavar="REGEX", help=_("only run benchmarks whose names match"))
+    parser.add_argument("--sizes", type=lambda text: [int(item) for item in text.split(",")], help=_("only use these fixture sizes (comma separated)"))
+    parser.add_argument("--repeat", "-r", type=int, default=5, help=_("number of timed runs of each benchmark"))
+    parser.add_argument("--quiet", "-q", action="store_true", help=_("don't report progress"))
+    args = parser.parse_args(argv)
+    benchmarks = [benchmark for benchmark in BENCHMARKS if args.only is None or re.search(args.only, benchmark.name)]
+    def report(name, param, result):
+        if "skipped" in result:
+            sys.stderr.write("{:<28} {:>8} skipped: {}\n".format(name, param, result["skipped"]))
+        else:
+            sys.stderr.write("{:<28} {:>8} min {:.4f}s median {:.4f}s\n".format(name, param, result["min"], result["median"]))
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "seed": SEED,
+        },
+        "results": run_benchmarks(benchmarks, args.sizes, args.repeat, None if args.quiet else report),
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as fobj:
+            fobj.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+    if args.compare:
+        with open(args.compare) as fobj:
+            baseline = json.load(fobj)
+        sys.stderr.write("{:<28} {:>8} {:>10} {:>10} {:>8}\n".format(_("benchmark"), _("size"), _("baseline"), _("current"), _("ratio")))
+        for line in compare_results(baseline, results):
+            sys.stderr.write(line + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
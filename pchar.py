@@ -18,8 +18,6 @@
 
 import collections
 
-from gi.repository import Gtk
-
 __all__ = []
 __author__ = "Peter Williams <pwil3058@gmail.com>"
 
@@ -85,25 +83,6 @@ class MappedFloat:
         return self.val != other.val
 
 
-class MappedFloatChoice(Gtk.ComboBoxText):
-    MFDC = None
-    def __init__(self):
-        Gtk.ComboBoxText.__init__(self)
-        for choice in ("{0}\t- {1}".format(item[0], item[1]) for item in self.MFDC.MAP):
-            self.append_text(choice)
-    def get_selection(self):
-        index = self.get_active()
-        characteristic = self.MFDC.MAP[index if index >= 0 else None]
-        return self.MFDC(characteristic.abbrev)
-    def set_selection(self, mapped_float):
-        abbrev = str(mapped_float)
-        for index, characteristic in enumerate(self.MFDC.MAP):
-            if abbrev == characteristic.abbrev:
-                self.set_active(index if index is not None else -1)
-                return
-        raise BadMappedFloatValue(_("Invalid characteristic: {0}").format(mapped_float))
-
-
 class Permanence(MappedFloat):
     MAP = (
             CHARACTERISTIC("AA", _("Extremely Permanent"), 4.0),
@@ -113,11 +92,6 @@ class Permanence(MappedFloat):
         )
 
 
-class PermanenceChoice(MappedFloatChoice):
-    PROMPT_TEXT = _("Permanence:")
-    MFDC = Permanence
-
-
 class Finish(MappedFloat):
     MAP = (
             CHARACTERISTIC("G", _("Gloss"), 4.0),
@@ -127,11 +101,6 @@ class Finish(MappedFloat):
         )
 
 
-class FinishChoice(MappedFloatChoice):
-    PROMPT_TEXT = _("Finish:")
-    MFDC = Finish
-
-
 class Transparency(MappedFloat):
     MAP = (
             CHARACTERISTIC("O", _("Opaque"), 1.0),
@@ -145,11 +114,6 @@ class Transparency(MappedFloat):
         return (5.0 - self.val) / 4.0
 
 
-class TransparencyChoice(MappedFloatChoice):
-    PROMPT_TEXT = _("Transparency:")
-    MFDC = Transparency
-
-
 class Fluorescence(MappedFloat):
     MAP = (
         CHARACTERISTIC("NF", _("Nonfluorescent"), 1.0),
@@ -158,10 +122,6 @@ class Fluorescence(MappedFloat):
         CHARACTERISTIC("Fl", _("Fluorescent"), 4.0),
     )
 
-class FluorescenceChoice(MappedFloatChoice):
-    PROMPT_TEXT = _("Fluorescence:")
-    MFDC = Fluorescence
-
 class Metallic(MappedFloat):
     MAP = (
         CHARACTERISTIC("NM", _("Non-metallic"), 1.0),
@@ -170,21 +130,14 @@ class Metallic(MappedFloat):
         CHARACTERISTIC("Ml", _("Metal"), 4.0),
     )
 
-class MetallicChoice(MappedFloatChoice):
-    PROMPT_TEXT = _("Metallic:")
-    MFDC = Metallic
-
-CHARACTERISTIC_CHOOSERS = {
-    "permanence" : PermanenceChoice,
-    "finish" : FinishChoice,
-    "transparency" : TransparencyChoice,
-    "fluorescence" : FluorescenceChoice,
-    "metallic" : MetallicChoice
+CHARACTERISTICS = {
+    "permanence" : Permanence,
+    "finish" : Finish,
+    "transparency" : Transparency,
+    "fluorescence" : Fluorescence,
+    "metallic" : Metallic
 }
 
-def cell_column_header(characteristic, length=2):
-    return "{}.".format(CHARACTERISTIC_CHOOSERS[characteristic].PROMPT_TEXT[0:length])
-
 class Characteristics:
     NAMES = list()
     def __init__(self, **kwargs):
@@ -194,10 +147,10 @@ class Characteristics:
                 setattr(self, name, kwargs[name])
         else:
             for name in self.NAMES:
-                self.__dict__[name] = CHARACTERISTIC_CHOOSERS[name].MFDC()
+                self.__dict__[name] = CHARACTERISTICS[name]()
     def __setattr__(self, attr_name, value):
         assert attr_name in self.NAMES, "{}: Unknown characteristic".format(attr_name)
-        mfdc = CHARACTERISTIC_CHOOSERS[attr_name].MFDC
+        mfdc = CHARACTERISTICS[attr_name]
         self.__dict__[attr_name] = value if isinstance(value, mfdc) else mfdc(value)
     def __iter__(self):
         return (getattr(self, name) for name in self.NAMES)
@@ -228,18 +181,16 @@ class Characteristics:
     def get_kwargs(self):
         return { name : str(getattr(self, name)) for name in self.NAMES}
 
-class Choosers(collections.OrderedDict):
-    def __init__(self, names):
-        items = ((name, CHARACTERISTIC_CHOOSERS[name]()) for name in names)
-        collections.OrderedDict.__init__(self, items)
-    def set_selections(self, **kwargs):
-        for key, value in kwargs.items():
-            self[key].set_selection(value)
-    def get_kwargs(self):
-        return { key : str(value.get_selection()) for key, value in self.items()}
-    @property
-    def all_active(self):
-        for chooser in self.values():
-            if chooser.get_active() == -1:
-                return False
-        return True
+# The chooser widgets are in gpchar (so that this module doesn't need
+# GTK) but can still be found here by existing users.
+_GPCHAR_NAMES = {
+    "MappedFloatChoice", "PermanenceChoice", "FinishChoice", "TransparencyChoice",
+    "FluorescenceChoice", "MetallicChoice", "CHARACTERISTIC_CHOOSERS", "Choosers",
+    "cell_column_header",
+}
+
+def __getattr__(attr_name):
+    if attr_name in _GPCHAR_NAMES:
+        from . import gpchar
+        return getattr(gpchar, attr_name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, attr_name))
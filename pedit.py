@@ -39,11 +39,13 @@ from ..gtx import icons
 from ..gtx import recollect
 from ..gtx import screen
 
-from ..pixbufx import iview
-
 from . import gpaint
+from . import gpchar
+from . import grgbh
 from . import lexicon
-from . import pchar
+from . import pimage
+from . import psample
+from . import ptiming
 from . import rgbh
 from . import vpaint
 
@@ -52,6 +54,9 @@ from .. import APP_NAME
 __all__ = []
 __author__ = "Peter Williams <pwil3058@gmail.com>"
 
+# the correction for the lighting of samples lasts for the whole session
+SESSION_WHITE_BALANCE = psample.WhiteBalance()
+
 class UnsavedChangesDialogue(dialogue.Dialog):
     # TODO: make a better UnsavedChangesDialogue()
     SAVE_AND_CONTINUE, CONTINUE_UNSAVED = range(1, 3)
@@ -96,6 +101,109 @@ class UnaddedNewColourDialogue(dialogue.Dialog):
         self.vbox.pack_start(Gtk.Label(message), expand=True, fill=True, padding=0)
         self.show_all()
 
+class PaletteExtractionDialogue(dialogue.Dialog):
+    """Ask the user for an image file and the number of colours to
+    extract from it
+    """
+    def __init__(self, parent):
+        buttons = (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, Gtk.STOCK_OK, Gtk.ResponseType.OK)
+        dialogue.Dialog.__init__(self,
+            title=_("Extract Palette From Image"),
+            parent=parent,
+            flags=Gtk.DialogFlags.MODAL,
+            buttons=buttons,
+        )
+        self.file_chooser = Gtk.FileChooserButton.new(_("Image File"), Gtk.FileChooserAction.OPEN)
+        gff = Gtk.FileFilter()
+        gff.set_name(_("Image Files"))
+        gff.add_pixbuf_formats()
+        self.file_chooser.add_filter(gff)
+        last_samples_file = recollect.get("sample_viewer", "last_file")
+        if os.path.isfile(last_samples_file):
+            self.file_chooser.set_filename(last_samples_file)
+        self.ncolours = Gtk.SpinButton.new_with_range(2, 64, 1)
+        self.ncolours.set_value(12)
+        table = Gtk.Table(rows=2, columns=2, homogeneous=False)
+        table.attach(Gtk.Label(label=_("Image:")), 0, 1, 0, 1, xoptions=0)
+        table.attach(self.file_chooser, 1, 2, 0, 1)
+        table.attach(Gtk.Label(label=_("Colours:")), 0, 1, 1, 2, xoptions=0)
+        table.attach(self.ncolours, 1, 2, 1, 2)
+        self.vbox.pack_start(table, expand=True, fill=True, padding=0)
+        self.show_all()
+
+class SwatchCardDialogue(dialogue.Dialog):
+    """Ask the user for the layout of a swatch card and (optionally)
+    the names of its swatches
+    """
+    def __init__(self, parent):
+        buttons = (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, Gtk.STOCK_OK, Gtk.ResponseType.OK)
+        dialogue.Dialog.__init__(self,
+            title=_("Swatch Card Layout"),
+            parent=parent,
+            flags=Gtk.DialogFlags.MODAL,
+            buttons=buttons,
+        )
+        self.rows = Gtk.SpinButton.new_with_range(1, 100, 1)
+        self.cols = Gtk.SpinButton.new_with_range(1, 100, 1)
+        table = Gtk.Table(rows=2, columns=2, homogeneous=False)
+        table.attach(Gtk.Label(label=_("Rows:")), 0, 1, 0, 1, xoptions=0)
+        table.attach(self.rows, 1, 2, 0, 1)
+        table.attach(Gtk.Label(label=_("Columns:")), 0, 1, 1, 2, xoptions=0)
+        table.attach(self.cols, 1, 2, 1, 2)
+        self.vbox.pack_start(table, expand=False, fill=True, padding=0)
+        self.vbox.pack_start(Gtk.Label(label=_("Swatch names (one per line, row by row):")), expand=False, fill=True, padding=0)
+        self.names = Gtk.TextView()
+        scrolled_window = Gtk.ScrolledWindow()
+        scrolled_window.set_size_request(300, 200)
+        scrolled_window.add(self.names)
+        self.vbox.pack_start(scrolled_window, expand=True, fill=True, padding=0)
+        self.show_all()
+    def get_names(self):
+        buffer = self.names.get_buffer()
+        text = buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), False)
+        return [line.strip() for line in text.splitlines()]
+
+def extract_palette_fm_file(filepath, ncolours, progress):
+    """Return the (rgb, fraction) pairs of the palette of ncolours
+    colours found in the named image file (decoded at a reduced size)
+    or None if the file can't be read
+    """
+    _format, width, height = GdkPixbuf.Pixbuf.get_file_info(filepath)
+    size = min(1024, max(width, height, 1))
+    try:
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(filepath, size, size, True)
+    except GLib.GError:
+        return None
+    progress(0.25)
+    stats = psample.SampleStatistics.fm_pixels(psample.PixelBuffer.fm_pixbuf(pixbuf), progress=lambda fraction: progress(0.25 + fraction / 4))
+    return stats.palette(ncolours, progress=lambda fraction: progress(0.5 + fraction / 2))
+
+SWATCH_MIN_CELL_SIZE = 32
+
+def swatch_card_statistics(image, corners, rows, cols, progress):
+    """Return the statistics of the swatches of the rows x cols swatch
+    card whose corners (in image coordinates) are given. The image is
+    sampled at the coarsest level at which the smallest swatch is still
+    SWATCH_MIN_CELL_SIZE pixels across (decoding it here on the worker
+    thread if the viewer doesn't have that level to hand).
+    """
+    (x00, y00), (x10, y10), (x11, y11), (x01, y01) = corners
+    min_cell_size = min(
+        math.hypot(x10 - x00, y10 - y00) / cols,
+        math.hypot(x11 - x01, y11 - y01) / cols,
+        math.hypot(x01 - x00, y01 - y00) / rows,
+        math.hypot(x11 - x10, y11 - y10) / rows
+    )
+    level = 0
+    while level < image.max_level and min_cell_size / (2 << level) >= SWATCH_MIN_CELL_SIZE:
+        level += 1
+    pixbuf = image.get_level(level)
+    if pixbuf is None:
+        pixbuf = image.decode_level(level)
+    scale = pixbuf.get_width() / image.width
+    corners = [(x * scale, y * scale) for x, y in corners]
+    return psample.grid_cell_statistics(psample.PixelBuffer.fm_pixbuf(pixbuf), corners, rows, cols, progress=progress)
+
 class ColourSampleMatcher(Gtk.VBox):
     COLOUR = None
     HUE_DISPLAY_SPAN =  math.pi / 10
@@ -115,7 +223,7 @@ class ColourSampleMatcher(Gtk.VBox):
                 new_colour = colour.get_rotated_rgb(ColourSampleMatcher.HUE_DISPLAY_SPAN)
             else:
                 new_colour = colour.get_rotated_rgb(-ColourSampleMatcher.HUE_DISPLAY_SPAN)
-            coloured.ColouredButton.set_colour(self, new_colour.gdk_color)
+            coloured.ColouredButton.set_colour(self, grgbh.gdk_color(new_colour))
 
     class HueAntiClockwiseButton(coloured.ColouredButton):
         def __init__(self):
@@ -125,40 +233,52 @@ class ColourSampleMatcher(Gtk.VBox):
                 new_colour = colour.get_rotated_rgb(-ColourSampleMatcher.HUE_DISPLAY_SPAN)
             else:
                 new_colour = colour.get_rotated_rgb(ColourSampleMatcher.HUE_DISPLAY_SPAN)
-            coloured.ColouredButton.set_colour(self, new_colour.gdk_color)
+            coloured.ColouredButton.set_colour(self, grgbh.gdk_color(new_colour))
 
     class IncrValueButton(coloured.ColouredButton):
         def __init__(self):
             coloured.ColouredButton.__init__(self, label=_("Value")+"++")
         def set_colour(self, colour):
             value = min(colour.value + ColourSampleMatcher.VALUE_DISPLAY_INCR, fractions.Fraction(1))
-            coloured.ColouredButton.set_colour(self, colour.hue_rgb_for_value(value).gdk_color)
+            coloured.ColouredButton.set_colour(self, grgbh.gdk_color(colour.hue_rgb_for_value(value)))
 
     class DecrValueButton(coloured.ColouredButton):
         def __init__(self):
             coloured.ColouredButton.__init__(self, label=_("Value")+"--")
         def set_colour(self, colour):
             value = max(colour.value - ColourSampleMatcher.VALUE_DISPLAY_INCR, fractions.Fraction(0))
-            coloured.ColouredButton.set_colour(self, colour.hue_rgb_for_value(value).gdk_color)
+            coloured.ColouredButton.set_colour(self, grgbh.gdk_color(colour.hue_rgb_for_value(value)))
 
     class IncrGraynessButton(coloured.ColouredButton):
         def __init__(self):
             coloured.ColouredButton.__init__(self, label=_("Grayness") + "++")
         def set_colour(self, colour):
-            coloured.ColouredButton.set_colour(self, colour.value_rgb.gdk_color)
+            coloured.ColouredButton.set_colour(self, grgbh.gdk_color(colour.value_rgb))
 
     class DecrGraynessButton(coloured.ColouredButton):
         def __init__(self):
             coloured.ColouredButton.__init__(self, label=_("Grayness") + "--")
         def set_colour(self, colour):
-            coloured.ColouredButton.set_colour(self, colour.hue_rgb_for_value().gdk_color)
+            coloured.ColouredButton.set_colour(self, grgbh.gdk_color(colour.hue_rgb_for_value()))
 
     def __init__(self, auto_match_on_paste=False):
         Gtk.VBox.__init__(self)
         self._delta = 256 # must be a power of two
+        # the displays only need to show the latest of a rapid series of changes
+        self.__display_update = gpaint.CoalescedUpdate(self._update_displays)
+        self.connect("destroy", lambda _widget: self.__display_update.cancel())
         self.auto_match_on_paste_check_button = Gtk.CheckButton.new_with_label(_("On Paste"))
         self.auto_match_on_paste_check_button.set_active(auto_match_on_paste)
         self.auto_match_on_paste_check_button.set_tooltip_text(_("Whether auto matching should be triggered automatically when samples are pasted into matcher."))
+        self.auto_match_estimator_chooser = Gtk.ComboBoxText()
+        for estimator_id, (label, _method) in psample.ESTIMATORS.items():
+            self.auto_match_estimator_chooser.append(estimator_id, _(label))
+        self.auto_match_estimator_chooser.set_active_id(recollect.get("colour_sample_matcher", "estimator"))
+        if self.auto_match_estimator_chooser.get_active_id() is None:
+            self.auto_match_estimator_chooser.set_active_id("mean")
+        self.auto_match_estimator_chooser.connect("changed", self._estimator_changed_cb)
+        self.auto_match_estimator_chooser.set_tooltip_text(_("The statistic used to derive the colour from the samples when auto matching."))
+        self.__pending_auto_match_raw = None
         # Add RGB entry field
         if self.PROVIDE_RGB_ENTRY:
             self.rgb_entry = gpaint.RGBEntryBox()
@@ -185,12 +305,27 @@ class ColourSampleMatcher(Gtk.VBox):
         # Add the sample display panel
         self.sample_display = gpaint.ColourSampleArea()
         self.sample_display.connect("samples_changed", self._sample_change_cb)
+        self.sample_display.connect("statistics-changed", self._statistics_change_cb)
+        self.sample_display.connect("statistics-progress", self._statistics_progress_cb)
         hbox.pack_start(self.sample_display, expand=True, fill=True, padding=0)
         # Add anti clockwise hue angle modification button
         self.hue_cw_button = self.HueClockwiseButton()
         hbox.pack_start(self.hue_cw_button, expand=False, fill=True, padding=0)
         self.hue_cw_button.connect("clicked", self.modify_hue_cw_cb)
         self.pack_start(hbox, expand=True, fill=True, padding=0)
+        # Progress of the analysis of pasted samples
+        self.statistics_progress_bar = Gtk.ProgressBar()
+        self.statistics_progress_bar.set_no_show_all(True)
+        self.pack_start(self.statistics_progress_bar, expand=False, fill=True, padding=0)
+        # The white balance correction (if any) applied to samples
+        self.white_balance_label = Gtk.Label()
+        self.white_balance_label.set_selectable(True)
+        self.white_balance_label.set_tooltip_text(_("Gains correcting the colour of the lighting in samples (usable with batch matching's --white-balance option)."))
+        self.white_balance_label.set_no_show_all(True)
+        self.pack_start(self.white_balance_label, expand=False, fill=True, padding=0)
+        SESSION_WHITE_BALANCE.add_change_cb(self._white_balance_changed_cb)
+        self.connect("destroy", lambda _widget: SESSION_WHITE_BALANCE.remove_change_cb(self._white_balance_changed_cb))
+        self._white_balance_changed_cb(SESSION_WHITE_BALANCE)
         # Darken
         hbox = Gtk.HBox()
         self.decr_value_button = self.DecrValueButton()
@@ -226,6 +361,9 @@ class ColourSampleMatcher(Gtk.VBox):
 
     def _set_colour(self, colour):
         self.colour = colour
+        self.__display_update.schedule()
+
+    def _update_displays(self):
         if hasattr(self, "rgb_entry"):
             self.rgb_entry.set_colour(self.colour)
         self.sample_display.set_bg_colour(self.colour.rgb)
@@ -237,37 +375,55 @@ class ColourSampleMatcher(Gtk.VBox):
         self.decr_grayness_button.set_colour(self.colour)
         self.hcv_display.set_colour(self.colour)
 
-    def _auto_match_sample(self, samples, raw):
-        total = [0, 0, 0]
-        npixels = 0
-        for sample in samples:
-            assert sample.get_bits_per_sample() == 8
-            nc = sample.get_n_channels()
-            rs = sample.get_rowstride()
-            width = sample.get_width()
-            n_rows = sample.get_height()
-            data = list(sample.get_pixels())
-            for row_num in range(n_rows):
-                row_start = row_num * rs
-                for j in range(width):
-                    offset = row_start + j * nc
-                    for i in range(3):
-                        total[i] += data[offset + i]
-            npixels += width * n_rows
-        rgb = self.COLOUR.RGB(*(self.COLOUR.RGB.ROUND((total[i] << 8) / npixels) for i in range(3)))
+    @property
+    def auto_match_estimator(self):
+        return psample.ESTIMATORS[self.auto_match_estimator_chooser.get_active_id()][1]
+
+    def _estimator_changed_cb(self, combo):
+        recollect.set("colour_sample_matcher", "estimator", combo.get_active_id())
+
+    @ptiming.timed()
+    def _auto_match_sample(self, stats, raw):
+        values = SESSION_WHITE_BALANCE.apply(self.auto_match_estimator(stats))
+        rgb = self.COLOUR.RGB(*(self.COLOUR.RGB.ROUND(value * self.COLOUR.RGB.ONE) for value in values))
         if raw:
             self.set_colour(rgb)
         else:
             self.set_colour(self.COLOUR(rgb).hue_rgb_for_value())
 
     def auto_match_sample(self, raw):
-        samples = self.sample_display.get_samples()
-        if samples:
-            self._auto_match_sample(samples, raw)
+        if self.sample_display.statistics_pending:
+            # supersedes any earlier request and runs when analysis is done
+            self.__pending_auto_match_raw = raw
+            return
+        self.__pending_auto_match_raw = None
+        stats = self.sample_display.get_statistics()
+        if stats.npixels > 0:
+            self._auto_match_sample(stats, raw)
 
     def _sample_change_cb(self, widget, *args):
         if self.auto_match_on_paste:
             self.auto_match_sample(raw=self.DEFAULT_AUTO_MATCH_RAW)
+        elif not self.sample_display.statistics_pending:
+            self.__pending_auto_match_raw = None
+
+    def _statistics_change_cb(self, widget):
+        if self.__pending_auto_match_raw is not None:
+            self.auto_match_sample(self.__pending_auto_match_raw)
+
+    def _white_balance_changed_cb(self, white_balance):
+        if white_balance.is_identity:
+            self.white_balance_label.hide()
+        else:
+            self.white_balance_label.set_text(_("White Balance: {}").format(white_balance))
+            self.white_balance_label.show()
+
+    def _statistics_progress_cb(self, widget, fraction):
+        if fraction < 1.0:
+            self.statistics_progress_bar.set_fraction(fraction)
+            self.statistics_progress_bar.show()
+        else:
+            self.statistics_progress_bar.hide()
 
     def _rgb_entry_changed_cb(self, entry):
         self.set_colour(entry.get_colour())
@@ -362,7 +518,7 @@ class PaintEditor(Gtk.VBox):
             self.extra_entries[extra.name].connect("changed", self._changed_cb)
             table.attach(self.extra_entries[extra.name], 1, 2, next_row, next_row + 1)
             next_row += 1
-        self.c_choosers = pchar.Choosers(self.PAINT.CHARACTERISTICS.NAMES)
+        self.c_choosers = gpchar.Choosers(self.PAINT.CHARACTERISTICS.NAMES)
         for chooser in self.c_choosers.values():
             label = Gtk.Label(label=chooser.PROMPT_TEXT)
             table.attach(label, 0, 1, next_row, next_row + 1, xoptions=0)
@@ -447,6 +603,11 @@ class PaintCollectionEditor(Gtk.HPaned, actions.CAGandUIManager, dialogue.Report
         <menu action="paint_collection_editor_samples_menu">
           <menuitem action="take_screen_sample"/>
           <menuitem action="open_sample_viewer"/>
+          <menuitem action="extract_palette_from_image"/>
+          <menuitem action="open_swatch_card_sampler"/>
+          <separator/>
+          <menuitem action="set_white_balance_fm_samples"/>
+          <menuitem action="reset_white_balance"/>
         </menu>
       </menubar>
     </ui>
@@ -473,6 +634,7 @@ class PaintCollectionEditor(Gtk.HPaned, actions.CAGandUIManager, dialogue.Report
         self._set_current_extant_paint(None)
         self.saved_hash = None
         self.__closed = False
+        self.__palette_job = None
 
         # First assemble the parts
         self.paint_editor = self.PAINT_EDITOR()
@@ -480,6 +642,7 @@ class PaintCollectionEditor(Gtk.HPaned, actions.CAGandUIManager, dialogue.Report
         self.paint_editor.colour_matcher.sample_display.connect("samples-changed", self._sample_change_cb)
         self.buttons = self.create_action_button_box(self.BUTTONS)
         self.buttons.pack_end(self.paint_editor.colour_matcher.auto_match_on_paste_check_button, expand=False, fill=False, padding=0)
+        self.buttons.pack_end(self.paint_editor.colour_matcher.auto_match_estimator_chooser, expand=False, fill=False, padding=0)
         self.paint_colours = self.PAINT_LIST_NOTEBOOK(wheel_popup="/colour_wheel_EI_popup")
         self.paint_colours.set_wheels_edit_paint_acb(self._load_wheel_colour_into_editor_cb)
         self.paint_colours.set_size_request(480, 480)
@@ -506,6 +669,9 @@ class PaintCollectionEditor(Gtk.HPaned, actions.CAGandUIManager, dialogue.Report
         table.attach(self.collection_name, 1, 2, 1, 2)
         vbox.pack_start(table, expand=False, fill=True, padding=0)
         vbox.pack_start(self.paint_colours, expand=True, fill=True, padding=0)
+        self._palette_progress_bar = Gtk.ProgressBar()
+        self._palette_progress_bar.set_no_show_all(True)
+        vbox.pack_start(self._palette_progress_bar, expand=False, fill=True, padding=0)
         self.pack1(vbox, resize=True, shrink=False)
         vbox = Gtk.VBox()
         vbox.pack_start(self.paint_editor, expand=True, fill=True, padding=0)
@@ -567,6 +733,9 @@ class PaintCollectionEditor(Gtk.HPaned, actions.CAGandUIManager, dialogue.Report
             ("automatch_sample_images", None, _("Auto Match"), None,
             _("Auto matically match the colour to the sample images."),
             self._automatch_sample_images_raw_cb),
+            ("set_white_balance_fm_samples", None, _("Set White Balance"), None,
+            _("Correct the colour of the lighting in this and subsequent samples using the sample images as a neutral grey (or white) reference."),
+            self._set_white_balance_fm_samples_cb),
         ])
         self.action_groups[PaintEditor.AC_READY|self.AC_NOT_EDITING_EXTANT_PAINT].add_actions([
             ("add_colour_into_collection", None, _("Add"), None,
@@ -609,6 +778,18 @@ class PaintCollectionEditor(Gtk.HPaned, actions.CAGandUIManager, dialogue.Report
              _("Start a new paint colour collection."),
              lambda _action: self._start_new_paint_collection()
             ),
+            ("extract_palette_from_image", None, _("Extract Palette"), None,
+             _("Add the most common colours in an image file to the collection as paints awaiting names."),
+             lambda _action: self._extract_palette_from_image()
+            ),
+            ("reset_white_balance", None, _("Reset White Balance"), None,
+             _("Stop correcting the colour of the lighting in samples."),
+             lambda _action: SESSION_WHITE_BALANCE.reset()
+            ),
+            ("open_swatch_card_sampler", None, _("Sample Swatch Card"), None,
+             _("Open a sample viewer able to add every swatch on a card to the collection."),
+             lambda _action: SampleViewer(self.get_toplevel(), swatch_card_acb=self._add_swatch_card_paints).show()
+            ),
         ])
 
     @property
@@ -825,13 +1006,102 @@ class PaintCollectionEditor(Gtk.HPaned, actions.CAGandUIManager, dialogue.Report
             old_colour.set_rgb(new_colour.rgb)
             old_colour.set_extras(**new_colour.get_extras())
             old_colour.set_characteristics(**new_colour.characteristics.get_kwargs())
-            self.paint_colours.queue_draw()
+            self.paint_colours.update_paint(old_colour)
             self._set_current_extant_paint(old_colour)
         else:
             self.paint_colours.add_paint(new_colour)
             self._set_current_extant_paint(new_colour)
         self.set_status_indicator(clean=False)
 
+    def _extract_palette_from_image(self):
+        """
+        Ask the user for an image and add the palette extracted from
+        it (on a worker thread) to the collection
+        """
+        parent = self.get_toplevel()
+        dlg = PaletteExtractionDialogue(parent=parent if isinstance(parent, Gtk.Window) else None)
+        response = dlg.run()
+        filepath = dlg.file_chooser.get_filename()
+        ncolours = dlg.ncolours.get_value_as_int()
+        dlg.destroy()
+        if response != Gtk.ResponseType.OK or not filepath:
+            return
+        if self.__palette_job is not None:
+            self.__palette_job.cancel()
+        done_cb = lambda palette: self._palette_extracted_cb(filepath, palette)
+        error_cb = lambda edata: self._palette_extraction_failed_cb(filepath, edata)
+        self.__palette_job = gpaint.BackgroundJob(extract_palette_fm_file, (filepath, ncolours), done_cb, self._palette_progress_cb, error_cb)
+        self.__palette_job.start()
+        self._palette_progress_cb(0.0)
+
+    def _palette_progress_cb(self, fraction):
+        self._palette_progress_bar.set_fraction(fraction)
+        self._palette_progress_bar.show()
+
+    def _palette_extraction_failed_cb(self, filepath, edata):
+        self.__palette_job = None
+        self._palette_progress_bar.hide()
+        self.alert_user(_("{}: Problem extracting palette: {}").format(filepath, edata))
+
+    def _palette_extracted_cb(self, filepath, palette):
+        self.__palette_job = None
+        self._palette_progress_bar.hide()
+        if palette is None:
+            self.alert_user(_("{}: Problem extracting image from file.").format(filepath))
+            return
+        elif not palette:
+            self.alert_user(_("{}: no colours found in image.").format(filepath))
+            return
+        number = 0
+        for rgb, _fraction in palette:
+            name, number = self._next_unused_name(_("Extracted #{:03d}"), number + 1)
+            self.paint_colours.add_paint(self._new_paint(name, SESSION_WHITE_BALANCE.apply(rgb)))
+        self.set_status_indicator(clean=False)
+
+    def _next_unused_name(self, template, number):
+        """
+        Return the first name (and its number) generated by template
+        from number onwards that isn't in use in the collection
+        """
+        while self.paint_colours.get_paint_with_name(template.format(number)) is not None:
+            number += 1
+        return (template.format(number), number)
+
+    def _new_paint(self, name, rgb):
+        """
+        Return a new paint with default characteristics and the given
+        name and colour (with channels as fractions of full scale)
+        """
+        RGB = self.PAINT_EDITOR.PAINT.COLOUR.RGB
+        return self.PAINT_EDITOR.PAINT(name=name, rgb=RGB(*(RGB.ROUND(value * RGB.ONE) for value in rgb)))
+
+    def _add_swatch_card_paints(self, swatches):
+        """
+        Add the (name, rgb) swatches sampled from a swatch card to the
+        collection (generating names where none were given)
+        """
+        number = 0
+        skipped = []
+        for name, rgb in swatches:
+            if not name:
+                name, number = self._next_unused_name(_("Swatch #{:03d}"), number + 1)
+            elif self.paint_colours.get_paint_with_name(name) is not None:
+                skipped.append(name)
+                continue
+            self.paint_colours.add_paint(self._new_paint(name, rgb))
+        self.set_status_indicator(clean=False)
+        if skipped:
+            self.alert_user(_("Swatches not added as their names are already in use:\n{}").format("\n".join(skipped)))
+
+    def _set_white_balance_fm_samples_cb(self, _action):
+        stats = self.paint_editor.colour_matcher.sample_display.get_statistics()
+        if stats.npixels == 0:
+            return
+        try:
+            SESSION_WHITE_BALANCE.set_fm_neutral(stats.median())
+        except ValueError as edata:
+            self.alert_user(str(edata))
+
     def _automatch_sample_images_max_chroma_cb(self, _widget):
         self.paint_editor.auto_match_sample(raw=False)
 
@@ -917,6 +1187,7 @@ GObject.signal_new("file_changed", PaintCollectionEditor, GObject.SignalFlags.RU
 
 from .. import SYS_SAMPLES_DIR_PATH
 
+recollect.define("colour_sample_matcher", "estimator", recollect.Defn(str, "mean"))
 recollect.define("sample_viewer", "last_file", recollect.Defn(str, os.path.join(SYS_SAMPLES_DIR_PATH, "example.jpg")))
 recollect.define("sample_viewer", "last_size", recollect.Defn(str, ""))
 
@@ -936,40 +1207,53 @@ class SampleViewer(Gtk.Window, actions.CAGandUIManager):
     """
     TITLE_TEMPLATE = _("mcmmtk: Colour Sample: {}")
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, swatch_card_acb=None):
         Gtk.Window.__init__(self, Gtk.WindowType.TOPLEVEL)
         actions.CAGandUIManager.__init__(self)
+        self.__swatch_card_acb = swatch_card_acb
+        self.__swatch_job = None
         last_size = recollect.get("sample_viewer", "last_size")
         if last_size:
             self.set_default_size(*eval(last_size))
         self.set_icon_from_file(icons.APP_ICON_FILE)
         self.set_size_request(300, 200)
-        last_samples_file = recollect.get("sample_viewer", "last_file")
-        if os.path.isfile(last_samples_file):
-            try:
-                pixbuf = GdkPixbuf.Pixbuf.new_from_file(last_samples_file)
-            except GLib.GError:
-                pixbuf = None
-                last_samples_file = None
-        else:
-            pixbuf = None
-            last_samples_file = None
-        self.set_title(self.TITLE_TEMPLATE.format(None if last_samples_file is None else os.path.relpath(last_samples_file)))
-        self.pixbuf_view = iview.PixbufView()
+        self.pixbuf_view = pimage.TiledImageView()
         self._menubar = self.ui_manager.get_widget("/colour_sample_menubar")
         self.buttons = self.pixbuf_view.action_groups.create_action_button_box([
             "zoom_in",
             "zoom_out",
+            "zoom_to_fit",
+            "copy_to_clipboard",
         ])
+        self._swatch_card_prompt = Gtk.Label()
+        self._swatch_card_prompt.set_no_show_all(True)
+        if swatch_card_acb is not None:
+            button = Gtk.Button.new_with_label(_("Sample Swatch Card"))
+            button.set_tooltip_text(_("Mark the corners of a swatch card and add a paint for each of its swatches."))
+            button.connect("clicked", self._sample_swatch_card_cb)
+            self.buttons.pack_end(button, expand=False, fill=False, padding=0)
+        button = Gtk.Button.new_with_label(_("Set White Balance"))
+        button.set_tooltip_text(_("Correct the colour of the lighting in subsequent samples using the selection as a neutral grey (or white) reference."))
+        button.connect("clicked", self._set_white_balance_cb)
+        self.buttons.pack_end(button, expand=False, fill=False, padding=0)
         vbox = Gtk.VBox()
         vbox.pack_start(self._menubar, expand=False, fill=True, padding=0)
         vbox.pack_start(self.pixbuf_view, expand=True, fill=True, padding=0)
+        vbox.pack_start(self._swatch_card_prompt, expand=False, fill=True, padding=0)
         vbox.pack_start(self.buttons, expand=False, fill=True, padding=0)
         self.add(vbox)
         self.set_transient_for(parent)
         self.connect("size-allocate", self._size_allocation_cb)
         self.show_all()
-        self.pixbuf_view.set_pixbuf(pixbuf)
+        last_samples_file = recollect.get("sample_viewer", "last_file")
+        if os.path.isfile(last_samples_file):
+            try:
+                self.pixbuf_view.set_image_file(last_samples_file)
+            except GLib.GError:
+                last_samples_file = None
+        else:
+            last_samples_file = None
+        self.set_title(self.TITLE_TEMPLATE.format(None if last_samples_file is None else os.path.relpath(last_samples_file)))
 
     def populate_action_groups(self):
         self.action_groups[actions.AC_DONT_CARE].add_actions([
@@ -1008,20 +1292,66 @@ class SampleViewer(Gtk.Window, actions.CAGandUIManager):
             filepath = dlg.get_filename()
             dlg.destroy()
             try:
-                pixbuf = GdkPixbuf.Pixbuf.new_from_file(filepath)
+                self.pixbuf_view.set_image_file(filepath)
             except GLib.GError:
                 msg = _("{}: Problem extracting image from file.").format(filepath)
                 dialogue.MessageDialog(type=Gtk.MessageType.ERROR, buttons=Gtk.ButtonsType.CLOSE, text=msg).run()
                 return
             recollect.set("sample_viewer", "last_file", filepath)
             self.set_title(self.TITLE_TEMPLATE.format(None if filepath is None else os.path.relpath(filepath)))
-            self.pixbuf_view.set_pixbuf(pixbuf)
         else:
             dlg.destroy()
 
     def _close_colour_sample_viewer_cb(self, _action):
         self.get_toplevel().destroy()
 
+    def _set_white_balance_cb(self, _button):
+        pixbuf = self.pixbuf_view.get_selected_pixbuf()
+        if pixbuf is None:
+            dialogue.MessageDialog(parent=self, buttons=Gtk.ButtonsType.CLOSE, text=_("Select a neutral grey (or white) area first.")).run()
+            return
+        stats = psample.SampleStatistics.fm_pixels(psample.PixelBuffer.fm_pixbuf(pixbuf))
+        try:
+            SESSION_WHITE_BALANCE.set_fm_neutral(stats.median())
+        except ValueError as edata:
+            dialogue.MessageDialog(parent=self, type=Gtk.MessageType.ERROR, buttons=Gtk.ButtonsType.CLOSE, text=str(edata)).run()
+
+    def _sample_swatch_card_cb(self, _button):
+        if self.pixbuf_view.image is None:
+            return
+        self._swatch_card_prompt.set_text(_("Click the top left, top right, bottom right and bottom left corners of the swatches."))
+        self._swatch_card_prompt.show()
+        self.pixbuf_view.pick_points(4, self._swatch_card_corners_cb)
+
+    def _swatch_card_corners_cb(self, corners):
+        self._swatch_card_prompt.hide()
+        dlg = SwatchCardDialogue(parent=self)
+        response = dlg.run()
+        rows, cols = dlg.rows.get_value_as_int(), dlg.cols.get_value_as_int()
+        names = dlg.get_names()
+        dlg.destroy()
+        if response != Gtk.ResponseType.OK:
+            self.pixbuf_view.clear_points()
+            return
+        if self.__swatch_job is not None:
+            self.__swatch_job.cancel()
+        done_cb = lambda cell_stats: self._swatch_card_sampled_cb(cell_stats, names)
+        self.__swatch_job = gpaint.BackgroundJob(swatch_card_statistics, (self.pixbuf_view.image, corners, rows, cols), done_cb, error_cb=self._swatch_card_failed_cb)
+        self.__swatch_job.start()
+
+    def _swatch_card_failed_cb(self, edata):
+        self.__swatch_job = None
+        self.pixbuf_view.clear_points()
+        msg = _("Problem sampling swatch card: {}").format(edata)
+        dialogue.MessageDialog(parent=self, type=Gtk.MessageType.ERROR, buttons=Gtk.ButtonsType.CLOSE, text=msg).run()
+
+    def _swatch_card_sampled_cb(self, cell_stats, names):
+        self.__swatch_job = None
+        self.pixbuf_view.clear_points()
+        estimator = psample.ESTIMATORS.get(recollect.get("colour_sample_matcher", "estimator"), psample.ESTIMATORS["mean"])[1]
+        names = names + [None] * (len(cell_stats) - len(names))
+        self.__swatch_card_acb([(name, SESSION_WHITE_BALANCE.apply(estimator(stats))) for name, stats in zip(names, cell_stats)])
+
 actions.CLASS_INDEP_AGS[actions.AC_DONT_CARE].add_actions([
     ("mcmmtk_samples_menu", None, _("Samples")),
     ("take_screen_sample", None, _("Take Sample"), None,
@@ -0,0 +1,493 @@
+#  Copyright 2017 Peter Williams <pwil3058@gmail.com>
+#
+# This software is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License only.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software; if not, write to:
+#  The Free Software Foundation, Inc., 51 Franklin Street,
+#  Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tiled, mipmapped viewing of (possibly very large) image files
+"""
+
+import collections
+import math
+
+import cairo
+
+from gi.repository import Gdk
+from gi.repository import GdkPixbuf
+from gi.repository import GLib
+from gi.repository import GObject
+from gi.repository import Gtk
+
+from ..gtx import actions
+from ..gtx import dialogue
+
+from . import gpaint
+from . import psample
+
+__all__ = []
+__author__ = "Peter Williams <pwil3058@gmail.com>"
+
+class MipmapImage(object):
+    """
+    An image file decoded on demand at the power of two reductions
+    (levels) needed for viewing it. Only the preview level and the
+    most recently requested level are kept.
+    """
+    PREVIEW_SIZE = 1024
+    def __init__(self, filepath):
+        self.filepath = filepath
+        _format, self.width, self.height = GdkPixbuf.Pixbuf.get_file_info(filepath)
+        self.max_level = max(0, int(math.log2(max(self.width, self.height, 1))))
+        self.preview_level = 0
+        while max(self.width, self.height) >> self.preview_level > self.PREVIEW_SIZE:
+            self.preview_level += 1
+        self.__levels = {}
+        # decoding the preview also reports unreadable files to the caller
+        self.__levels[self.preview_level] = self.decode_level(self.preview_level)
+    def get_level_size(self, level):
+        return (max(1, math.ceil(self.width / (1 << level))), max(1, math.ceil(self.height / (1 << level))))
+    def decode_level(self, level):
+        """Decode the image file at the given level (which may be run
+        on a worker thread)
+        """
+        if level == 0:
+            return GdkPixbuf.Pixbuf.new_from_file(self.filepath)
+        return GdkPixbuf.Pixbuf.new_from_file_at_scale(self.filepath, *self.get_level_size(level), False)
+    def has_level(self, level):
+        return level in self.__levels
+    def get_level(self, level):
+        return self.__levels.get(level, None)
+    def set_level(self, level, pixbuf):
+        for extant in list(self.__levels):
+            if extant not in (level, self.preview_level):
+                del self.__levels[extant]
+        self.__levels[level] = pixbuf
+    def level_for_zoom(self, zoom):
+        """The coarsest level with at least as much detail as the zoom
+        """
+        if zoom >= 1.0:
+            return 0
+        return min(self.max_level, int(math.floor(math.log2(1.0 / zoom))))
+    def best_available_level(self, level):
+        return level if level in self.__levels else self.preview_level
+
+class TileCache(collections.OrderedDict):
+    """
+    A least recently used cache of tile surfaces bounded by the size of
+    the pixel data held
+    """
+    def __init__(self, max_bytes):
+        collections.OrderedDict.__init__(self)
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+    def get_tile(self, key):
+        try:
+            self.move_to_end(key)
+        except KeyError:
+            return None
+        return self[key]
+    def add_tile(self, key, surface):
+        self[key] = surface
+        self.nbytes += surface.get_stride() * surface.get_height()
+        while self.nbytes > self.max_bytes and len(self) > 1:
+            _key, evicted = self.popitem(last=False)
+            self.nbytes -= evicted.get_stride() * evicted.get_height()
+    def clear(self):
+        collections.OrderedDict.clear(self)
+        self.nbytes = 0
+
+def crop_pixbuf(pixbuf, rect, scale):
+    """Return a copy of the part of pixbuf within rect (x, y, width,
+    height in image coordinates) where scale converts image coordinates
+    to those of pixbuf
+    """
+    x, y = int(rect[0] * scale), int(rect[1] * scale)
+    width = max(1, min(pixbuf.get_width() - x, int(round(rect[2] * scale))))
+    height = max(1, min(pixbuf.get_height() - y, int(round(rect[3] * scale))))
+    return pixbuf.new_subpixbuf(x, y, width, height).copy()
+
+def crop_full_resolution(image, rect, progress=None):
+    """Return a copy of the part of image within rect at full resolution
+    (decoding the image here, e.g. on a worker thread, if necessary)
+    """
+    pixbuf = image.get_level(0)
+    if pixbuf is None:
+        pixbuf = image.decode_level(0)
+    return crop_pixbuf(pixbuf, rect, 1.0)
+
+def filter_tiles(tile_filter, tiles, progress=None):
+    """Return (key, width, height, rgb) for each of the (key, pixels)
+    tiles where rgb is tile_filter's packed 8 bit RGB rendering of
+    the tile's pixels
+    """
+    filtered = []
+    for index, (key, pixels) in enumerate(tiles):
+        if progress is not None:
+            progress(index / len(tiles))
+        filtered.append((key, pixels.width, pixels.height, tile_filter(pixels)))
+    return filtered
+
+class TiledImageView(Gtk.ScrolledWindow, actions.CAGandUIManager):
+    """
+    A zoomable view of an image file that only decodes the image at the
+    level of detail needed for the current zoom and only converts the
+    visible tiles of that level for drawing. A rubber band selection
+    can be copied to the clipboard and points can be picked on the image.
+    A tile filter can be set to display a rendering derived from the
+    image instead: it is applied to tiles in the background and the
+    results are cached along with the plain tiles.
+    """
+    UI_DESCR = """
+    <ui>
+        <popup name="tiled_image_view_popup">
+            <menuitem action="copy_to_clipboard"/>
+            <separator/>
+            <menuitem action="zoom_in"/>
+            <menuitem action="zoom_out"/>
+            <menuitem action="zoom_to_fit"/>
+        </popup>
+    </ui>
+    """
+    AC_SELN_MADE, AC_PICTURE_LOADED, AC_MASK = actions.ActionCondns.new_flags_and_mask(2)
+    TILE_SIZE = 256
+    TILE_CACHE_BYTES = 64 * 1024 * 1024
+    ZOOM_FACTOR = 1.25
+    MAX_ZOOM = 16.0
+    def __init__(self):
+        Gtk.ScrolledWindow.__init__(self)
+        self.__image = None
+        self.__zoom = 1.0
+        self.__tiles = TileCache(self.TILE_CACHE_BYTES)
+        self.__decode_job = None
+        self.__copy_job = None
+        self.__seln = None
+        self.__seln_start = None
+        self.__points = []
+        self.__points_wanted = 0
+        self.__points_acb = None
+        self.__substitute = None
+        self.__substitute_count = 0
+        self.__tile_filter = None
+        self.__filter_job = None
+        self._layout = Gtk.Layout()
+        self._layout.add_events(Gdk.EventMask.POINTER_MOTION_MASK|Gdk.EventMask.BUTTON_PRESS_MASK|Gdk.EventMask.BUTTON_RELEASE_MASK|Gdk.EventMask.SCROLL_MASK)
+        self._layout.connect("draw", self.expose_cb)
+        self._layout.connect("button_press_event", self._button_press_cb)
+        self._layout.connect("motion_notify_event", self._motion_notify_cb)
+        self._layout.connect("button_release_event", self._button_release_cb)
+        self._layout.connect("scroll_event", self._scroll_event_cb)
+        self.add(self._layout)
+        actions.CAGandUIManager.__init__(self, popup="/tiled_image_view_popup")
+        self.action_groups.update_condns(actions.MaskedCondns(0, self.AC_MASK))
+    def populate_action_groups(self):
+        self.action_groups[self.AC_PICTURE_LOADED].add_actions(
+            [
+                ("zoom_in", Gtk.STOCK_ZOOM_IN, None, None,
+                 _("Enlarge the image."),
+                 lambda _action: self.set_zoom(self.__zoom * self.ZOOM_FACTOR)
+                ),
+                ("zoom_out", Gtk.STOCK_ZOOM_OUT, None, None,
+                 _("Shrink the image."),
+                 lambda _action: self.set_zoom(self.__zoom / self.ZOOM_FACTOR)
+                ),
+                ("zoom_to_fit", Gtk.STOCK_ZOOM_FIT, None, None,
+                 _("Zoom the image to fit the window."),
+                 lambda _action: self.zoom_to_fit()
+                ),
+            ])
+        self.action_groups[self.AC_SELN_MADE].add_actions(
+            [
+                ("copy_to_clipboard", Gtk.STOCK_COPY, None, None,
+                 _("Copy the selection to the clipboard."),
+                 self._copy_to_clipboard_cb
+                ),
+            ])
+    @property
+    def image(self):
+        return self.__image
+    @property
+    def zoom(self):
+        return self.__zoom
+    def set_image_file(self, filepath):
+        """Display the image in the named file (raising GLib.GError if
+        the file can't be read)
+        """
+        image = MipmapImage(filepath)
+        self._cancel_decode()
+        self._cancel_filter()
+        self._cancel_copy()
+        self.__tiles.clear()
+        self.__image = image
+        self.__seln = None
+        self.__substitute = None
+        self.clear_points()
+        self.action_groups.update_condns(actions.MaskedCondns(self.AC_PICTURE_LOADED, self.AC_MASK))
+        self.zoom_to_fit()
+    def zoom_to_fit(self):
+        if self.__image is None:
+            return
+        alloc = self.get_allocation()
+        if alloc.width > 1 and alloc.height > 1:
+            self.set_zoom(min(1.0, alloc.width / self.__image.width, alloc.height / self.__image.height))
+        else:
+            self.set_zoom(1.0 / (1 << self.__image.preview_level))
+    def set_zoom(self, zoom):
+        if self.__image is None:
+            return
+        min_zoom = min(1.0, 16.0 / max(self.__image.width, self.__image.height))
+        zoom = max(min_zoom, min(self.MAX_ZOOM, zoom))
+        # keep the centre of the view where it is
+        hadj, vadj = self.get_hadjustment(), self.get_vadjustment()
+        cx = (hadj.get_value() + hadj.get_page_size() / 2) / self.__zoom
+        cy = (vadj.get_value() + vadj.get_page_size() / 2) / self.__zoom
+        self.__zoom = zoom
+        self._layout.set_size(math.ceil(self.__image.width * zoom), math.ceil(self.__image.height * zoom))
+        hadj.set_value(cx * zoom - hadj.get_page_size() / 2)
+        vadj.set_value(cy * zoom - vadj.get_page_size() / 2)
+        self._request_level(self.__image.level_for_zoom(zoom))
+        self._layout.queue_draw()
+    def _cancel_decode(self):
+        if self.__decode_job is not None:
+            self.__decode_job[1].cancel()
+            self.__decode_job = None
+    def _request_level(self, level):
+        if self.__image.has_level(level):
+            self._cancel_decode()
+            return
+        if self.__decode_job is not None and self.__decode_job[0] == level:
+            return
+        self._cancel_decode()
+        image = self.__image
+        decode = lambda progress: image.decode_level(level)
+        job = gpaint.BackgroundJob(decode, (), lambda pixbuf: self._level_decoded_cb(image, level, pixbuf), error_cb=self._level_decode_failed_cb)
+        self.__decode_job = (level, job.start())
+    def _level_decode_failed_cb(self, edata):
+        # the preview (or current level) stays on show scaled
+        self.__decode_job = None
+    def _level_decoded_cb(self, image, level, pixbuf):
+        self.__decode_job = None
+        if image is self.__image:
+            image.set_level(level, pixbuf)
+            self._layout.queue_draw()
+    def set_substitute_pixbuf(self, pixbuf):
+        """Display pixbuf (a rendering derived from the image at any
+        resolution) in place of the image until it is set to None
+        """
+        self._cancel_filter()
+        self.__substitute = pixbuf
+        self.__substitute_count += 1
+        self._layout.queue_draw()
+    @property
+    def tile_filter(self):
+        return self.__tile_filter
+    def set_tile_filter(self, tile_filter):
+        """Display tile_filter(pixels) (packed 8 bit RGB) in place of
+        each tile's pixels or the plain image if tile_filter is None.
+        Filters that compare equal share their cached tiles.
+        """
+        if tile_filter == self.__tile_filter:
+            return
+        self._cancel_filter()
+        self.__tile_filter = tile_filter
+        self._layout.queue_draw()
+    def _cancel_filter(self):
+        if self.__filter_job is not None:
+            self.__filter_job.cancel()
+            self.__filter_job = None
+    def _get_tile_pixbuf(self, pixbuf, tx, ty):
+        x, y = tx * self.TILE_SIZE, ty * self.TILE_SIZE
+        width = min(self.TILE_SIZE, pixbuf.get_width() - x)
+        height = min(self.TILE_SIZE, pixbuf.get_height() - y)
+        return pixbuf.new_subpixbuf(x, y, width, height)
+    def _get_tile(self, source, pixbuf, tx, ty):
+        key = (source, None, tx, ty)
+        surface = self.__tiles.get_tile(key)
+        if surface is None:
+            surface = Gdk.cairo_surface_create_from_pixbuf(self._get_tile_pixbuf(pixbuf, tx, ty), 0, None)
+            self.__tiles.add_tile(key, surface)
+        return surface
+    def _request_filtered_tiles(self, source, pixbuf, txys):
+        # the job's completion redraws so any still missing are requested then
+        if self.__filter_job is not None:
+            return
+        tiles = [((source, self.__tile_filter, tx, ty), psample.PixelBuffer.fm_pixbuf(self._get_tile_pixbuf(pixbuf, tx, ty))) for tx, ty in txys]
+        self.__filter_job = gpaint.BackgroundJob(filter_tiles, (self.__tile_filter, tiles), self._tiles_filtered_cb, error_cb=self._tile_filter_failed_cb)
+        self.__filter_job.start()
+    def _tile_filter_failed_cb(self, edata):
+        # revert to the plain image rather than retrying on every draw
+        self.__filter_job = None
+        self.__tile_filter = None
+        self._layout.queue_draw()
+        self.emit("tile-filter-failed", edata)
+    def _tiles_filtered_cb(self, filtered):
+        self.__filter_job = None
+        for key, width, height, rgb in filtered:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes(rgb), GdkPixbuf.Colorspace.RGB, False, 8, width, height, width * 3)
+            self.__tiles.add_tile(key, Gdk.cairo_surface_create_from_pixbuf(pixbuf, 0, None))
+        self._layout.queue_draw()
+    def expose_cb(self, widget, cairo_ctxt):
+        if self.__image is None or not Gtk.cairo_should_draw_window(cairo_ctxt, widget.get_bin_window()):
+            return False
+        if self.__substitute is not None:
+            source, pixbuf = ("substitute", self.__substitute_count), self.__substitute
+        else:
+            source = self.__image.best_available_level(self.__image.level_for_zoom(self.__zoom))
+            pixbuf = self.__image.get_level(source)
+        level_width, level_height = pixbuf.get_width(), pixbuf.get_height()
+        scale = self.__zoom * self.__image.width / level_width
+        x0, y0, x1, y1 = cairo_ctxt.clip_extents()
+        tx0, ty0 = int(max(0, x0 / scale) // self.TILE_SIZE), int(max(0, y0 / scale) // self.TILE_SIZE)
+        tx1 = int(min(level_width - 1, x1 / scale) // self.TILE_SIZE)
+        ty1 = int(min(level_height - 1, y1 / scale) // self.TILE_SIZE)
+        cairo_ctxt.save()
+        cairo_ctxt.scale(scale, scale)
+        unfiltered = []
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                surface = None
+                if self.__tile_filter is not None:
+                    surface = self.__tiles.get_tile((source, self.__tile_filter, tx, ty))
+                    if surface is None:
+                        unfiltered.append((tx, ty))
+                if surface is None:
+                    # the plain tile stands in until the filtered one is ready
+                    surface = self._get_tile(source, pixbuf, tx, ty)
+                x, y = tx * self.TILE_SIZE, ty * self.TILE_SIZE
+                cairo_ctxt.set_source_surface(surface, x, y)
+                pattern = cairo_ctxt.get_source()
+                # pad the tile edges so that no seams show when scaling
+                pattern.set_extend(cairo.EXTEND_PAD)
+                pattern.set_filter(cairo.FILTER_FAST if scale > 1.0 else cairo.FILTER_GOOD)
+                cairo_ctxt.rectangle(x, y, surface.get_width(), surface.get_height())
+                cairo_ctxt.fill()
+        cairo_ctxt.restore()
+        if unfiltered:
+            self._request_filtered_tiles(source, pixbuf, unfiltered)
+        if self.__seln is not None:
+            x, y, width, height = (value * self.__zoom for value in self.__seln)
+            cairo_ctxt.set_line_width(1.0)
+            cairo_ctxt.set_source_rgb(0.0, 0.0, 0.0)
+            cairo_ctxt.rectangle(x + 0.5, y + 0.5, width, height)
+            cairo_ctxt.stroke()
+            cairo_ctxt.set_dash([4.0])
+            cairo_ctxt.set_source_rgb(1.0, 1.0, 1.0)
+            cairo_ctxt.rectangle(x + 0.5, y + 0.5, width, height)
+            cairo_ctxt.stroke()
+            cairo_ctxt.set_dash([])
+        if self.__points:
+            cairo_ctxt.set_line_width(2.0)
+            xys = [(x * self.__zoom, y * self.__zoom) for x, y in self.__points]
+            for rgb, width in [((0.0, 0.0, 0.0), 3.0), ((1.0, 1.0, 0.0), 1.0)]:
+                cairo_ctxt.set_source_rgb(*rgb)
+                cairo_ctxt.set_line_width(width)
+                for x, y in xys:
+                    gpaint.draw_circle(cairo_ctxt, x, y, 6.0)
+                cairo_ctxt.move_to(*xys[0])
+                for x, y in xys[1:]:
+                    cairo_ctxt.line_to(x, y)
+                if len(xys) == self.__points_wanted or not self.__points_wanted:
+                    cairo_ctxt.close_path()
+                cairo_ctxt.stroke()
+        return True
+    def pick_points(self, npoints, points_acb):
+        """Have the next npoints left button clicks pick points on the
+        image and pass their (image) coordinates to points_acb
+        """
+        self.__points = []
+        self.__points_wanted = npoints
+        self.__points_acb = points_acb
+        self._set_seln(None)
+    def clear_points(self):
+        self.__points = []
+        self.__points_wanted = 0
+        self.__points_acb = None
+        self._layout.queue_draw()
+    @property
+    def picking_points(self):
+        return self.__points_wanted > len(self.__points)
+    def get_displayed_pixbuf(self):
+        """Return the pixbuf for the level of detail currently displayed
+        and the scale from image coordinates to its coordinates
+        """
+        level = self.__image.best_available_level(self.__image.level_for_zoom(self.__zoom))
+        pixbuf = self.__image.get_level(level)
+        return (pixbuf, pixbuf.get_width() / self.__image.width)
+    def _event_image_xy(self, event):
+        return (event.x / self.__zoom, event.y / self.__zoom)
+    def _set_seln(self, seln):
+        self.__seln = seln
+        condns = self.AC_SELN_MADE if seln is not None else 0
+        self.action_groups.update_condns(actions.MaskedCondns(condns, self.AC_SELN_MADE))
+        self._layout.queue_draw()
+    def _button_press_cb(self, widget, event):
+        if event.button == 1 and self.__image is not None and self.picking_points:
+            self.__points.append(self._event_image_xy(event))
+            self._layout.queue_draw()
+            if not self.picking_points:
+                self.__points_acb(list(self.__points))
+            return True
+        elif event.button == 1 and self.__image is not None:
+            self.__seln_start = self._event_image_xy(event)
+            self._set_seln(None)
+            return True
+        return False
+    def _motion_notify_cb(self, widget, event):
+        if self.__seln_start is None:
+            return False
+        x0, y0 = self.__seln_start
+        x1, y1 = self._event_image_xy(event)
+        x0, x1 = sorted((max(0, min(x0, self.__image.width)), max(0, min(x1, self.__image.width))))
+        y0, y1 = sorted((max(0, min(y0, self.__image.height)), max(0, min(y1, self.__image.height))))
+        self._set_seln((x0, y0, x1 - x0, y1 - y0) if x1 > x0 and y1 > y0 else None)
+        return True
+    def _button_release_cb(self, widget, event):
+        if event.button == 1 and self.__seln_start is not None:
+            self.__seln_start = None
+            return True
+        return False
+    def _scroll_event_cb(self, widget, event):
+        if self.__image is None or not event.state & Gdk.ModifierType.CONTROL_MASK:
+            return False
+        if event.direction == Gdk.ScrollDirection.UP:
+            self.set_zoom(self.__zoom * self.ZOOM_FACTOR)
+        elif event.direction == Gdk.ScrollDirection.DOWN:
+            self.set_zoom(self.__zoom / self.ZOOM_FACTOR)
+        return True
+    def get_selected_pixbuf(self):
+        """Return a copy of the selected part of the image at the level
+        of detail currently displayed (or None if there's no selection)
+        """
+        if self.__seln is None:
+            return None
+        pixbuf, scale = self.get_displayed_pixbuf()
+        return crop_pixbuf(pixbuf, self.__seln, scale)
+    def _cancel_copy(self):
+        if self.__copy_job is not None:
+            self.__copy_job.cancel()
+            self.__copy_job = None
+    def _copy_to_clipboard_cb(self, _action):
+        # samples must be copied at full resolution (which may need to
+        # be decoded first) so that estimators see the real pixels
+        if self.__seln is None:
+            return
+        self._cancel_copy()
+        self.__copy_job = gpaint.BackgroundJob(crop_full_resolution, (self.__image, self.__seln), self._selection_copied_cb, error_cb=self._copy_failed_cb).start()
+    def _copy_failed_cb(self, edata):
+        self.__copy_job = None
+        msg = _("Problem copying the selection: {}").format(edata)
+        dialogue.MessageDialog(parent=self.get_toplevel(), type=Gtk.MessageType.ERROR, buttons=Gtk.ButtonsType.CLOSE, text=msg).run()
+    def _selection_copied_cb(self, pixbuf):
+        self.__copy_job = None
+        cbd = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
+        cbd.set_image(pixbuf)
+GObject.signal_new("tile-filter-failed", TiledImageView, GObject.SignalFlags.RUN_LAST, None, (GObject.TYPE_PYOBJECT,))
@@ -40,60 +40,22 @@ from ..gtx import recollect
 from ..gtx import screen
 from ..gtx import tlview
 
-from ..pixbufx import iview
-
 from . import gpaint
+from . import grgbh
 from . import lexicon
+from . import pimage
+from . import psample
+from . import ptiming
 from . import vpaint
 from . import pedit
 
 __all__ = []
 __author__ = "Peter Williams <pwil3058@gmail.com>"
 
-BLOB = collections.namedtuple("BLOB", ["paint", "parts"])
-
-class Mixture:
-    PAINT = None
-    def __init__(self, blobs):
-        rgb = self.PAINT.COLOUR.RGB.BLACK
-        self.characteristics = self.PAINT.CHARACTERISTICS()
-        parts = 0
-        for blob in blobs:
-            parts += blob.parts
-            rgb += blob.paint.rgb * blob.parts
-            self.characteristics += blob.paint.characteristics * blob.parts
-        assert parts > 0, "Empty Mixture"
-        self.colour = self.PAINT.COLOUR(rgb / parts)
-        self.characteristics /= parts
-        self.blobs = sorted(blobs, key=lambda x: x.parts, reverse=True)
-    def __getattr__(self, attr_name):
-        try:
-            return getattr(self.colour, attr_name)
-        except AttributeError:
-            return getattr(self.characteristics, attr_name)
-    def _components_str(self):
-        string = _("\nComponents:\n")
-        for blob in self.blobs:
-            string += _("\t{0} Part(s): {1}\n").format(blob.parts, blob.paint)
-        return string
-    def __str__(self):
-        return _("Mixed Colour: ") + Colour.__str__(self) + self._components_str()
-    def contains_paint(self, paint):
-        for blob in self.blobs:
-            if blob.paint == paint:
-                return True
-        return False
-
-class MixedPaint:
-    MIXTURE = None
-    def __init__(self, blobs, name, notes=""):
-        self.mixture = self.MIXTURE(blobs)
-        self.name = name
-        self.notes = notes
-    def __getattr__(self, attr_name):
-        return getattr(self.mixture, attr_name)
-    def __str__(self):
-        return ("Name: \"{0}\" Notes: \"{1}\"").format(self.name, self.notes) + Colour.__str__(self) + self._components_str()
+# the GTK-free model is in vpaint (these are kept for existing users)
+BLOB = vpaint.BLOB
+Mixture = vpaint.Mixture
+MixedPaint = vpaint.MixedPaint
 
 class NewMixedColourDialogue(dialogue.Dialog):
     COLOUR = None
@@ -128,170 +90,279 @@ class NewMixedColourDialogue(dialogue.Dialog):
 def paint_parts_adjustment():
     return Gtk.Adjustment(0, 0, 999, 1, 10, 0)
 
-class PaintPartsSpinButton(Gtk.EventBox, actions.CAGandUIManager):
+class PaintPartsGrid(Gtk.DrawingArea, actions.CAGandUIManager):
+    """
+    A grid of paint swatches, names and part counts drawn as a single
+    widget with the parts of one paint at a time being edited
+    """
     PAINT_INFO_DIALOGUE = gpaint.PaintColourInformationDialogue
     UI_DESCR = """
         <ui>
-            <popup name="paint_spinner_popup">
+            <popup name="paint_parts_popup">
                 <menuitem action="paint_colour_info"/>
                 <menuitem action="remove_me"/>
             </popup>
         </ui>
         """
-    def __init__(self, paint, sensitive=True, *kwargs):
-        Gtk.EventBox.__init__(self)
-        actions.CAGandUIManager.__init__(self, popup="/paint_spinner_popup")
-        self.add_events(Gdk.EventMask.BUTTON_PRESS_MASK|Gdk.EventMask.BUTTON_RELEASE_MASK)
-        self.set_size_request(85, 40)
-        self.paint = paint
-        self.entry = Gtk.SpinButton()
-        self.entry.set_adjustment(paint_parts_adjustment())
-        self.entry.set_numeric(True)
-        self.entry.connect("button_press_event", self._button_press_cb)
-        self.set_tooltip_text(str(paint))
-        frame = Gtk.Frame()
-        frame.set_shadow_type(Gtk.ShadowType.ETCHED_IN)
-        hbox = Gtk.HBox()
-        hbox.pack_start(coloured.ColouredLabel(self.paint.name, self.paint.rgb.gdk_color), expand=True, fill=True, padding=0)
-        vbox = Gtk.VBox()
-        vbox.pack_start(gpaint.ColouredRectangle(self.paint), expand=True, fill=True, padding=0)
-        vbox.pack_start(self.entry, expand=False, fill=True, padding=0)
-        vbox.pack_start(gpaint.ColouredRectangle(self.paint), expand=True, fill=True, padding=0)
-        hbox.pack_start(vbox, expand=False, fill=True, padding=0)
-        hbox.pack_start(gpaint.ColouredRectangle(self.paint, (5, -1)), expand=False, fill=True, padding=0)
-        frame.add(hbox)
-        self.add(frame)
-        self.set_sensitive(sensitive)
-        self.show_all()
+    AC_HAVE_POPUP_PAINT, _DUMMY = actions.ActionCondns.new_flags_and_mask(1)
+    NCOLS = 6
+    CELL_WIDTH = 85
+    CELL_HEIGHT = 40
+    def __init__(self, sensitive=True):
+        Gtk.DrawingArea.__init__(self)
+        # the parts are looked up by paint and the cells by position
+        self.__parts = {}
+        self.__paints = []
+        self.__sensitive = sensitive
+        self.__focus = None
+        self.__popup_paint = None
+        self.set_can_focus(True)
+        self.set_has_tooltip(True)
+        self.add_events(Gdk.EventMask.BUTTON_PRESS_MASK|Gdk.EventMask.SCROLL_MASK|Gdk.EventMask.KEY_PRESS_MASK)
+        self.connect("draw", self.expose_cb)
+        self.connect("query-tooltip", self._query_tooltip_cb)
+        self.connect("scroll-event", self._scroll_event_cb)
+        self.connect("key-press-event", self._key_press_cb)
+        self.connect("focus-in-event", lambda _widget, _event: self.queue_draw())
+        self.connect("focus-out-event", lambda _widget, _event: self.queue_draw())
+        # NB: this needs to run before the popup menu handler
+        self.connect("button_press_event", self._grid_button_press_cb)
+        # typed in values are edited in a spin button in a pop over
+        self.__editing = None
+        self.__editor = Gtk.SpinButton()
+        self.__editor.set_adjustment(paint_parts_adjustment())
+        self.__editor.set_numeric(True)
+        self.__editor.connect("value-changed", self._editor_value_changed_cb)
+        self.__editor.connect("activate", lambda _entry: self.__popover.hide())
+        self.__popover = Gtk.Popover.new(self)
+        self.__popover.add(self.__editor)
+        self.__editor.show()
+        actions.CAGandUIManager.__init__(self, popup="/paint_parts_popup")
+        self.action_groups.update_condns(actions.MaskedCondns(0, self.AC_HAVE_POPUP_PAINT))
+        self._update_size_request()
+        self.show()
     def populate_action_groups(self):
         """
         Populate action groups ready for UI initialization.
         """
-        self.action_groups[actions.AC_DONT_CARE].add_actions(
+        self.action_groups[self.AC_HAVE_POPUP_PAINT].add_actions(
             [
                 ("paint_colour_info", Gtk.STOCK_INFO, None, None,
                  _("Detailed information for this paint colour."),
                  self._paint_colour_info_cb
                 ),
                 ("remove_me", Gtk.STOCK_REMOVE, None, None,
-                 _("Remove this paint paint from the mixer."),
+                 _("Remove this paint from the mixer."),
+                 self._remove_me_cb
                 ),
             ]
         )
-    def get_parts(self):
-        return self.entry.get_value_as_int()
-    def set_parts(self, parts):
-        return self.entry.set_value(parts)
-    def divide_parts(self, divisor):
-        return self.entry.set_value(self.entry.get_value_as_int() / divisor)
-    def get_blob(self):
-        return BLOB(self.paint, self.get_parts())
-    def set_sensitive(self, sensitive):
-        self.entry.set_sensitive(sensitive)
+    def _update_size_request(self):
+        nrows = (len(self.__paints) + self.NCOLS - 1) // self.NCOLS
+        self.set_size_request(self.NCOLS * self.CELL_WIDTH, nrows * self.CELL_HEIGHT)
+    def _get_cell_rectangle(self, index):
+        width = self.get_allocated_width() / self.NCOLS
+        row, col = divmod(index, self.NCOLS)
+        return (col * width, row * self.CELL_HEIGHT, width, self.CELL_HEIGHT)
+    def _get_cell_gdk_rectangle(self, index):
+        x, y, width, height = self._get_cell_rectangle(index)
+        rect = Gdk.Rectangle()
+        rect.x, rect.y, rect.width, rect.height = int(x), int(y), int(width), int(height)
+        return rect
+    def _get_index_at_xy(self, x, y):
+        col = int(x * self.NCOLS // max(1, self.get_allocated_width()))
+        index = int(y // self.CELL_HEIGHT) * self.NCOLS + col
+        if 0 <= col < self.NCOLS and 0 <= index < len(self.__paints):
+            return index
+        return None
+    def _queue_draw_cell(self, index):
+        x, y, width, height = self._get_cell_rectangle(index)
+        self.queue_draw_area(int(x), int(y), int(width) + 2, int(height) + 2)
+    def _set_focus(self, index):
+        if self.__focus is not None and self.__focus < len(self.__paints):
+            self._queue_draw_cell(self.__focus)
+        self.__focus = index
+        if index is not None:
+            self._queue_draw_cell(index)
+    def expose_cb(self, _widget, cairo_ctxt):
+        # only the cells that need it get redrawn
+        x1, y1, x2, y2 = cairo_ctxt.clip_extents()
+        first = int(y1 // self.CELL_HEIGHT) * self.NCOLS
+        last = min(len(self.__paints), (int(y2 // self.CELL_HEIGHT) + 1) * self.NCOLS)
+        cairo_ctxt.set_font_size(11)
+        for index in range(first, last):
+            self._draw_cell(cairo_ctxt, index)
+        return True
+    def _draw_cell(self, cairo_ctxt, index):
+        paint = self.__paints[index]
+        x, y, width, height = self._get_cell_rectangle(index)
+        cairo_ctxt.set_source_rgb(*paint.rgb.cairo_rgb)
+        cairo_ctxt.rectangle(x + 1, y + 1, width - 2, height - 2)
+        cairo_ctxt.fill()
+        # the name (clipped to the cell)
+        cairo_ctxt.save()
+        cairo_ctxt.rectangle(x + 2, y + 2, width - 4, height - 4)
+        cairo_ctxt.clip()
+        cairo_ctxt.set_source_rgb(*paint.rgb.best_foreground().cairo_rgb)
+        cairo_ctxt.move_to(x + 4, y + 14)
+        cairo_ctxt.show_text(paint.name)
+        cairo_ctxt.restore()
+        # the parts
+        box_x, box_y = x + width - 40, y + height - 19
+        if self.__sensitive:
+            cairo_ctxt.set_source_rgb(1.0, 1.0, 1.0)
+        else:
+            cairo_ctxt.set_source_rgb(0.85, 0.85, 0.85)
+        cairo_ctxt.rectangle(box_x, box_y, 36, 16)
+        cairo_ctxt.fill()
+        text = str(self.__parts[paint])
+        extents = cairo_ctxt.text_extents(text)
+        cairo_ctxt.set_source_rgb(0.0, 0.0, 0.0)
+        cairo_ctxt.move_to(box_x + 33 - extents[4], box_y + 12)
+        cairo_ctxt.show_text(text)
+        # and the frame
+        if index == self.__focus and self.has_focus():
+            cairo_ctxt.set_line_width(3)
+        else:
+            cairo_ctxt.set_line_width(1)
+        cairo_ctxt.rectangle(x + 1, y + 1, width - 2, height - 2)
+        cairo_ctxt.stroke()
+    def _query_tooltip_cb(self, widget, x, y, keyboard_mode, tooltip):
+        index = self.__focus if keyboard_mode else self._get_index_at_xy(x, y)
+        if index is None or index >= len(self.__paints):
+            return False
+        tooltip.set_text(str(self.__paints[index]))
+        # so that the tooltip is updated when the pointer changes cell
+        tooltip.set_tip_area(self._get_cell_gdk_rectangle(index))
+        return True
+    def _grid_button_press_cb(self, widget, event):
+        index = self._get_index_at_xy(event.x, event.y)
+        if event.button == 1:
+            self.grab_focus()
+            self._set_focus(index)
+            if index is not None and event.type == Gdk.EventType._2BUTTON_PRESS:
+                self._start_editing(index)
+            return True
+        elif event.button == 3:
+            self.__popup_paint = None if index is None else self.__paints[index]
+            if self.__popup_paint is None:
+                self.action_groups.update_condns(actions.MaskedCondns(0, self.AC_HAVE_POPUP_PAINT))
+            else:
+                self.action_groups.update_condns(actions.MaskedCondns(self.AC_HAVE_POPUP_PAINT, self.AC_HAVE_POPUP_PAINT))
+        # let the popup menu handler have it
+        return False
+    def _scroll_event_cb(self, widget, event):
+        index = self._get_index_at_xy(event.x, event.y)
+        if index is None or event.direction not in [Gdk.ScrollDirection.UP, Gdk.ScrollDirection.DOWN]:
+            return False
+        step = 10 if event.get_state() & Gdk.ModifierType.SHIFT_MASK else 1
+        self._change_parts_at(index, step if event.direction == Gdk.ScrollDirection.UP else -step)
+        return True
+    def _key_press_cb(self, widget, event):
+        if not self.__paints:
+            return False
+        index = 0 if self.__focus is None else self.__focus
+        if event.keyval in [Gdk.KEY_Left, Gdk.KEY_Right]:
+            index += -1 if event.keyval == Gdk.KEY_Left else 1
+            if 0 <= index < len(self.__paints):
+                self._set_focus(index)
+            return True
+        elif event.keyval in [Gdk.KEY_Up, Gdk.KEY_plus, Gdk.KEY_KP_Add]:
+            self._change_parts_at(index, 1)
+        elif event.keyval in [Gdk.KEY_Down, Gdk.KEY_minus, Gdk.KEY_KP_Subtract]:
+            self._change_parts_at(index, -1)
+        elif event.keyval == Gdk.KEY_Page_Up:
+            self._change_parts_at(index, 10)
+        elif event.keyval == Gdk.KEY_Page_Down:
+            self._change_parts_at(index, -10)
+        elif event.keyval in [Gdk.KEY_Return, Gdk.KEY_KP_Enter, Gdk.KEY_space]:
+            self._start_editing(index)
+        else:
+            return False
+        self._set_focus(index)
+        return True
+    def _start_editing(self, index):
+        if not self.__sensitive:
+            return
+        self.__editing = None
+        self.__editor.set_value(self.__parts[self.__paints[index]])
+        self.__editing = index
+        self.__popover.set_pointing_to(self._get_cell_gdk_rectangle(index))
+        self.__popover.show()
+        self.__editor.grab_focus()
+    def _editor_value_changed_cb(self, spinbutton):
+        if self.__editing is not None:
+            self._set_parts_at(self.__editing, spinbutton.get_value_as_int())
+    def _change_parts_at(self, index, delta):
+        if self.__sensitive:
+            self._set_parts_at(index, min(999, max(0, self.__parts[self.__paints[index]] + delta)))
+    def _set_parts_at(self, index, parts):
+        paint = self.__paints[index]
+        if self.__parts[paint] != parts:
+            self.__parts[paint] = parts
+            self._queue_draw_cell(index)
+            self.emit("contributions-changed", self.get_contributions())
     def _paint_colour_info_cb(self, _action):
-        self.PAINT_INFO_DIALOGUE(self.paint).show()
-
-class PaintPartsSpinButtonBox(Gtk.VBox):
-    # TODO: implement PaintPartsSpinButtonBox() using Gtk.FlowBox
-    """
-    A dynamic array of coloured spinners
-    """
-    def __init__(self, sensitive=True):
-        Gtk.VBox.__init__(self)
-        self.__spinbuttons = []
-        self.__hboxes = []
-        self.__count = 0
-        self.__ncols = 6
-        self.set_sensitive(sensitive)
-        self.__suppress_change_notification = False
+        self.PAINT_INFO_DIALOGUE(self.__popup_paint).show()
+    def _remove_me_cb(self, _action):
+        """
+        Signal anybody who cares that the popup paint should be removed
+        """
+        self.emit("remove-paint", self.__popup_paint)
     def set_sensitive(self, sensitive):
         self.__sensitive = sensitive
-        for sb in self.__spinbuttons:
-            sb.set_sensitive(sensitive)
+        if not sensitive:
+            self.__popover.hide()
+        self.queue_draw()
     def add_paint(self, paint):
         """
-        Add a spinner for the given paint to the box
+        Add a cell for the given paint to the grid
         """
-        spinbutton = PaintPartsSpinButton(paint, self.__sensitive)
-        spinbutton.action_groups.connect_activate("remove_me", self._remove_me_cb, spinbutton)
-        spinbutton.entry.connect("value-changed", self._spinbutton_value_changed_cb)
-        self.__spinbuttons.append(spinbutton)
-        self._pack_append(spinbutton)
-        self.show_all()
-    def _pack_append(self, spinbutton):
-        if self.__count % self.__ncols == 0:
-            self.__hboxes.append(Gtk.HBox())
-            self.pack_start(self.__hboxes[-1], expand=False, fill=True, padding=0)
-        self.__hboxes[-1].pack_start(spinbutton, expand=True, fill=True, padding=0)
-        self.__count += 1
-    def _unpack_all(self):
-        """
-        Unpack all the spinbuttons and hboxes
-        """
-        for hbox in self.__hboxes:
-            for child in hbox.get_children():
-                hbox.remove(child)
-            self.remove(hbox)
-        self.__hboxes = []
-        self.__count = 0
-    def _remove_me_cb(self, _action, spinbutton):
-        """
-        Signal anybody who cares that spinbutton.paint should be removed
-        """
-        self.emit("remove-paint", spinbutton.paint)
-    def _spinbutton_value_changed_cb(self, spinbutton):
-        """
-        Signal those interested that our contributions have changed
-        """
-        if not self.__suppress_change_notification:
-            self.emit("contributions-changed", self.get_contributions())
+        self.__parts[paint] = 0
+        self.__paints.append(paint)
+        self._update_size_request()
+        self._queue_draw_cell(len(self.__paints) - 1)
     def del_paint(self, paint):
-        # do this the easy way by taking them all out and putting back
-        # all but the one to be deleted
-        self._unpack_all()
-        for spinbutton in self.__spinbuttons[:]:
-            if spinbutton.paint == paint:
-                self.__spinbuttons.remove(spinbutton)
-            else:
-                self._pack_append(spinbutton)
-        self.show_all()
+        del self.__parts[paint]
+        self.__paints.remove(paint)
+        self.__editing = None
+        self.__popover.hide()
+        if self.__focus is not None and self.__focus >= len(self.__paints):
+            self.__focus = len(self.__paints) - 1 if self.__paints else None
+        self._update_size_request()
+        self.queue_draw()
     def get_paints(self):
-        return [spinbutton.paint for spinbutton in self.__spinbuttons]
+        return list(self.__paints)
     def get_paints_with_zero_parts(self):
-        return [spinbutton.paint for spinbutton in self.__spinbuttons if spinbutton.get_parts() == 0]
+        return [paint for paint in self.__paints if self.__parts[paint] == 0]
     def has_paint(self, paint):
         """
         Do we already contain the given paint?
         """
-        for spinbutton in self.__spinbuttons:
-            if spinbutton.paint == paint:
-                return True
-        return False
+        return paint in self.__parts
     def get_contributions(self):
         """
         Return a list of paint paints with non zero parts
         """
-        return [spinbutton.get_blob() for spinbutton in self.__spinbuttons if spinbutton.get_parts() > 0]
+        return [BLOB(paint, self.__parts[paint]) for paint in self.__paints if self.__parts[paint] > 0]
     def divide_parts(self, divisor):
         if divisor is not None and divisor > 1:
-            self.__suppress_change_notification = True
-            for spinbutton in self.__spinbuttons:
-                spinbutton.divide_parts(divisor)
-            self.__suppress_change_notification = False
+            for paint in self.__paints:
+                self.__parts[paint] //= divisor
+            self.queue_draw()
             self.emit("contributions-changed", self.get_contributions())
     def simplify_parts(self):
-        self.divide_parts(mathx.gcd(*[sb.get_parts() for sb in self.__spinbuttons]))
+        self.divide_parts(mathx.gcd(*[self.__parts[paint] for paint in self.__paints]))
     def reset_parts(self):
         """
-        Reset all spinbutton values to zero
+        Reset all parts to zero
         """
-        self.__suppress_change_notification = True
-        for spinbutton in self.__spinbuttons:
-            spinbutton.set_parts(0)
-        self.__suppress_change_notification = False
+        for paint in self.__paints:
+            self.__parts[paint] = 0
+        self.queue_draw()
         self.emit("contributions-changed", self.get_contributions())
-GObject.signal_new("remove-paint", PaintPartsSpinButtonBox, GObject.SignalFlags.RUN_LAST, None, (GObject.TYPE_PYOBJECT,))
-GObject.signal_new("contributions-changed", PaintPartsSpinButtonBox, GObject.SignalFlags.RUN_LAST, None, (GObject.TYPE_PYOBJECT,))
+GObject.signal_new("remove-paint", PaintPartsGrid, GObject.SignalFlags.RUN_LAST, None, (GObject.TYPE_PYOBJECT,))
+GObject.signal_new("contributions-changed", PaintPartsGrid, GObject.SignalFlags.RUN_LAST, None, (GObject.TYPE_PYOBJECT,))
 
 class MatchedPaintListStore(gpaint.PaintListStore):
     COLUMN_DEFS = list()
@@ -419,10 +490,10 @@ class MixedPaintInformationDialogue(dialogue.SimpleDialog):
     def __init__(self, colour, target_colour=None, parent=None):
         dialogue.SimpleDialog.__init__(self, title=_("Mixed Colour: {}").format(colour.name), parent=parent)
         vbox = self.get_content_area()
-        vbox.pack_start(coloured.ColouredLabel(colour.name, colour.gdk_color), expand=False, fill=True, padding=0)
-        vbox.pack_start(coloured.ColouredLabel(colour.notes, colour.gdk_color), expand=False, fill=True, padding=0)
+        vbox.pack_start(coloured.ColouredLabel(colour.name, grgbh.gdk_color(colour)), expand=False, fill=True, padding=0)
+        vbox.pack_start(coloured.ColouredLabel(colour.notes, grgbh.gdk_color(colour)), expand=False, fill=True, padding=0)
         if target_colour:
-            vbox.pack_start(coloured.ColouredLabel(_("Target"), target_colour.gdk_color), expand=False, fill=True, padding=0)
+            vbox.pack_start(coloured.ColouredLabel(_("Target"), grgbh.gdk_color(target_colour)), expand=False, fill=True, padding=0)
         if hasattr(colour, "warmth"):
             vbox.pack_start(gpaint.HCVWDisplay(colour=colour, target_colour=target_colour), expand=False, fill=True, padding=0)
         else:
@@ -441,12 +512,12 @@ class MixedPaintInformationDialogue(dialogue.SimpleDialog):
 def notes_cell_data_func(column, cell, model, model_iter, *args):
     colour = model[model_iter][0]
     cell.set_property("text", colour.notes)
-    cell.set_property("background-gdk", colour.gdk_color)
-    cell.set_property("foreground-gdk", colour.best_foreground_gdk_color())
+    cell.set_property("background-gdk", grgbh.gdk_color(colour))
+    cell.set_property("foreground-gdk", grgbh.best_foreground_gdk_color(colour))
 
 def match_cell_data_func(column, cell, model, model_iter, attribute):
     colour = model[model_iter][1]
-    cell.set_property("background-gdk", colour.gdk_color)
+    cell.set_property("background-gdk", grgbh.gdk_color(colour))
 
 def generate_matched_paint_list_spec(view, model):
     """
@@ -527,6 +598,20 @@ class MatchedPaintListView(gpaint.PaintListView):
 
 recollect.define('reference_image_viewer', 'last_file', recollect.Defn(str, ''))
 recollect.define('reference_image_viewer', 'last_size', recollect.Defn(str, ''))
+recollect.define('reference_image_viewer', 'value_bands', recollect.Defn(int, 5))
+
+def paint_map_fm_image(image, palette, max_pixels, progress=None):
+    """Return the packed RGB pixels, size and per paint pixel counts of
+    the paint map of the image decoded at the largest level that has
+    no more than max_pixels pixels
+    """
+    level = 0
+    while level < image.max_level and image.get_level_size(level)[0] * image.get_level_size(level)[1] > max_pixels:
+        level += 1
+    pixbuf = image.decode_level(level)
+    # this runs on a thread of the GUI process so mustn't fork workers
+    indices, counts = psample.paint_map(psample.PixelBuffer.fm_pixbuf(pixbuf), palette, mp_context=psample.thread_safe_mp_context(), progress=progress)
+    return (psample.render_paint_map(indices, palette), pixbuf.get_width(), pixbuf.get_height(), counts)
 
 class ReferenceImageViewer(Gtk.Window, actions.CAGandUIManager):
     """
@@ -543,7 +628,14 @@ class ReferenceImageViewer(Gtk.Window, actions.CAGandUIManager):
     </ui>
     """
     TITLE_TEMPLATE = _("mcmmtk: Reference Image: {}")
-    def __init__(self, parent=None):
+    PAINT_MAP_MAX_PIXELS = 4 * 1024 * 1024
+    STUDIES = collections.OrderedDict([
+        ("image", _("Image")),
+        ("value", _("Value")),
+        ("chroma", _("Chroma")),
+        ("value_bands", _("Value Bands")),
+    ])
+    def __init__(self, parent=None, paints_acb=None):
         Gtk.Window.__init__(self, Gtk.WindowType.TOPLEVEL)
         actions.CAGandUIManager.__init__(self)
         last_size = recollect.get("reference_image_viewer", "last_size")
@@ -551,33 +643,64 @@ class ReferenceImageViewer(Gtk.Window, actions.CAGandUIManager):
             self.set_default_size(*eval(last_size))
         self.set_icon_from_file(icons.APP_ICON_FILE)
         self.set_size_request(300, 200)
-        last_image_file = recollect.get("reference_image_viewer", "last_file")
-        if os.path.isfile(last_image_file):
-            try:
-                pixbuf = GdkPixbuf.Pixbuf.new_from_file(last_image_file)
-            except GLib.GError:
-                pixbuf = None
-                last_image_file = None
-        else:
-            pixbuf = None
-            last_image_file = None
-        self.set_title(self.TITLE_TEMPLATE.format(None if last_image_file is None else os.path.relpath(last_image_file)))
-        self.ref_image = iview.PixbufView()
+        self.ref_image = pimage.TiledImageView()
         self._menubar = self.ui_manager.get_widget("/reference_image_menubar")
         self.buttons = self.ref_image.action_groups.create_action_button_box([
             "zoom_in",
             "zoom_out",
+            "zoom_to_fit",
         ])
+        self.__paints_acb = paints_acb
+        self.__paint_map_job = None
+        self._paint_map_button = Gtk.ToggleButton(_("Paint Map"))
+        self._paint_map_button.set_tooltip_text(_("Show which of the available paints is the closest match for each part of the image."))
+        self._paint_map_button.connect("toggled", self._paint_map_toggled_cb)
+        self.buttons.pack_start(self._paint_map_button, expand=True, fill=True, padding=0)
+        self._study_chooser = Gtk.ComboBoxText()
+        for study_id, label in self.STUDIES.items():
+            self._study_chooser.append(study_id, label)
+        self._study_chooser.set_active_id("image")
+        self._study_chooser.set_tooltip_text(_("Show the image or a study of its values or chromas."))
+        self._study_chooser.connect("changed", lambda _widget: self._update_study())
+        self.ref_image.connect("tile-filter-failed", self._tile_filter_failed_cb)
+        self._value_bands = Gtk.SpinButton.new_with_range(2, 10, 1)
+        self._value_bands.set_value(recollect.get("reference_image_viewer", "value_bands"))
+        self._value_bands.set_tooltip_text(_("Number of bands in the value bands study."))
+        self._value_bands.connect("value-changed", self._value_bands_changed_cb)
+        self.buttons.pack_start(self._study_chooser, expand=False, fill=True, padding=0)
+        self.buttons.pack_start(self._value_bands, expand=False, fill=True, padding=0)
+        self._paint_map_progress_bar = Gtk.ProgressBar()
+        self._paint_map_legend = Gtk.Grid()
+        self._paint_map_legend.set_column_spacing(4)
+        self._legend_window = Gtk.ScrolledWindow()
+        self._legend_window.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+        self._legend_window.add(self._paint_map_legend)
+        hbox = Gtk.HBox()
+        hbox.pack_start(self.ref_image, expand=True, fill=True, padding=0)
+        hbox.pack_start(self._legend_window, expand=False, fill=True, padding=0)
         vbox = Gtk.VBox()
         vbox.pack_start(self._menubar, expand=False, fill=True, padding=0)
-        vbox.pack_start(self.ref_image, expand=True, fill=True, padding=0)
+        vbox.pack_start(hbox, expand=True, fill=True, padding=0)
+        vbox.pack_start(self._paint_map_progress_bar, expand=False, fill=True, padding=0)
         vbox.pack_start(self.buttons, expand=False, fill=True, padding=0)
         self.add(vbox)
         self.set_transient_for(parent)
         self.connect("size-allocate", self._size_allocation_cb)
+        self.connect("destroy", lambda _widget: self._cancel_paint_map())
         self.show_all()
-        if pixbuf is not None:
-            self.ref_image.set_pixbuf(pixbuf)
+        self._legend_window.hide()
+        self._paint_map_progress_bar.hide()
+        if paints_acb is None:
+            self._paint_map_button.hide()
+        last_image_file = recollect.get("reference_image_viewer", "last_file")
+        if os.path.isfile(last_image_file):
+            try:
+                self.ref_image.set_image_file(last_image_file)
+            except GLib.GError:
+                last_image_file = None
+        else:
+            last_image_file = None
+        self.set_title(self.TITLE_TEMPLATE.format(None if last_image_file is None else os.path.relpath(last_image_file)))
     def _size_allocation_cb(self, widget, allocation):
         recollect.set("reference_image_viewer", "last_size", "({0.width}, {0.height})".format(allocation))
     def populate_action_groups(self):
@@ -613,18 +736,85 @@ class ReferenceImageViewer(Gtk.Window, actions.CAGandUIManager):
             filepath = dlg.get_filename()
             dlg.destroy()
             try:
-                pixbuf = GdkPixbuf.Pixbuf.new_from_file(filepath)
+                self.ref_image.set_image_file(filepath)
             except GLib.GError:
                 msg = _("{}: Problem extracting image from file.").format(filepath)
                 dialogue.MessageDialog(type=Gtk.MessageType.ERROR, buttons=Gtk.ButtonsType.CLOSE, text=msg).run()
                 return
+            self._paint_map_button.set_active(False)
             recollect.set("reference_image_viewer", "last_file", filepath)
             self.set_title(self.TITLE_TEMPLATE.format(None if filepath is None else os.path.relpath(filepath)))
-            self.ref_image.set_pixbuf(pixbuf)
         else:
             dlg.destroy()
     def _close_reference_image_viewer_cb(self, _action):
         self.get_toplevel().destroy()
+    def _update_study(self):
+        study_id = self._study_chooser.get_active_id()
+        if study_id == "value":
+            tile_filter = psample.value_study
+        elif study_id == "chroma":
+            tile_filter = psample.chroma_study
+        elif study_id == "value_bands":
+            tile_filter = psample.ValueBandsStudy(self._value_bands.get_value_as_int())
+        else:
+            tile_filter = None
+        self.ref_image.set_tile_filter(tile_filter)
+    def _tile_filter_failed_cb(self, _widget, edata):
+        self._study_chooser.set_active_id("image")
+        msg = _("Problem rendering study: {}").format(edata)
+        dialogue.MessageDialog(type=Gtk.MessageType.ERROR, buttons=Gtk.ButtonsType.CLOSE, text=msg).run()
+    def _value_bands_changed_cb(self, spin_button):
+        recollect.set("reference_image_viewer", "value_bands", str(spin_button.get_value_as_int()))
+        self._update_study()
+    def _cancel_paint_map(self):
+        if self.__paint_map_job is not None:
+            self.__paint_map_job.cancel()
+            self.__paint_map_job = None
+        self._paint_map_progress_bar.hide()
+    def _paint_map_toggled_cb(self, button):
+        self._cancel_paint_map()
+        self.ref_image.set_substitute_pixbuf(None)
+        self._legend_window.hide()
+        if not button.get_active() or self.ref_image.image is None:
+            return
+        paints = self.__paints_acb()
+        if not paints:
+            button.set_active(False)
+            return
+        if len(paints) > 256:
+            msg = _("Only the first 256 of the {} paints will be used in the paint map.").format(len(paints))
+            dialogue.MessageDialog(type=Gtk.MessageType.WARNING, buttons=Gtk.ButtonsType.CLOSE, text=msg).run()
+            paints = paints[:256]
+        palette = [[c / paint.rgb.ONE for c in paint.rgb] for paint in paints]
+        args = (self.ref_image.image, palette, self.PAINT_MAP_MAX_PIXELS)
+        done_cb = lambda result: self._paint_map_done_cb(paints, result)
+        self.__paint_map_job = gpaint.BackgroundJob(paint_map_fm_image, args, done_cb, self._paint_map_progress_bar.set_fraction, self._paint_map_failed_cb)
+        self.__paint_map_job.start()
+        self._paint_map_progress_bar.set_fraction(0.0)
+        self._paint_map_progress_bar.show()
+    def _paint_map_failed_cb(self, edata):
+        self.__paint_map_job = None
+        self._paint_map_progress_bar.hide()
+        self._paint_map_button.set_active(False)
+        msg = _("Problem making paint map: {}").format(edata)
+        dialogue.MessageDialog(type=Gtk.MessageType.ERROR, buttons=Gtk.ButtonsType.CLOSE, text=msg).run()
+    def _paint_map_done_cb(self, paints, result):
+        self.__paint_map_job = None
+        self._paint_map_progress_bar.hide()
+        rgb_bytes, width, height, counts = result
+        pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes(rgb_bytes), GdkPixbuf.Colorspace.RGB, False, 8, width, height, width * 3)
+        self.ref_image.set_substitute_pixbuf(pixbuf)
+        for child in self._paint_map_legend.get_children():
+            self._paint_map_legend.remove(child)
+        total = max(1, sum(counts))
+        used = sorted((item for item in zip(counts, range(len(paints))) if item[0]), reverse=True)
+        for row, (count, index) in enumerate(used):
+            self._paint_map_legend.attach(gpaint.ColouredRectangle(paints[index].rgb, (20, 15)), 0, row, 1, 1)
+            label = Gtk.Label(paints[index].name)
+            label.set_xalign(0.0)
+            self._paint_map_legend.attach(label, 1, row, 1, 1)
+            self._paint_map_legend.attach(Gtk.Label("{:.1f}%".format(100.0 * count / total)), 2, row, 1, 1)
+        self._legend_window.show_all()
 
 def pango_rgb_str(rgb, bits_per_channel=16):
     """
@@ -646,7 +836,7 @@ class TargetColourInformationDialogue(dialogue.Dialog):
             self.set_default_size(*eval(last_size))
         vbox = self.get_content_area()
         label_text = "{}: {}".format(colour.name, colour.description)
-        vbox.pack_start(coloured.ColouredLabel(label_text, colour.rgb.gdk_color), expand=False, fill=True, padding=0)
+        vbox.pack_start(coloured.ColouredLabel(label_text, grgbh.gdk_color(colour.rgb)), expand=False, fill=True, padding=0)
         if hasattr(colour, "warmth"):
             vbox.pack_start(gpaint.HCVWDisplay(colour=colour), expand=False, fill=True, padding=0)
         else:
@@ -673,6 +863,7 @@ class PaintMixer(Gtk.VBox, actions.CAGandUIManager, dialogue.AskerMixin, dialogu
     <ui>
         <toolbar name="mixer_toolbar">
             <toolitem action="print_mixer"/>
+            <toolitem action="open_paint_map_viewer"/>
         </toolbar>
     </ui>
     """
@@ -701,7 +892,10 @@ class PaintMixer(Gtk.VBox, actions.CAGandUIManager, dialogue.AskerMixin, dialogu
         self.mixpanel = gpaint.ColourMatchArea()
         self.mixpanel.set_size_request(240, 240)
         self.hcvw_display = gpaint.HCVDisplay()
-        self.paint_colours = PaintPartsSpinButtonBox()
+        self.paint_colours = PaintPartsGrid()
+        # only the latest of a rapid series of changes gets calculated
+        self.__recalculation = gpaint.CoalescedUpdate(self.recalculate_colour)
+        self.connect("destroy", lambda _widget: self.__recalculation.cancel())
         self.paint_colours.connect("remove-paint", self._remove_paint_colour_cb)
         self.paint_colours.connect("contributions-changed", self._contributions_changed_cb)
         self.mixed_colours = self.MATCHED_PAINT_LIST_VIEW.MODEL()
@@ -812,6 +1006,10 @@ class PaintMixer(Gtk.VBox, actions.CAGandUIManager, dialogue.AskerMixin, dialogu
              _("Print a text description of the mixer."),
              lambda _action: self.print_mixing_session()
             ),
+            ("open_paint_map_viewer", None, _("Paint Map"), None,
+             _("Open a reference image viewer that can map the image onto the paints in the mixer."),
+             lambda _action: self._open_paint_map_viewer()
+            ),
         ])
         self.action_groups[self.AC_HAVE_MIXTURE].add_actions([
             ("simplify_contributions", None, _("Simplify"), None,
@@ -911,7 +1109,8 @@ class PaintMixer(Gtk.VBox, actions.CAGandUIManager, dialogue.AskerMixin, dialogu
             string = "" # Necessary because we put header in the first chunk
         return chunks
     def _contributions_changed_cb(self, _widget, contributions):
-        self.recalculate_colour(contributions)
+        self.__recalculation.schedule(contributions)
+    @ptiming.timed()
     def recalculate_colour(self, contributions):
         if len(contributions) > 0:
             new_colour = self.MIXTURE(contributions)
@@ -1045,6 +1244,12 @@ class PaintMixer(Gtk.VBox, actions.CAGandUIManager, dialogue.AskerMixin, dialogu
         Launch a window containing a reference image viewer
         """
         ReferenceImageViewer(self.get_toplevel()).show()
+    def _open_paint_map_viewer(self):
+        """
+        Launch a reference image viewer that maps onto the mixer's paints
+        """
+        paints_acb = lambda: self.paint_colours.get_paints() + self.mixed_colours.get_paints()
+        ReferenceImageViewer(self.get_toplevel(), paints_acb=paints_acb).show()
     def _quit_mixer(self):
         """
         Exit the program
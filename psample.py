@@ -0,0 +1,526 @@
+#  Copyright 2017 Peter Williams <pwil3058@gmail.com>
+#
+# This software is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License only.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software; if not, write to:
+#  The Free Software Foundation, Inc., 51 Franklin Street,
+#  Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Colour statistics for the pixels of sample images
+(deliberately free of any GUI dependencies)
+"""
+
+import collections
+import concurrent.futures
+import math
+import multiprocessing
+import operator
+import os
+
+__all__ = []
+__author__ = "Peter Williams <pwil3058@gmail.com>"
+
+class PixelBuffer(collections.namedtuple("PixelBuffer", ["data", "width", "height", "rowstride", "n_channels", "bits_per_sample"])):
+    """The raw pixel data of an image and the information needed to
+    find the samples for each pixel within it
+    """
+    __slots__ = ()
+    @classmethod
+    def fm_pixbuf(cls, pixbuf):
+        """Return a PixelBuffer holding a copy of the pixbuf's pixels
+        (GLib.Bytes.get_data() copies them into a bytes object once, the
+        per pixel work is then done on memoryviews of that copy)
+        """
+        return cls(
+            data=pixbuf.read_pixel_bytes().get_data(),
+            width=pixbuf.get_width(),
+            height=pixbuf.get_height(),
+            rowstride=pixbuf.get_rowstride(),
+            n_channels=pixbuf.get_n_channels(),
+            bits_per_sample=pixbuf.get_bits_per_sample()
+        )
+    @property
+    def npixels(self):
+        return self.width * self.height
+    def sub_buffer(self, x, y, width, height):
+        """Return a PixelBuffer for the given rectangle of the image
+        that shares (rather than copies) the pixel data
+        """
+        start = y * self.rowstride + x * self.n_channels * (self.bits_per_sample // 8)
+        return self._replace(data=memoryview(self.data)[start:], width=width, height=height)
+    def iter_sampled_levels(self, step):
+        """Iterate over every step'th row yielding, for each row, the
+        8 bit levels of every step'th pixel's channels as bytes
+        """
+        view = memoryview(self.data)
+        if self.bits_per_sample == 16:
+            view = view.cast("H")
+            stride = self.rowstride // 2
+        elif self.bits_per_sample == 8:
+            stride = self.rowstride
+        else:
+            raise ValueError("{0}: unsupported bits per sample".format(self.bits_per_sample))
+        row_len = self.width * self.n_channels
+        pixel_stride = self.n_channels * step
+        for row_start in range(0, stride * self.height, stride * step):
+            row = view[row_start:row_start + row_len]
+            if self.bits_per_sample == 8:
+                yield [row[i::pixel_stride].tobytes() for i in range(self.n_channels)]
+            else:
+                yield [bytes(v >> 8 for v in row[i::pixel_stride]) for i in range(self.n_channels)]
+
+class SampleStatistics(object):
+    """Summary statistics of the colours of the pixels in a sample from
+    which the various estimates of the sample's colour can be derived.
+    Channel values are expressed as fractions of full scale.
+    """
+    SAMPLE_BUDGET = 65536
+    TRIM = 0.1
+    BIN_SHIFT = 4
+    def __init__(self):
+        self.npixels = 0
+        self.sums = [0.0, 0.0, 0.0]
+        self.histograms = [collections.Counter() for _i in range(3)]
+        self.alpha_sums = [0.0, 0.0, 0.0]
+        self.alpha_total = 0.0
+        self.colours = collections.Counter()
+    @classmethod
+    def fm_pixels(cls, pixels, progress=None):
+        """Return the statistics for the given PixelBuffer derived from
+        at most SAMPLE_BUDGET (evenly spread) of its pixels. If given,
+        progress is called with the fraction of the work done so far
+        (and may abort the calculation by raising an exception).
+        """
+        stats = cls()
+        stats.npixels = pixels.npixels
+        if stats.npixels == 0:
+            return stats
+        step = max(1, math.ceil(math.sqrt(stats.npixels / cls.SAMPLE_BUDGET)))
+        nrows = math.ceil(pixels.height / step)
+        nsampled = 0
+        sums = [0, 0, 0]
+        alpha_sums = [0, 0, 0]
+        for row, levels in enumerate(pixels.iter_sampled_levels(step)):
+            if progress is not None and row % 16 == 0:
+                progress(row / nrows)
+            nsampled += len(levels[0])
+            for i in range(3):
+                sums[i] += sum(levels[i])
+                stats.histograms[i].update(levels[i])
+            stats.colours.update(zip(*levels[:3]))
+            if pixels.n_channels == 4:
+                stats.alpha_total += sum(levels[3])
+                for i in range(3):
+                    alpha_sums[i] += sum(map(operator.mul, levels[i], levels[3]))
+        # each sampled pixel stands in for weight of the image's pixels
+        weight = stats.npixels / nsampled
+        for counter in stats.histograms + [stats.colours]:
+            for key in counter:
+                counter[key] *= weight
+        stats.sums = [total * weight / 255 for total in sums]
+        if pixels.n_channels == 4:
+            stats.alpha_total *= weight / 255
+            stats.alpha_sums = [total * weight / (255 * 255) for total in alpha_sums]
+        else:
+            stats.alpha_total = stats.npixels
+            stats.alpha_sums = stats.sums[:]
+        return stats
+    @classmethod
+    def combined(cls, stats_list):
+        """Return the statistics for the union of the samples described
+        by the statistics in stats_list
+        """
+        total = cls()
+        for stats in stats_list:
+            total += stats
+        return total
+    def __iadd__(self, other):
+        self.npixels += other.npixels
+        for i in range(3):
+            self.sums[i] += other.sums[i]
+            self.histograms[i].update(other.histograms[i])
+            self.alpha_sums[i] += other.alpha_sums[i]
+        self.alpha_total += other.alpha_total
+        self.colours.update(other.colours)
+        return self
+    def __add__(self, other):
+        return self.combined([self, other])
+    def mean(self):
+        return [total / self.npixels for total in self.sums]
+    def median(self):
+        """Return the per channel medians (which ignore glare and
+        shadow provided they are less than half of the sample)
+        """
+        result = []
+        for histogram in self.histograms:
+            half = sum(histogram.values()) / 2
+            cumulative = 0.0
+            for level in sorted(histogram):
+                cumulative += histogram[level]
+                if cumulative >= half:
+                    break
+            result.append(level / 255)
+        return result
+    def trimmed_mean(self):
+        """Return the per channel means after discarding the TRIM
+        fraction of the pixels at each end of each channel's range
+        """
+        result = []
+        for histogram in self.histograms:
+            count = sum(histogram.values())
+            lower = count * self.TRIM
+            upper = count - lower
+            cumulative = total = kept = 0.0
+            for level in sorted(histogram):
+                weight = histogram[level]
+                inside = min(cumulative + weight, upper) - max(cumulative, lower)
+                if inside > 0:
+                    total += level * inside
+                    kept += inside
+                cumulative += weight
+            result.append(total / kept / 255 if kept else 0.0)
+        return result
+    def alpha_weighted_mean(self):
+        """Return the mean with each pixel weighted by its opacity
+        (samples without an alpha channel count as fully opaque)
+        """
+        if self.alpha_total <= 0:
+            return self.mean()
+        return [total / self.alpha_total for total in self.alpha_sums]
+    def colour_bins(self):
+        """Return a 3-D histogram of the sample's colours as a dict
+        mapping bins to their [weight, red, green, blue] weighted sums
+        """
+        bins = {}
+        shift = self.BIN_SHIFT
+        for (red, green, blue), weight in self.colours.items():
+            key = (red >> shift, green >> shift, blue >> shift)
+            try:
+                data = bins[key]
+            except KeyError:
+                data = bins[key] = [0.0, 0.0, 0.0, 0.0]
+            data[0] += weight
+            data[1] += red * weight
+            data[2] += green * weight
+            data[3] += blue * weight
+        return bins
+    def dominant(self):
+        """Return the mean colour of the most heavily populated region
+        of a 3-D histogram of the sample's colours
+        """
+        bins = self.colour_bins()
+        if not bins:
+            return self.mean()
+        offsets = [(dr, dg, db) for dr in (-1, 0, 1) for dg in (-1, 0, 1) for db in (-1, 0, 1)]
+        def neighbours(key):
+            for dr, dg, db in offsets:
+                data = bins.get((key[0] + dr, key[1] + dg, key[2] + db), None)
+                if data is not None:
+                    yield data
+        best = max(bins, key=lambda key: sum(data[0] for data in neighbours(key)))
+        totals = [sum(values) for values in zip(*neighbours(best))]
+        return [totals[i] / totals[0] / 255 for i in range(1, 4)]
+    def palette(self, ncolours, max_iterations=20, progress=None):
+        """Return up to ncolours (rgb, fraction) pairs (most common
+        first) for the clusters found by weighted k-means, in CIE Lab
+        space, of the sample's colour histogram
+        """
+        points = []
+        total_weight = 0.0
+        for weight, red, green, blue in self.colour_bins().values():
+            rgb = (red / weight / 255, green / weight / 255, blue / weight / 255)
+            points.append((rgb_to_lab(rgb), weight, (red, green, blue)))
+            total_weight += weight
+        if not points:
+            return []
+        def distance2(lab1, lab2):
+            return (lab1[0] - lab2[0]) ** 2 + (lab1[1] - lab2[1]) ** 2 + (lab1[2] - lab2[2]) ** 2
+        # deterministic k-means++ style seeding: heaviest then furthest
+        centres = [max(points, key=lambda point: point[1])[0]]
+        min_d2 = [distance2(point[0], centres[0]) for point in points]
+        while len(centres) < min(ncolours, len(points)):
+            index = max(range(len(points)), key=lambda i: points[i][1] * min_d2[i])
+            if min_d2[index] == 0.0:
+                break
+            centres.append(points[index][0])
+            min_d2 = [min(min_d2[i], distance2(point[0], centres[-1])) for i, point in enumerate(points)]
+        assignments = None
+        for iteration in range(max_iterations):
+            if progress is not None:
+                progress(iteration / max_iterations)
+            new_assignments = [min(range(len(centres)), key=lambda j: distance2(point[0], centres[j])) for point in points]
+            if new_assignments == assignments:
+                break
+            assignments = new_assignments
+            sums = [[0.0, 0.0, 0.0, 0.0] for _centre in centres]
+            for (lab, weight, _rgb), j in zip(points, assignments):
+                sums[j][0] += weight
+                for k in range(3):
+                    sums[j][k + 1] += lab[k] * weight
+            centres = [(data[1] / data[0], data[2] / data[0], data[3] / data[0]) if data[0] else centre for data, centre in zip(sums, centres)]
+        clusters = [[0.0, 0.0, 0.0, 0.0] for _centre in centres]
+        for (_lab, weight, rgb_sums), j in zip(points, assignments):
+            clusters[j][0] += weight
+            for k in range(3):
+                clusters[j][k + 1] += rgb_sums[k]
+        result = [(tuple(data[k] / data[0] / 255 for k in range(1, 4)), data[0] / total_weight) for data in clusters if data[0]]
+        return sorted(result, key=lambda item: item[1], reverse=True)
+
+class WhiteBalance(object):
+    """
+    Per channel gains that correct the colour cast of the lighting in
+    sample images (derived from the colour of a neutral grey or white
+    reference patch photographed under the same lighting)
+    """
+    def __init__(self, gains=(1.0, 1.0, 1.0)):
+        self.gains = tuple(gains)
+        self.__change_cbs = []
+    @classmethod
+    def fm_string(cls, text):
+        """Return the white balance for gains given as "red,green,blue"
+        (the format used by str())
+        """
+        gains = [float(item) for item in text.split(",")]
+        if len(gains) != 3 or min(gains) <= 0.0:
+            raise ValueError(_("{}: expected three positive gains.").format(text))
+        return cls(gains)
+    def __str__(self):
+        return ",".join("{:.4f}".format(gain) for gain in self.gains)
+    @property
+    def is_identity(self):
+        return self.gains == (1.0, 1.0, 1.0)
+    def add_change_cb(self, callback):
+        self.__change_cbs.append(callback)
+    def remove_change_cb(self, callback):
+        self.__change_cbs.remove(callback)
+    def set_gains(self, gains):
+        self.gains = tuple(gains)
+        for callback in self.__change_cbs:
+            callback(self)
+    def set_fm_neutral(self, rgb):
+        """Set the gains that make the given colour (channels as
+        fractions of full scale) of a neutral reference a grey of the
+        same mean
+        """
+        if min(rgb) <= 0.0:
+            raise ValueError(_("Reference colour must have some of each channel."))
+        mean = sum(rgb) / 3
+        self.set_gains(mean / channel for channel in rgb)
+    def reset(self):
+        self.set_gains((1.0, 1.0, 1.0))
+    def apply(self, rgb):
+        """Return the corrected version of the given colour (channels
+        as fractions of full scale)
+        """
+        return [min(1.0, gain * channel) for gain, channel in zip(self.gains, rgb)]
+
+def grid_cell_statistics(pixels, corners, rows, cols, inset=0.2, progress=None):
+    """Return (row major) statistics for the interior of each cell of a
+    rows x cols grid whose corners (top left, top right, bottom right
+    and bottom left) are given in pixel coordinates. The grid may be
+    rotated or seen in perspective as cell positions are interpolated
+    bilinearly between the corners. The inset is the fraction of each
+    cell (at each edge) to exclude from the sample which is the largest
+    upright rectangle within what remains of the cell.
+    """
+    (x00, y00), (x10, y10), (x11, y11), (x01, y01) = corners
+    def position(u, v):
+        x = (1 - u) * (1 - v) * x00 + u * (1 - v) * x10 + u * v * x11 + (1 - u) * v * x01
+        y = (1 - u) * (1 - v) * y00 + u * (1 - v) * y10 + u * v * y11 + (1 - u) * v * y01
+        return (x, y)
+    def clamp(value, limit):
+        return min(limit, max(0, value))
+    result = []
+    for row in range(rows):
+        if progress is not None:
+            progress(row / rows)
+        for col in range(cols):
+            tl, tr, br, bl = [position((col + du) / cols, (row + dv) / rows) for du, dv in ((inset, inset), (1 - inset, inset), (1 - inset, 1 - inset), (inset, 1 - inset))]
+            x0 = clamp(int(math.ceil(max(tl[0], bl[0]))), pixels.width - 1)
+            y0 = clamp(int(math.ceil(max(tl[1], tr[1]))), pixels.height - 1)
+            x1 = clamp(int(math.floor(min(tr[0], br[0]))), pixels.width)
+            y1 = clamp(int(math.floor(min(bl[1], br[1]))), pixels.height)
+            # a cell too small (or distorted) to have an interior is sampled at one pixel
+            cell = pixels.sub_buffer(x0, y0, max(1, x1 - x0), max(1, y1 - y0))
+            result.append(SampleStatistics.fm_pixels(cell))
+    return result
+
+def rgb_to_lab(rgb):
+    """Convert sRGB (channels as fractions of full scale) to CIE Lab
+    (D65 white point)
+    """
+    linear = [c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4 for c in rgb]
+    xyz = (
+        (0.4124 * linear[0] + 0.3576 * linear[1] + 0.1805 * linear[2]) / 0.95047,
+        (0.2126 * linear[0] + 0.7152 * linear[1] + 0.0722 * linear[2]),
+        (0.0193 * linear[0] + 0.1192 * linear[1] + 0.9505 * linear[2]) / 1.08883,
+    )
+    fx, fy, fz = (t ** (1.0 / 3.0) if t > 0.008856 else 7.787 * t + 16.0 / 116.0 for t in xyz)
+    return (116.0 * fy - 16.0, 500.0 * (fx - fy), 200.0 * (fy - fz))
+
+class NearestColourIndex(dict):
+    """
+    A lookup table from quantised (red, green, blue) levels to the index
+    of the nearest (in CIE Lab space) colour in a palette. Entries are
+    only calculated when first looked up.
+    """
+    BITS = 5
+    QUANTISE = bytes(map((8 - BITS).__rrshift__, range(256)))
+    def __init__(self, palette):
+        dict.__init__(self)
+        self.palette_labs = [rgb_to_lab(rgb) for rgb in palette]
+    def __missing__(self, key):
+        half = 0.5 / (1 << self.BITS)
+        lab = rgb_to_lab([level / (1 << self.BITS) + half for level in key])
+        distances = [(lab[0] - p[0]) ** 2 + (lab[1] - p[1]) ** 2 + (lab[2] - p[2]) ** 2 for p in self.palette_labs]
+        index = self[key] = distances.index(min(distances))
+        return index
+
+_NEAREST_COLOUR_INDICES = {}
+
+def map_levels_to_palette(palette, reds, greens, blues):
+    """Return (as bytes) the indices of the palette colours nearest to
+    the colours of the pixels whose 8 bit levels are given as bytes
+    """
+    palette = tuple(tuple(rgb) for rgb in palette)
+    try:
+        index = _NEAREST_COLOUR_INDICES[palette]
+    except KeyError:
+        # worker processes keep the table for use with later chunks
+        index = _NEAREST_COLOUR_INDICES[palette] = NearestColourIndex(palette)
+    quantise = NearestColourIndex.QUANTISE
+    return bytes(map(index.__getitem__, zip(reds.translate(quantise), greens.translate(quantise), blues.translate(quantise))))
+
+def thread_safe_mp_context():
+    """Return a multiprocessing context whose worker processes can be
+    started from any thread of a process (which isn't true of "fork")
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+def paint_map(pixels, palette, chunk_rows=64, max_workers=None, mp_context=None, progress=None):
+    """Return the palette index (as bytes, row major) of the nearest
+    palette colour for every pixel together with the number of pixels
+    mapped to each palette colour. Rows are processed in chunks in
+    parallel on a process pool (started with mp_context, if given) with
+    a bounded number in flight unless max_workers is 0 when they are
+    processed in the calling process.
+    """
+    if len(palette) > 256:
+        raise ValueError("Too many colours for a paint map: {}.".format(len(palette)))
+    palette = tuple(tuple(rgb) for rgb in palette)
+    def iter_chunks():
+        rows = []
+        for levels in pixels.iter_sampled_levels(1):
+            rows.append(levels)
+            if len(rows) == chunk_rows:
+                yield [b"".join(row[i] for row in rows) for i in range(3)]
+                rows = []
+        if rows:
+            yield [b"".join(row[i] for row in rows) for i in range(3)]
+    nchunks = math.ceil(pixels.height / chunk_rows)
+    results = []
+    if max_workers == 0:
+        for chunk in iter_chunks():
+            results.append(map_levels_to_palette(palette, *chunk))
+            if progress is not None:
+                progress(len(results) / nchunks)
+    else:
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context) as executor:
+            pending = collections.deque()
+            for chunk in iter_chunks():
+                pending.append(executor.submit(map_levels_to_palette, palette, *chunk))
+                while len(pending) >= 2 * max_workers:
+                    results.append(pending.popleft().result())
+                    if progress is not None:
+                        progress(len(results) / nchunks)
+            while pending:
+                results.append(pending.popleft().result())
+                if progress is not None:
+                    progress(len(results) / nchunks)
+    indices = b"".join(results)
+    counts = collections.Counter(indices)
+    return (indices, [counts.get(i, 0) for i in range(len(palette))])
+
+def render_paint_map(indices, palette):
+    """Return the packed 8 bit RGB pixels (as bytes) of a paint map
+    """
+    rendered = bytearray(len(indices) * 3)
+    for i in range(3):
+        table = bytes(int(round(rgb[i] * 255)) for rgb in palette) + bytes(256 - len(palette))
+        rendered[i::3] = indices.translate(table)
+    return bytes(rendered)
+
+def joined_levels(pixels):
+    """Return the 8 bit levels of the red, green and blue samples of
+    every pixel (row major) as three bytes objects
+    """
+    rows = list(pixels.iter_sampled_levels(1))
+    return [b"".join(row[i] for row in rows) for i in range(3)]
+
+def render_grey(levels):
+    """Return the packed 8 bit RGB pixels (as bytes) of grey levels
+    """
+    rendered = bytearray(len(levels) * 3)
+    for i in range(3):
+        rendered[i::3] = levels
+    return bytes(rendered)
+
+# the 8 bit level nearest to a third of each possible channel total
+_THIRDS = bytes((total + 1) // 3 for total in range(3 * 255 + 1))
+
+def value_levels(reds, greens, blues):
+    """Return (as bytes) the 8 bit values of pixels defined as for
+    RGBNG.get_value() i.e. the mean of the channels
+    """
+    return bytes(map(_THIRDS.__getitem__, map(operator.add, map(operator.add, reds, greens), blues)))
+
+def chroma_levels(reds, greens, blues):
+    """Return (as bytes) the 8 bit chromas of pixels (the difference
+    between the largest and smallest channel which is the HCV chroma
+    scaled to full strength)
+    """
+    return bytes(map(operator.sub, map(max, reds, greens, blues), map(min, reds, greens, blues)))
+
+def value_study(pixels):
+    """Return the packed 8 bit RGB pixels of a grey scale rendering of
+    the values of pixels
+    """
+    return render_grey(value_levels(*joined_levels(pixels)))
+
+def chroma_study(pixels):
+    """Return the packed 8 bit RGB pixels of a grey scale rendering of
+    the chromas of pixels (black for greys)
+    """
+    return render_grey(chroma_levels(*joined_levels(pixels)))
+
+class ValueBandsStudy(collections.namedtuple("ValueBandsStudy", ["nbands"])):
+    """
+    A rendering of pixels' values posterised into nbands equal bands
+    each shown as the grey at the middle of its band
+    """
+    __slots__ = ()
+    def __call__(self, pixels):
+        table = bytes(int(round((min(self.nbands - 1, level * self.nbands // 256) + 0.5) * 255 / self.nbands)) for level in range(256))
+        return render_grey(value_levels(*joined_levels(pixels)).translate(table))
+
+# The labels are translated when they are displayed so that importing
+# this module doesn't need the translation machinery to be installed.
+ESTIMATORS = collections.OrderedDict([
+    ("mean", ("Mean", SampleStatistics.mean)),
+    ("median", ("Median", SampleStatistics.median)),
+    ("trimmed_mean", ("Trimmed Mean", SampleStatistics.trimmed_mean)),
+    ("alpha_weighted_mean", ("Alpha Weighted Mean", SampleStatistics.alpha_weighted_mean)),
+    ("dominant", ("Dominant Colour", SampleStatistics.dominant)),
+])
@@ -20,10 +20,8 @@
 __all__ = []
 __author__ = "Peter Williams <pwil3058@gmail.com>"
 
-import collections
 import hashlib
 import os
-import re
 
 from gi.repository import GObject
 from gi.repository import Gtk
@@ -36,6 +34,8 @@ from ..gtx import recollect
 
 from . import gpaint
 from . import pedit
+from . import ptiming
+from . import vpaint
 
 from .. import SYS_DATA_DIR_PATH
 from .. import CONFIG_DIR_PATH
@@ -62,81 +62,10 @@ def write_series_file_names(sf_names):
         fobj.write(os.linesep)
     fobj.close()
 
-SERIES_ID = collections.namedtuple("SERIES_ID", ["maker", "name"])
-
-class SeriesPaint(collections.namedtuple("SeriesPaint", ["series", "paint"])):
-    @property
-    def id(self):
-        return (self.series, self.paint.name)
-    def __getattr__(self, attr_name):
-        return getattr(self.paint, attr_name)
-    def __str__(self):
-        return self.name + " ({0}: {1})".format(*self.series.series_id)
-    def __len__(self):
-        return len(str(self))
-    def __repr__(self):
-        return "SeriesPaint(series={}, paint={})".format(self.series.series_id, repr(self.paint))
-
-class PaintSeries:
-    # No i18n for these strings
-    OWNER_LABEL = "Manufacturer"
-    NAME_LABEL = "Series"
-    class ParseError(Exception):
-        pass
-    def __init__(self, maker, name, paints=None):
-        self.series_id = SERIES_ID(maker=maker, name=name)
-        self.__paints = {}
-        if paints:
-            for paint in paints:
-                self.add_paint(paint)
-    def __lt__(self, other):
-        if self.series_id.maker < other.series_id.maker:
-            return True
-        elif self.series_id.maker > other.series_id.maker:
-            return False
-        return self.series_id.name < other.series_id.name
-    def add_paint(self, paint):
-        self.__paints[paint.name] = paint
-    def definition_text(self):
-        string = "{0}: {1}\n".format(self.OWNER_LABEL, self.series_id.maker)
-        string += "{0}: {1}\n".format(self.NAME_LABEL, self.series_id.name)
-        for paint in sorted(self.__paints.values(), key=lambda x: x.name):
-            string += "{0}\n".format(paint.paint_spec())
-        return string
-    def iter_names(self):
-        return self.__paints.keys()
-    def iter_paints(self):
-        return self.__paints.values()
-    def iter_series_paints(self):
-        return (SeriesPaint(self, value) for value in self.__paints.values())
-    def get_paint(self, name):
-        return self.__paints.get(name, None)
-    def get_series_paint(self, name):
-        paint = self.__paints.get(name, None)
-        return None if paint is None else SeriesPaint(self, paint)
-    @classmethod
-    def fm_definition(cls, definition_text):
-        lines = definition_text.splitlines()
-        if len(lines) < 2:
-            raise cls.ParseError(_("Too few lines: {0}.".format(len(lines))))
-        mfkr_name = None
-        series_name = None
-        for line in lines[:2]:
-            match = re.match("^Manufacturer:\s+(\S.*)\s*$", line)
-            if match:
-                mfkr_name = match.group(1)
-            else:
-                match = re.match("^Series:\s+(\S.*)\s*$", line)
-                if match:
-                    series_name = match.group(1)
-        if not mfkr_name:
-            if not series_name:
-                raise cls.ParseError(_("Neither manufacturer nor series name found."))
-            else:
-                raise cls.ParseError(_("Manufacturer not found."))
-        elif not series_name:
-            raise cls.ParseError(_("Series name not found."))
-        return cls(maker=mfkr_name, name=series_name, paints=cls.paints_fm_definition(lines[2:]))
+# the GTK-free model is in vpaint (these are kept for existing users)
+SERIES_ID = vpaint.SERIES_ID
+SeriesPaint = vpaint.SeriesPaint
+PaintSeries = vpaint.PaintSeries
 
 class PaintSeriesEditor(pedit.PaintCollectionEditor):
     PAINT_EDITOR = None
@@ -146,6 +75,7 @@ class PaintSeriesEditor(pedit.PaintCollectionEditor):
     FILE_NAME_PROMPT = _("Paint Series Description File:")
     LABEL = _("Paint Series Editor")
 
+    @ptiming.timed()
     def load_fm_file(self, filepath):
         try:
             with open(filepath, "r") as fobj:
@@ -273,6 +203,7 @@ class PaintSeriesManager(GObject.GObject, dialogue.ReporterMixin, dialogue.Asker
         self.__target_colour = None
         for sdata in self.__series_dict.values():
             sdata["selector"].unset_target_colour()
+    @ptiming.timed()
     def _add_series_from_file(self, filepath):
         # Check and see if this file is already loaded
         for series, sdata in self.__series_dict.items():
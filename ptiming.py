@@ -0,0 +1,170 @@
+#  Copyright 2017 Peter Williams <pwil3058@gmail.com>
+#
+# This software is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License only.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software; if not, write to:
+#  The Free Software Foundation, Inc., 51 Franklin Street,
+#  Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Lightweight timing of hot code paths. Timing is only done if the
+EPAINT_TIMING environment variable names a file (or "-" for standard
+error) to which the statistics are written at exit. Otherwise the
+decorator returns functions unchanged and the context manager does
+nothing.
+"""
+
+import atexit
+import collections
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+__all__ = []
+__author__ = "Peter Williams <pwil3058@gmail.com>"
+
+ENV_VAR = "EPAINT_TIMING"
+DUMP_FILE = os.environ.get(ENV_VAR, "")
+ENABLED = bool(DUMP_FILE)
+
+# bucket i holds durations of less than 2 ** i microseconds (and at
+# least 2 ** (i - 1) microseconds)
+NBUCKETS = 32
+
+_LOCK = threading.Lock()
+
+class TimingStatistics(object):
+    """
+    Call count and latency histogram of a timed code path
+    """
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+        self.buckets = [0] * NBUCKETS
+    def record(self, seconds):
+        bucket = min(NBUCKETS - 1, int(seconds * 1000000).bit_length())
+        with _LOCK:
+            self.count += 1
+            self.total += seconds
+            if self.minimum is None or seconds < self.minimum:
+                self.minimum = seconds
+            if seconds > self.maximum:
+                self.maximum = seconds
+            self.buckets[bucket] += 1
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+    def percentile(self, fraction):
+        """Return an upper bound (in seconds) on the given fraction of
+        the durations as found from the histogram
+        """
+        wanted = fraction * self.count
+        so_far = 0
+        for bucket, count in enumerate(self.buckets):
+            so_far += count
+            if so_far >= wanted and count:
+                return min(self.maximum, (1 << bucket) / 1000000)
+        return self.maximum
+    def as_dict(self):
+        return collections.OrderedDict([
+            ("name", self.name),
+            ("count", self.count),
+            ("total", self.total),
+            ("mean", self.mean),
+            ("min", self.minimum),
+            ("max", self.maximum),
+            ("p50", self.percentile(0.5)),
+            ("p95", self.percentile(0.95)),
+            ("histogram_us", {str(1 << bucket): count for bucket, count in enumerate(self.buckets) if count}),
+        ])
+
+STATISTICS = collections.OrderedDict()
+
+def get_statistics(name):
+    with _LOCK:
+        try:
+            return STATISTICS[name]
+        except KeyError:
+            statistics = STATISTICS[name] = TimingStatistics(name)
+            return statistics
+
+def timed(name=None):
+    """Decorator that times calls of a function (under name or the
+    function's qualified name) if timing is enabled
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+        statistics = get_statistics(func.__qualname__ if name is None else name)
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                statistics.record(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer(object):
+    __slots__ = ("statistics", "start")
+    def __init__(self, statistics):
+        self.statistics = statistics
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    def __exit__(self, *exc_info):
+        self.statistics.record(time.perf_counter() - self.start)
+        return False
+
+def timing(name):
+    """Return a context manager that times its block (under name) if
+    timing is enabled
+    """
+    return _Timer(get_statistics(name)) if ENABLED else _NULL_TIMER
+
+def reset():
+    with _LOCK:
+        for statistics in STATISTICS.values():
+            statistics.reset()
+
+def snapshot():
+    """Return the statistics (as dicts) in decreasing order of the
+    total time spent
+    """
+    with _LOCK:
+        return [statistics.as_dict() for statistics in sorted(STATISTICS.values(), key=lambda x: x.total, reverse=True)]
+
+def dump(filepath):
+    text = json.dumps({"pid": os.getpid(), "statistics": snapshot()}, indent=2) + "\n"
+    if filepath == "-":
+        sys.stderr.write(text)
+    else:
+        with open(filepath, "w") as fobj:
+            fobj.write(text)
+
+if ENABLED:
+    atexit.register(dump, DUMP_FILE)
@@ -23,7 +23,8 @@ import math
 import array
 import fractions
 
-from gi.repository import Gdk
+# NB: the conversions to Gdk types are in grgbh so that the colour
+# model can be used without GI (e.g. in worker processes)
 
 from ..bab.decorators import classproperty
 from ..bab import mathx
@@ -101,14 +102,6 @@ class RGBNG: # NB: We don't want most of list/tuple operations so use a wrapper
     def rgbpn(self):
         return self.converted_to(RGBPN)
     @property
-    def gdk_color(self):
-        if self.BITS_PER_CHANNEL is None:
-            return Gdk.Color.from_floats(*self.__components)
-        elif self.BITS_PER_CHANNEL == 16:
-            return Gdk.Color(*self.__components)
-        else:
-            return Gdk.Color(*self.converted_to(RGB16))
-    @property
     def cairo_rgb(self):
         return self.converted_to(RGBPN)
     def __eq__(self, other):
@@ -151,10 +144,6 @@ class RGBNG: # NB: We don't want most of list/tuple operations so use a wrapper
         return (self.__components[0] * 0.299 + self.__components[1] * 0.587 + self.__components[2] * 0.114) > self.ONE * threshold
     def best_foreground(self, threshold=0.5):
         return self.BLACK if self.best_foreground_is_black(threshold) else self.WHITE
-    def best_foreground_gdk_color(self, threshold=0.5):
-        return Gdk.Color(0, 0, 0) if self.best_foreground_is_black(threshold) else Gdk.Color(BPC16.ONE, BPC16.ONE, BPC16.ONE)
-    def best_foreground_gdk_rgba(self, threshold=0.5):
-        return Gdk.RGBA(0.0, 0.0, 0.0, 1.0) if self.best_foreground_is_black(threshold) else Gdk.RGBA(1.0, 1.0, 1.0)
     @property
     def non_zero_components(self):
         """Return the number of non zero components
@@ -204,8 +193,6 @@ class ColourConstantsMixin:
 class RGB8(RGBNG, BPC8, ColourConstantsMixin):
     def get_value(self):
         return fractions.Fraction(sum(self), self.THREE)
-    def to_gdk_rgba(self, alpha=1.0):
-        return self.converted_to(RGPN).to_gtk_rba(alpha=alpha)
     @property
     def rgb8(self):
         return self
@@ -213,8 +200,6 @@ class RGB8(RGBNG, BPC8, ColourConstantsMixin):
 class RGB16(RGBNG, BPC16, ColourConstantsMixin):
     def get_value(self):
         return fractions.Fraction(sum(self), self.THREE)
-    def to_gdk_rgba(self, alpha=1.0):
-        return self.converted_to(RGPN).to_gtk_rba(alpha=alpha)
     @property
     def rgb16(self):
         return self
@@ -222,8 +207,6 @@ class RGB16(RGBNG, BPC16, ColourConstantsMixin):
 class RGBPN(RGBNG, PROPN_CHANNELS, ColourConstantsMixin):
     def get_value(self):
         return sum(self) / self.THREE
-    def to_gdk_rgba(self, alpha=1.0):
-        return Gdk.RGBA(red=self.red, green=self.green, blue=self.blue, alpha=alpha)
     @property
     def rgbpn(self):
         return self
@@ -253,15 +236,6 @@ class HueNG(rgb_math.HueAngle):
     def max_chroma_rgb_array(self, typecode=None):
         return rgb_math.HueAngle.max_chroma_rgb_array(self, typecode if typecode else self.RGB.ARRAY_TYPECODE)
 
-    def to_gdk_rgba(self, alpha=1.0):
-        return Gdk.RGBA(*([self.RGB.convert_chnl_value(chnl, RGBPN) for chnl in self.rgb] + [alpha]))
-
-    def best_foreground_gdk_color(self, threshold=0.5):
-        return self.rgb.best_foreground_gdk_color(threshold)
-
-    def best_foreground_gdk_rgba(self, threshold=0.5):
-        return self.rgb.best_foreground_gdk_rgba(threshold)
-
     def max_chroma_rgb_with_value(self, value):
         """
         return the RGB for this hue with the specified value and the
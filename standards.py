@@ -20,10 +20,8 @@
 __all__ = []
 __author__ = "Peter Williams <pwil3058@gmail.com>"
 
-import collections
 import hashlib
 import os
-import re
 
 from gi.repository import GObject
 from gi.repository import Gtk
@@ -37,6 +35,7 @@ from ..gtx import tlview
 
 from . import gpaint
 from . import pedit
+from . import ptiming
 from . import vpaint
 
 from .. import CONFIG_DIR_PATH, SYS_BASE_DIR_PATH
@@ -73,75 +72,9 @@ def write_standards_file_names(sf_names):
 
 recollect.define("paint_standards_manager", "last_file", recollect.Defn(str, ""))
 
-STANDARD_ID = collections.namedtuple("STANDARD_ID", ["sponsor", "name"])
-
-class PaintStandard:
-    # No i18n for these strings
-    OWNER_LABEL = "Sponsor"
-    NAME_LABEL = "Standard"
-    PAINT = None
-    class ParseError(Exception):
-        pass
-    def __init__(self, sponsor, name, paints=None):
-        self.standard_id = STANDARD_ID(sponsor=sponsor, name=name)
-        self.__paints = {}
-        if paints:
-            for paint in paints:
-                self.add_paint(paint)
-    def __lt__(self, other):
-        if self.standard_id.sponsor < other.standard_id.sponsor:
-            return True
-        elif self.standard_id.sponsor > other.standard_id.sponsor:
-            return False
-        return self.standard_id.name < other.standard_id.name
-    def add_paint(self, paint):
-        self.__paints[paint.name] = paint
-    def definition_text(self):
-        string = "{0}: {1}\n".format(self.OWNER_LABEL, self.standard_id.sponsor)
-        string += "{0}: {1}\n".format(self.NAME_LABEL, self.standard_id.name)
-        for paint in sorted(self.__paints.values(), key=lambda x: x.name):
-            string += "{0}\n".format(paint.paint_spec())
-        return string
-    def iter_names(self, ordered=True):
-        if ordered:
-            return (name for name in sorted(self.__paints.keys()))
-        else:
-            return self.__paints.keys()
-    def iter_paints(self, ordered=True):
-        if ordered:
-            return (self.__paints[name] for name in sorted(self.__paints.keys()))
-        else:
-            return self.__paints.values()
-    def iter_standard_paints(self, ordered=True):
-        return (StandardPaint(self, paint) for paint in self.iter_paints(ordered))
-    def get_paint(self, name):
-        return self.__paints.get(name, None)
-    def get_standard_paint(self, name):
-        paint = self.__paints.get(name, None)
-        return None if paint is None else StandardPaint(self, paint)
-    @classmethod
-    def fm_definition(cls, definition_text):
-        lines = definition_text.splitlines()
-        if len(lines) < 2:
-            raise cls.ParseError(_("Too few lines: {0}.".format(len(lines))))
-        sponsor_name = None
-        standard_name = None
-        for line in lines[:2]:
-            match = re.match("^Sponsor:\s+(\S.*)\s*$", line)
-            if match:
-                sponsor_name = match.group(1)
-            else:
-                match = re.match("^Standard:\s+(\S.*)\s*$", line)
-                if match:
-                    standard_name = match.group(1)
-        if not sponsor_name:
-            if not standard_name:
-                raise cls.ParseError(_("Neither sponsor nor standard name found."))
-            else:
-                raise cls.ParseError(_("Sponsor not found."))
-        elif not standard_name:
-            raise cls.ParseError(_("Standard name not found."))
-        return cls(sponsor=sponsor_name, name=standard_name, paints=cls.paints_fm_definition(lines[2:]))
+# the GTK-free model is in vpaint (these are kept for existing users)
+STANDARD_ID = vpaint.STANDARD_ID
+PaintStandard = vpaint.PaintStandard
 
 def generate_paint_list_spec(view, model):
     """Generate the specification for a paint colour list
@@ -158,8 +91,16 @@ class StandardPaintColourInformationDialogue(gpaint.PaintColourInformationDialog
     TITLE_FMT_STR = _("Standard Paint Colour: {}")
     RECOLLECT_SECTION = "standard_paint_colour_information"
 
+class StandardPaintListModel(gpaint.PaintListModel):
+    """
+    A base for the model of standard paint lists. Standards can contain
+    a very large number of paints so they are served straight from a
+    list rather than being copied into a Gtk.ListStore.
+    """
+    COLUMN_DEFS = list()
+
 class SelectStandardPaintListView(gpaint.PaintListView):
-    MODEL = None
+    MODEL = StandardPaintListModel
     PAINT_INFO_DIALOGUE = StandardPaintColourInformationDialogue
     SPECIFICATION = generate_paint_list_spec
     UI_DESCR = """
@@ -211,8 +152,11 @@ class StandardPaintSelector(Gtk.VBox):
         self.standard_paints_view = self.SELECT_STANDARD_PAINT_LIST_VIEW()
         self.standard_paints_view.set_size_request(240, 360)
         model = self.standard_paints_view.get_model()
-        for paint in paint_standard.iter_paints():
-            model.append_paint(paint)
+        # detach the model while loading so that the view isn't updated row by row
+        self.standard_paints_view.set_model(None)
+        model.set_paints(paint_standard.iter_paints())
+        self.standard_paints_view.set_model(model)
+        for paint in model.get_paints():
             self.wheels.add_paint(paint)
         maker = Gtk.Label(label=_("Sponsor: {0}".format(paint_standard.standard_id.sponsor)))
         sname = Gtk.Label(label=_("Standard: {0}".format(paint_standard.standard_id.name)))
@@ -266,6 +210,7 @@ class PaintStandardsManager(GObject.GObject, dialogue.ReporterMixin, dialogue.As
     def set_target_setable(self, setable):
         for item in self.__standards_dict.values():
             item["selector"].set_target_setable(setable)
+    @ptiming.timed()
     def _add_standard_from_file(self, filepath):
         # Check and see if this file is already loaded
         for standard, sdata in self.__standards_dict.items():
@@ -426,6 +371,7 @@ class PaintStandardEditor(pedit.PaintCollectionEditor):
     FILE_NAME_PROMPT = _("Paint Standard Description File:")
     LABEL = _("Paint Standards Editor")
 
+    @ptiming.timed()
     def load_fm_file(self, filepath):
         try:
             with open(filepath, "r") as fobj:
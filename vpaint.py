@@ -215,3 +215,197 @@ class TargetColour:
             return getattr(self.colour, attr_name)
         except AttributeError:
             raise AttributeError(_("{}: unknown attribute for {}").format(attr_name, self.__class__.__name__))
+
+
+BLOB = collections.namedtuple("BLOB", ["paint", "parts"])
+
+class Mixture:
+    PAINT = None
+    def __init__(self, blobs):
+        rgb = self.PAINT.COLOUR.RGB.BLACK
+        self.characteristics = self.PAINT.CHARACTERISTICS()
+        parts = 0
+        for blob in blobs:
+            parts += blob.parts
+            rgb += blob.paint.rgb * blob.parts
+            self.characteristics += blob.paint.characteristics * blob.parts
+        assert parts > 0, "Empty Mixture"
+        self.colour = self.PAINT.COLOUR(rgb / parts)
+        self.characteristics /= parts
+        self.blobs = sorted(blobs, key=lambda x: x.parts, reverse=True)
+    def __getattr__(self, attr_name):
+        try:
+            return getattr(self.colour, attr_name)
+        except AttributeError:
+            return getattr(self.characteristics, attr_name)
+    def _components_str(self):
+        string = _("\nComponents:\n")
+        for blob in self.blobs:
+            string += _("\t{0} Part(s): {1}\n").format(blob.parts, blob.paint)
+        return string
+    def __str__(self):
+        return _("Mixed Colour: ") + Colour.__str__(self) + self._components_str()
+    def contains_paint(self, paint):
+        for blob in self.blobs:
+            if blob.paint == paint:
+                return True
+        return False
+
+class MixedPaint:
+    MIXTURE = None
+    def __init__(self, blobs, name, notes=""):
+        self.mixture = self.MIXTURE(blobs)
+        self.name = name
+        self.notes = notes
+    def __getattr__(self, attr_name):
+        return getattr(self.mixture, attr_name)
+    def __str__(self):
+        return ("Name: \"{0}\" Notes: \"{1}\"").format(self.name, self.notes) + Colour.__str__(self) + self._components_str()
+
+
+SERIES_ID = collections.namedtuple("SERIES_ID", ["maker", "name"])
+
+class SeriesPaint(collections.namedtuple("SeriesPaint", ["series", "paint"])):
+    @property
+    def id(self):
+        return (self.series, self.paint.name)
+    def __getattr__(self, attr_name):
+        return getattr(self.paint, attr_name)
+    def __str__(self):
+        return self.name + " ({0}: {1})".format(*self.series.series_id)
+    def __len__(self):
+        return len(str(self))
+    def __repr__(self):
+        return "SeriesPaint(series={}, paint={})".format(self.series.series_id, repr(self.paint))
+
+class PaintSeries:
+    # No i18n for these strings
+    OWNER_LABEL = "Manufacturer"
+    NAME_LABEL = "Series"
+    class ParseError(Exception):
+        pass
+    def __init__(self, maker, name, paints=None):
+        self.series_id = SERIES_ID(maker=maker, name=name)
+        self.__paints = {}
+        if paints:
+            for paint in paints:
+                self.add_paint(paint)
+    def __lt__(self, other):
+        if self.series_id.maker < other.series_id.maker:
+            return True
+        elif self.series_id.maker > other.series_id.maker:
+            return False
+        return self.series_id.name < other.series_id.name
+    def add_paint(self, paint):
+        self.__paints[paint.name] = paint
+    def definition_text(self):
+        string = "{0}: {1}\n".format(self.OWNER_LABEL, self.series_id.maker)
+        string += "{0}: {1}\n".format(self.NAME_LABEL, self.series_id.name)
+        for paint in sorted(self.__paints.values(), key=lambda x: x.name):
+            string += "{0}\n".format(paint.paint_spec())
+        return string
+    def iter_names(self):
+        return self.__paints.keys()
+    def iter_paints(self):
+        return self.__paints.values()
+    def iter_series_paints(self):
+        return (SeriesPaint(self, value) for value in self.__paints.values())
+    def get_paint(self, name):
+        return self.__paints.get(name, None)
+    def get_series_paint(self, name):
+        paint = self.__paints.get(name, None)
+        return None if paint is None else SeriesPaint(self, paint)
+    @classmethod
+    def fm_definition(cls, definition_text):
+        lines = definition_text.splitlines()
+        if len(lines) < 2:
+            raise cls.ParseError(_("Too few lines: {0}.".format(len(lines))))
+        mfkr_name = None
+        series_name = None
+        for line in lines[:2]:
+            match = re.match("^Manufacturer:\s+(\S.*)\s*$", line)
+            if match:
+                mfkr_name = match.group(1)
+            else:
+                match = re.match("^Series:\s+(\S.*)\s*$", line)
+                if match:
+                    series_name = match.group(1)
+        if not mfkr_name:
+            if not series_name:
+                raise cls.ParseError(_("Neither manufacturer nor series name found."))
+            else:
+                raise cls.ParseError(_("Manufacturer not found."))
+        elif not series_name:
+            raise cls.ParseError(_("Series name not found."))
+        return cls(maker=mfkr_name, name=series_name, paints=cls.paints_fm_definition(lines[2:]))
+
+
+STANDARD_ID = collections.namedtuple("STANDARD_ID", ["sponsor", "name"])
+
+class PaintStandard:
+    # No i18n for these strings
+    OWNER_LABEL = "Sponsor"
+    NAME_LABEL = "Standard"
+    PAINT = None
+    class ParseError(Exception):
+        pass
+    def __init__(self, sponsor, name, paints=None):
+        self.standard_id = STANDARD_ID(sponsor=sponsor, name=name)
+        self.__paints = {}
+        if paints:
+            for paint in paints:
+                self.add_paint(paint)
+    def __lt__(self, other):
+        if self.standard_id.sponsor < other.standard_id.sponsor:
+            return True
+        elif self.standard_id.sponsor > other.standard_id.sponsor:
+            return False
+        return self.standard_id.name < other.standard_id.name
+    def add_paint(self, paint):
+        self.__paints[paint.name] = paint
+    def definition_text(self):
+        string = "{0}: {1}\n".format(self.OWNER_LABEL, self.standard_id.sponsor)
+        string += "{0}: {1}\n".format(self.NAME_LABEL, self.standard_id.name)
+        for paint in sorted(self.__paints.values(), key=lambda x: x.name):
+            string += "{0}\n".format(paint.paint_spec())
+        return string
+    def iter_names(self, ordered=True):
+        if ordered:
+            return (name for name in sorted(self.__paints.keys()))
+        else:
+            return self.__paints.keys()
+    def iter_paints(self, ordered=True):
+        if ordered:
+            return (self.__paints[name] for name in sorted(self.__paints.keys()))
+        else:
+            return self.__paints.values()
+    def iter_standard_paints(self, ordered=True):
+        return (StandardPaint(self, paint) for paint in self.iter_paints(ordered))
+    def get_paint(self, name):
+        return self.__paints.get(name, None)
+    def get_standard_paint(self, name):
+        paint = self.__paints.get(name, None)
+        return None if paint is None else StandardPaint(self, paint)
+    @classmethod
+    def fm_definition(cls, definition_text):
+        lines = definition_text.splitlines()
+        if len(lines) < 2:
+            raise cls.ParseError(_("Too few lines: {0}.".format(len(lines))))
+        sponsor_name = None
+        standard_name = None
+        for line in lines[:2]:
+            match = re.match("^Sponsor:\s+(\S.*)\s*$", line)
+            if match:
+                sponsor_name = match.group(1)
+            else:
+                match = re.match("^Standard:\s+(\S.*)\s*$", line)
+                if match:
+                    standard_name = match.group(1)
+        if not sponsor_name:
+            if not standard_name:
+                raise cls.ParseError(_("Neither sponsor nor standard name found."))
+            else:
+                raise cls.ParseError(_("Sponsor not found."))
+        elif not standard_name:
+            raise cls.ParseError(_("Standard name not found."))
+        return cls(sponsor=sponsor_name, name=standard_name, paints=cls.paints_fm_definition(lines[2:]))